@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Time each phase of an ingest over synthetic data at several scales."""
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import tempfile
+import textwrap
+import time
+from datetime import datetime
+from pathlib import Path
+
+import ingest
+from pylib import log
+from pylib import pipeline
+from pylib import timings
+
+from . import synthetic
+
+LOGGER = logging.getLogger(__name__)
+
+PHASES = ["scan", "match", "plan", "parse", "cast", "validate", "dedup", "write"]
+
+
+def bench(csv_dir, db_path):
+    """Run an ingest with the ingest command's code and time each of its phases.
+
+    The phases are timed by the ingest code itself, like for --profile.
+    """
+    timings.RECORDER.stats.clear()
+    args = ingest.parse_args(
+        ["ingest", "--db", str(db_path), "--csv-dir", str(csv_dir), "--no-cache"]
+    )
+
+    start = time.perf_counter()
+    pipeline.run(args)
+    total = time.perf_counter() - start
+
+    phases = timings.RECORDER.summary()["phases"]
+    seconds = {p: phases[p]["seconds"] if p in phases else 0.0 for p in PHASES}
+    seconds |= {p: s["seconds"] for p, s in phases.items()}
+    rows_in = phases["parse"]["rows_out"] if "parse" in phases else 0
+    return {
+        "phases": seconds,
+        "total": round(total, 4),
+        "rows_in": rows_in,
+        "rows_out": phases["write"]["rows_out"] if "write" in phases else 0,
+        "rows_per_sec": round(rows_in / total) if total else None,
+        "bytes_read": phases["scan"]["bytes_read"],
+    }
+
+
+def run(scales, repeat=1, seed=0, **generator_args):
+    results = []
+    for files, rows in scales:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_dir = Path(temp_dir) / "csv"
+            synthetic.generate(
+                csv_dir, files=files, rows=rows, seed=seed, **generator_args
+            )
+            for i in range(repeat):
+                LOGGER.info(f"Benchmarking {files} files x {rows} rows, run {i + 1}")
+                result = bench(csv_dir, Path(temp_dir) / f"bench_{i}.sqlite")
+                results.append({"files": files, "rows": rows, "run": i + 1} | result)
+    return results
+
+
+def git_commit():
+    try:
+        # The command is fixed, so it is marked noqa: S603
+        cmd = ["git", "rev-parse", "--short", "HEAD"]
+        return subprocess.check_output(cmd, text=True).strip()  # noqa: S603
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_scales(value):
+    """Convert '10x1000,50x5000' into [(10, 1000), (50, 5000)]."""
+    scales = []
+    for scale in value.split(","):
+        files, rows = scale.lower().split("x")
+        scales.append((int(files), int(rows)))
+    return scales
+
+
+def parse_args():
+    description = """Benchmark the ingest phases against synthetic field data.
+        Results are saved as JSON so they can be compared between commits."""
+
+    parser = argparse.ArgumentParser(
+        description=textwrap.dedent(description),
+        allow_abbrev=True,
+        fromfile_prefix_chars="@",
+    )
+
+    parser.add_argument(
+        "--output",
+        type=Path,
+        required=True,
+        metavar="PATH",
+        help="""Save the benchmark results to this JSON file.""",
+    )
+
+    parser.add_argument(
+        "--scales",
+        type=parse_scales,
+        default="5x1000,20x5000,50x20000",
+        metavar="FILESxROWS,...",
+        help="""Benchmark these numbers of files and rows per file.
+            (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        metavar="N",
+        help="""Run each scale this many times. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--alias-variety",
+        type=float,
+        default=0.5,
+        metavar="FRACTION",
+        help="""The chance a column uses one of its less common CSV names.
+            (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--optional-density",
+        type=float,
+        default=0.5,
+        metavar="FRACTION",
+        help="""The chance an optional column is in a CSV. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--junk-columns",
+        type=int,
+        default=5,
+        metavar="N",
+        help="""Add this many columns that no table uses. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="""Seed for the synthetic data. (default: %(default)s)""",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    log.started()
+
+    results = run(
+        args.scales,
+        repeat=args.repeat,
+        seed=args.seed,
+        alias_variety=args.alias_variety,
+        optional_density=args.optional_density,
+        junk_columns=args.junk_columns,
+    )
+
+    summary = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with args.output.open("w") as out_file:
+        json.dump(summary, out_file, indent=2)
+
+    log.finished()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Write directories of fake field data CSVs that look like what we ingest."""
+import argparse
+import csv
+import random
+import string
+import textwrap
+from pathlib import Path
+
+from pylib import log
+from pylib import tables
+
+SITES = ["Amacayacu", "Chingaza", "Iguaque", "Purace", "Tayrona", "Utria"]
+WORDS = ["alto", "bajo", "bosque", "borde", "claro", "quebrada", "rio", "vereda"]
+
+
+def generate(
+    out_dir,
+    files=10,
+    rows=1000,
+    alias_variety=0.5,
+    optional_density=0.5,
+    junk_columns=5,
+    duplicates=0.05,
+    seed=0,
+):
+    """Write synthetic CSVs built from the TABLES definitions.
+
+    alias_variety: The chance a column uses one of its other aliases.
+    optional_density: The chance an optional column is in a CSV.
+    junk_columns: The number of extra columns that match no table.
+    duplicates: The fraction of rows that repeat an earlier row.
+    """
+    # Seeded fake data so runs repeat, it is not for security, so noqa: S311
+    rand = random.Random(seed)  # noqa: S311
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fillable = [t for t in tables.TABLES if any(a for c in t.columns for a in c.csv)]
+
+    paths = []
+    for i in range(files):
+        db_tables = rand.sample(fillable, k=rand.randint(1, 3))
+        header, types = csv_header(db_tables, rand, alias_variety, optional_density)
+        junk = [f"junk_{j}" for j in range(junk_columns)]
+        header += junk
+        types += [(tables.Column(j, "text", []), False) for j in junk]
+
+        # Field sheets are not consistent about capitalization
+        header = [rand.choice([h, h.upper(), h.title()]) for h in header]
+
+        path = out_dir / f"field_sheet_{i:04d}.csv"
+        with path.open("w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(header)
+            data = []
+            for row in range(rows):
+                if data and rand.random() < duplicates:
+                    values = rand.choice(data)
+                else:
+                    values = [fake_value(t, k, i, row, rand) for t, k in types]
+                    data.append(values)
+                writer.writerow(values)
+        paths.append(path)
+
+    return paths
+
+
+def csv_header(db_tables, rand, alias_variety, optional_density):
+    header, types = [], []
+    for table in db_tables:
+        for col in table.columns:
+            aliases = [a for a in col.csv if a]
+            if not aliases:
+                continue
+            if None in col.csv and rand.random() >= optional_density:
+                continue
+            alias = aliases[0]
+            if len(aliases) > 1 and rand.random() < alias_variety:
+                alias = rand.choice(aliases[1:])
+            if alias not in header:
+                header.append(alias)
+                types.append((col, col.name in table.key))
+    return header, types
+
+
+def fake_value(col, is_key, file_no, row, rand):
+    """Make a value that passes the column's validation rules."""
+    if is_key:
+        return f"{file_no}-{row}"
+    if col.allowed:
+        return rand.choice(col.allowed)
+
+    low = -80.0 if col.low is None else col.low
+    high = 3000.0 if col.high is None else col.high
+
+    match col.type:
+        case "int":
+            return rand.randint(max(int(low), 1), min(int(high), 2023))
+        case "numeric" | "numerical":
+            return round(rand.uniform(low, high), 4)
+        case "date":
+            day, month = rand.randint(1, 28), rand.randint(1, 12)
+            return f"{day}/{month}/{rand.randint(2010, 2023)}"
+        case "time":
+            return f"{rand.randint(5, 18):02d}:{rand.randint(0, 59):02d}"
+        case "y/n":
+            return rand.choice("yn")
+        case "categorical":
+            return rand.choice(SITES)
+        case _:
+            return f"{rand.choice(WORDS)} {rand.choice(string.ascii_lowercase)}"
+
+
+def parse_args():
+    description = """Write synthetic ectoparasite field data CSVs for benchmarks."""
+
+    parser = argparse.ArgumentParser(
+        description=textwrap.dedent(description),
+        allow_abbrev=True,
+        fromfile_prefix_chars="@",
+    )
+
+    parser.add_argument(
+        "--csv-dir",
+        type=Path,
+        required=True,
+        metavar="DIR",
+        help="""Write the CSVs here.""",
+    )
+
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=10,
+        metavar="N",
+        help="""How many CSVs to write. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=1000,
+        metavar="N",
+        help="""How many rows in each CSV. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--alias-variety",
+        type=float,
+        default=0.5,
+        metavar="FRACTION",
+        help="""The chance a column uses one of its less common CSV names.
+            (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--optional-density",
+        type=float,
+        default=0.5,
+        metavar="FRACTION",
+        help="""The chance an optional column is in a CSV. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--junk-columns",
+        type=int,
+        default=5,
+        metavar="N",
+        help="""Add this many columns that no table uses. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="""Seed the random number generator. (default: %(default)s)""",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    log.started()
+    generate(
+        args.csv_dir,
+        files=args.files,
+        rows=args.rows,
+        alias_variety=args.alias_variety,
+        optional_density=args.optional_density,
+        junk_columns=args.junk_columns,
+        seed=args.seed,
+    )
+    log.finished()
+
+
+if __name__ == "__main__":
+    main()
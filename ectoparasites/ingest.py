@@ -1,120 +1,506 @@
 #!/usr/bin/env python3
+"""Ingest ectoparasite data and look at what will be or has been ingested.
 
+Each command imports only what it needs, so the commands that only look at the
+tables or CSV headers start quickly. Running the script with no command ingests.
+"""
 import argparse
+import csv
+import json
 import logging
-import sqlite3
+import sys
 import textwrap
 from pathlib import Path
-from typing import Literal
 
-import pandas as pd
-from pylib import log, tables
+from pylib import log
+from pylib.backends import BACKENDS
 
+LOGGER = logging.getLogger(__name__)
 
-def main():
-    log.started()
+COMMANDS = ["export", "ingest", "match", "merge", "plan", "query", "schema", "stats"]
 
-    args = parse_args()
 
-    csv_tables = get_csv_tables(args.csv_dir)
-
-    ingest_data(args.db, csv_tables, args.replace)
+def main():
+    args = parse_args()
+    args.command(args)
+
+
+def export_tables(args):
+    """Write the tables to Arrow files, skipping them if they are up to date."""
+    from pylib import backends
+    from pylib import catalog
+    from pylib import export
+    from pylib import queries
+
+    use_caches(args)
+    out_dir = args.dir or export.default_dir(args.backend, args.db)
+    schema = catalog.load()["schema"]
+
+    cxn = backends.connect(args.backend, args.db)
+    try:
+        if queries.VERSION not in backends.table_names(cxn, args.backend):
+            sys.exit(f"Nothing has been ingested into {args.db} yet")
+        version = queries.current_version(cxn)
+        changed = set(schema) if args.force else None
+        exported = export.sync(cxn, schema, out_dir, version, changed)
+    finally:
+        cxn.close()
+
+    if exported:
+        write(f"Exported {', '.join(exported)} to {out_dir}")
+    else:
+        write(f"{out_dir} is up to date")
 
-    log.finished()
 
+def ingest(args):
+    import cProfile
 
-def ingest_data(db_path, csv_tables, replace):
-    if_exists: Literal["replace", "append"] = "append"
-    if replace:
-        if_exists = "replace"
+    from pylib import pipeline
+    from pylib import shards
 
-    with sqlite3.connect(db_path) as cxn:
-        for table in tables.TABLES:
-            logging.info(f"Getting data for: {table.name}")
-            df = extract_csv_data(csv_tables, table)
-            if not df.empty:
-                df.to_sql(table.name, con=cxn, index=False, if_exists=if_exists)
+    if bool(args.db) == bool(args.shard_dir):
+        sys.exit("Ingest needs either --db or --shard-dir")
+    if args.shard_dir and (args.backend != "sqlite" or args.normalize):
+        sys.exit(
+            "Shards are flat SQLite databases, --shard-dir cannot be used with "
+            "--backend or --normalize"
+        )
 
+    log.started()
 
-def get_csv_tables(csv_dir):
-    csv_tables = {}
-    for path in sorted(csv_dir.glob("*.csv")):
-        df = pd.read_csv(path)
-        csv_tables[path.stem.lower()] = fix_column_names(df)
-    return csv_tables
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler:
+        profiler.enable()
 
+    failed = []
+    if args.shard_dir:
+        failed = shards.run(args)
+    else:
+        pipeline.run(args)
 
-def fix_column_names(df):
-    """Normalize column names to reduce the amount of CSV columns to search."""
-    renames = {c: c.lower() for c in df.columns}
-    df = df.rename(renames, axis="columns")
-    return df
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
 
+    if args.profile:
+        write_profile(args.profile)
 
-def extract_csv_data(csv_tables, db_table):
-    all_csv_data = []
+    log.finished()
 
-    # Look thru all CSV data frames
-    for csv_name, csv_table in csv_tables.items():
-        csv_column_set = set(csv_table.columns)
+    if failed:
+        sys.exit(f"These shards failed: {', '.join(failed)}")
 
-        best_missing = csv_column_set
 
-        # Examine every possible combination of column names for a match
-        for targets in db_table.csv_permutations():
-            target_set = set(targets)
+def use_caches(args):
+    """Save the table catalog and fuzzy matches in --cache-dir or next to the DB."""
+    from pylib import caches
 
-            missing = target_set - set(csv_table.columns)
-            if len(missing) < len(best_missing):
-                best_missing = missing
+    cache_dir = args.cache_dir
+    if cache_dir is None and getattr(args, "db", None):
+        cache_dir = caches.default_dir(args.backend, args.db)
+    caches.use(cache_dir)
 
-            # Did we find all table's required columns in the CSV?
-            if csv_column_set >= target_set:
 
-                db_table_data = csv_table.loc[:, targets]
+def write_profile(path):
+    from pylib import timings
 
-                # Rename CSV columns to what they'll be in the database table
-                renames = db_table.renames(targets)
-                db_table_data = db_table_data.rename(renames, axis="columns")
+    summary = timings.RECORDER.summary()
+    for name, stats in summary["phases"].items():
+        LOGGER.info(
+            f"{name:<8} {stats['seconds']:10.3f}s {stats['rows_out']:>10} rows "
+            f"{stats['rows_per_sec']:>9} rows/s"
+        )
+    LOGGER.info(f"Peak RSS {summary['peak_rss_mb']} MB")
+    with path.open("w") as out_file:
+        json.dump(summary, out_file, indent=2)
 
-                # Try to get the proper data type for each column
-                types = db_table.sqlite_types(targets)
-                db_table_data = db_table_data.astype(types, errors="ignore")
 
-                # Add any missing optional fields to the table
-                for col in db_table.missing_columns(targets):
-                    db_table_data[col] = None
+def merge(args):
+    """Merge shard databases into one database."""
+    from pylib import shards
 
-                all_csv_data.append(db_table_data)
-                logging.info(f"Hit  {db_table.name} & {csv_name}")
-                break  # Go look for data in the next CSV table
-        else:
-            logging.info(f"Miss {db_table.name} & {csv_name} Missing = {best_missing}")
+    log.started()
+    paths = shards.shard_paths(args.shards)
+    if missing := [str(p) for p in paths if not p.is_file()]:
+        sys.exit(f"These shards do not exist: {', '.join(missing)}")
+    try:
+        shards.merge(args.db, paths, args.on_conflict, indexes=not args.no_indexes)
+    except ValueError as err:
+        sys.exit(str(err))
+    log.finished()
 
-    if all_csv_data:
-        table_df = pd.concat(all_csv_data)
-        table_df = table_df.drop_duplicates()
-    else:
-        table_df = pd.DataFrame()
 
-    return table_df
+def match(args):
+    """Show the tables each CSV and sheet would fill, without reading their data."""
+    from pylib import catalog
+    from pylib import sheets
 
+    use_caches(args)
+    index = catalog.index(catalog.load())
 
-def parse_args():
-    description = """Ingest ectoparasite data."""
+    found = {}
+    for path in sheets.csv_paths(args.csv_dir):
+        if sheets.is_workbook(path):
+            headers = [(s.name, s.header) for s in sheets.read(path, index)]
+        else:
+            headers = [(path.stem.lower(), sheets.csv_header(path))]
+        for name, header in headers:
+            hits = index.match(index.resolve(header).keys())
+            found[name] = [{"table": t, "columns": m} for t, m in hits]
+
+    if args.json:
+        write(json.dumps(found, indent=2))
+        return
+
+    width = max((len(n) for n in found), default=0)
+    for name, hits in found.items():
+        tables = ", ".join(h["table"] for h in hits) or "no tables"
+        write(f"{name:<{width}}  {tables}")
+
+
+def plan(args):
+    """Show the tables each CSV and sheet would fill and about how many rows."""
+    from pylib import catalog
+    from pylib import plan as planner
+
+    use_caches(args)
+    found = planner.plan(args.csv_dir, catalog.index(catalog.load()))
+
+    if args.json:
+        write(json.dumps(found, indent=2))
+        return
+
+    width = max(len(t) for t in found["tables"])
+    write(f"{'table':<{width}} {'sources':>8} {'rows':>12}")
+    for name, total in found["tables"].items():
+        write(f"{name:<{width}} {total['sources']:>8} {total['rows']:>12,}")
+
+    if any(s["estimated"] for s in found["sources"]):
+        write("CSV row counts are estimated from their sizes")
+
+    near = [p for p in found["pairs"] if 0 < len(p["missing"]) <= args.near]
+    if near:
+        write(f"\nTables missing at most {args.near} required columns from a source:")
+        for pair in near:
+            missing = ", ".join(pair["missing"])
+            write(f"    {pair['table']} & {pair['source']}: missing {missing}")
+
+    filled = {p["source"] for p in found["pairs"] if not p["missing"]}
+    if unused := [s["name"] for s in found["sources"] if s["name"] not in filled]:
+        write(f"\nSources that fill no tables: {', '.join(unused)}")
+
+
+def query(args):
+    """Run a named analysis query, or list them."""
+    from pylib import queries
+
+    if not args.name:
+        width = max(len(n) for n in queries.QUERIES)
+        for name, named in queries.QUERIES.items():
+            filters = ", ".join(named.filters)
+            write(f"{name:<{width}}  {named.description} (filters: {filters})")
+        return
+
+    if not args.db:
+        sys.exit("Running a query needs --db")
+
+    filters = dict(f.split("=", 1) for f in args.where)
+    with queries.Analyses(args.db, args.backend) as analyses:
+        try:
+            rows = analyses.run(args.name, **filters)
+        except ValueError as err:
+            sys.exit(str(err))
+
+    if args.json:
+        write(json.dumps(rows, indent=2))
+        return
+
+    writer = csv.writer(sys.stdout, lineterminator="\n")
+    writer.writerow(rows[0].keys() if rows else [])
+    writer.writerows(r.values() for r in rows)
+
+
+def schema(args):
+    """Show each table's columns, natural key, indexes, and lookup tables."""
+    from pylib import catalog
+
+    use_caches(args)
+    metadata = catalog.load()
+    names = args.tables or list(metadata["schema"])
+    unknown = [n for n in names if n not in metadata["schema"]]
+    if unknown:
+        sys.exit(f"Unknown tables: {', '.join(unknown)}")
+
+    tables = {
+        name: {
+            "columns": metadata["schema"][name],
+            "key": metadata["keys"].get(name, []),
+            "indexes": metadata["indexes"].get(name, []),
+            "dimensions": metadata["dimensions"].get(name, {}),
+        }
+        for name in names
+    }
+
+    if args.json:
+        write(json.dumps(tables, indent=2))
+        return
+
+    for name, table in tables.items():
+        write(name)
+        for column, type_ in table["columns"].items():
+            notes = []
+            if column in table["key"]:
+                notes.append("key")
+            if dim := table["dimensions"].get(column):
+                notes.append(f"dimension={dim}")
+            write(f"    {column:<24} {type_:<12} {' '.join(notes)}".rstrip())
+        for columns in table["indexes"]:
+            write(f"    index ({', '.join(columns)})")
+
+
+def stats(args):
+    """Show each table's rows, rejected rows, and cells set to missing."""
+    from pylib import catalog
+    from pylib import stats as db_stats
+
+    use_caches(args)
+    names = list(catalog.load()["schema"])
+    summary = db_stats.summary(args.backend, args.db, names)
+
+    if args.json:
+        write(json.dumps(summary, indent=2))
+        return
+
+    width = max((len(n) for n in summary["tables"]), default=5)
+    write(f"{'table':<{width}} {'rows':>10} {'rejects':>10} {'missing':>10}")
+    for name, rows in summary["tables"].items():
+        rejects = summary["rejects"].get(name, 0)
+        missing = summary["missing"].get(name, 0)
+        write(f"{name:<{width}} {rows:>10} {rejects:>10} {missing:>10}")
+    write(f"{summary['files']} files ingested")
+
+
+def write(line):
+    sys.stdout.write(f"{line}\n")
+
+
+def parse_args(argv=None):
+    description = """Ingest ectoparasite data. Use a command to look at the tables
+        and CSVs without ingesting anything. Leaving out the command runs ingest."""
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] not in COMMANDS and argv[0] not in ("-h", "--help"):
+        argv = ["ingest", *argv]
 
     parser = argparse.ArgumentParser(
         description=textwrap.dedent(description),
         allow_abbrev=True,
         fromfile_prefix_chars="@",
     )
+    commands = parser.add_subparsers(required=True, metavar="COMMAND")
 
-    parser.add_argument(
+    export_parser = commands.add_parser(
+        "export",
+        help="""Write each table to an Arrow IPC (Feather) file with a manifest.
+            Only tables that changed since the last export are written.""",
+    )
+    export_parser.set_defaults(command=export_tables)
+    db_args(export_parser)
+    cache_arg(export_parser)
+    export_parser.add_argument(
+        "--dir",
+        type=Path,
+        metavar="DIR",
+        help="""Write the files here. (default: NAME_arrow next to the database)""",
+    )
+    export_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="""Write every table even if its file is up to date.""",
+    )
+
+    ingest_parser = commands.add_parser(
+        "ingest",
+        help="""Load the CSVs and workbooks in a directory.""",
+    )
+    ingest_args(ingest_parser)
+
+    match_parser = commands.add_parser(
+        "match",
+        help="""Show the tables each CSV and sheet would fill.""",
+    )
+    match_parser.set_defaults(command=match)
+    match_parser.add_argument(
+        "--csv-dir",
+        type=Path,
+        required=True,
+        metavar="DIR",
+        help="""Check the CSVs and ODS or XLSX workbooks here.""",
+    )
+    cache_arg(match_parser)
+    json_arg(match_parser)
+
+    merge_parser = commands.add_parser(
+        "merge",
+        help="""Merge SQLite shards made with ingest --shard-dir into one SQLite
+            database. Merging a shard again only copies the files that changed.""",
+    )
+    merge_parser.set_defaults(command=merge)
+    merge_parser.add_argument(
+        "shards",
+        nargs="+",
+        type=Path,
+        metavar="SHARD",
+        help="""Shard databases, or directories of them.""",
+    )
+    merge_parser.add_argument(
         "--db",
+        required=True,
+        metavar="PATH",
+        help="""Merge into this SQLite database. It is made if it does not exist.""",
+    )
+    merge_parser.add_argument(
+        "--on-conflict",
+        choices=["ignore", "update"],
+        default="ignore",
+        help="""What to do when a shard row has the same natural key as a row
+            already merged: keep the existing row or update it with the new values.
+            (default: %(default)s)""",
+    )
+    merge_parser.add_argument(
+        "--no-indexes",
+        action="store_true",
+        help="""Do not index the columns used to join tables after merging.""",
+    )
+
+    plan_parser = commands.add_parser(
+        "plan",
+        help="""Show every table each CSV and sheet would fill, the columns
+            missing from near misses, and estimated row counts.""",
+    )
+    plan_parser.set_defaults(command=plan)
+    plan_parser.add_argument(
+        "--csv-dir",
         type=Path,
         required=True,
+        metavar="DIR",
+        help="""Check the CSVs and ODS or XLSX workbooks here.""",
+    )
+    plan_parser.add_argument(
+        "--near",
+        type=int,
+        default=2,
+        metavar="N",
+        help="""List the tables a CSV only misses by this many required columns or
+            fewer. JSON output lists every table that shares a column with a CSV.
+            (default: %(default)s)""",
+    )
+    cache_arg(plan_parser)
+    json_arg(plan_parser)
+
+    query_parser = commands.add_parser(
+        "query",
+        help="""Run a named analysis query on the summary tables built by ingest.
+            Leave out the name to list the queries.""",
+    )
+    query_parser.set_defaults(command=query)
+    query_parser.add_argument("name", nargs="?", metavar="NAME")
+    query_parser.add_argument(
+        "--where",
+        action="append",
+        default=[],
+        type=filter_arg,
+        metavar="COLUMN=VALUE",
+        help="""Only use the rows where the column has this value. Use it once for
+            each column.""",
+    )
+    db_args(query_parser, required=False)
+    json_arg(query_parser)
+
+    schema_parser = commands.add_parser(
+        "schema",
+        help="""Show the database tables and their columns.""",
+    )
+    schema_parser.set_defaults(command=schema)
+    schema_parser.add_argument(
+        "tables",
+        nargs="*",
+        metavar="TABLE",
+        help="""Only show these tables.""",
+    )
+    cache_arg(schema_parser)
+    json_arg(schema_parser)
+
+    stats_parser = commands.add_parser(
+        "stats",
+        help="""Count the rows loaded into each table.""",
+    )
+    stats_parser.set_defaults(command=stats)
+    db_args(stats_parser)
+    cache_arg(stats_parser)
+    json_arg(stats_parser)
+
+    return parser.parse_args(argv)
+
+
+def json_arg(parser):
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="""Write JSON instead of text.""",
+    )
+
+
+def cache_arg(parser):
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        metavar="DIR",
+        help="""Keep the table catalog and fuzzy column name matches here so later
+            commands start quicker. (default: .ingest_cache next to the database.
+            Without one the fuzzy matches are not kept and the table catalog is
+            kept in $XDG_CACHE_HOME/ectoparasites or ~/.cache/ectoparasites)""",
+    )
+
+
+def filter_arg(value):
+    if "=" not in value:
+        raise argparse.ArgumentTypeError(f"{value} is not COLUMN=VALUE")
+    return value
+
+
+def db_args(parser, required=True):
+    parser.add_argument(
+        "--db",
+        required=required,
         metavar="PATH",
-        help="""Use this ectoparasite DB.""",
+        help="""Use this ectoparasite DB. For PostgreSQL this is a connection string
+            like postgresql://user@localhost/ectoparasites.""",
+    )
+
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="sqlite",
+        help="""The kind of database. DuckDB and PostgreSQL need the duckdb and
+            psycopg packages. (default: %(default)s)""",
+    )
+
+
+def ingest_args(parser):
+    parser.set_defaults(command=ingest)
+
+    db_args(parser, required=False)
+
+    parser.add_argument(
+        "--shard-dir",
+        type=Path,
+        metavar="DIR",
+        help="""Instead of one --db, ingest the CSVs in each directory in --csv-dir
+            into its own SQLite shard here, --workers shards at a time. CSVs at the
+            top of --csv-dir go into a shard named after it, with _top added if a
+            directory in it has the same name. Use the merge command to combine
+            the shards.""",
     )
 
     parser.add_argument(
@@ -122,16 +508,123 @@ def parse_args():
         type=Path,
         required=True,
         metavar="DIR",
-        help="""Input CSVs are here.""",
+        help="""Input CSVs and ODS or XLSX workbooks are here. Each sheet in a
+            workbook is read like a separate CSV.""",
     )
 
     parser.add_argument(
         "--replace",
         action="store_true",
-        help="""Are we appending data to the tables or overwriting the tables.""",
+        help="""Are we appending data to the tables or overwriting the tables.
+            When appending, CSVs that have not changed since they were last ingested
+            are skipped and rows from CSVs that have changed are replaced.""",
+    )
+
+    parser.add_argument(
+        "--on-conflict",
+        choices=["ignore", "update"],
+        default="ignore",
+        help="""What to do when a row has the same natural key as a row already in
+            its table: keep the existing row or update it with the new values.
+            (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--normalize",
+        action="store_true",
+        help="""Store repeated values like sites, species, and people once in
+            lookup tables and only their IDs in the data tables. Views with the
+            table names show the data as usual. Use --replace to switch an existing
+            database to or from this layout.""",
+    )
+
+    parser.add_argument(
+        "--no-indexes",
+        action="store_true",
+        help="""Do not index the columns used to join tables after loading them.""",
+    )
+
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        metavar="ROWS",
+        help="""Stream each CSV into the database this many rows at a time instead
+            of reading every CSV into memory first. Reading, casting, and writing
+            chunks overlap. A hash of each row missing part of its natural key, or in
+            a table without one, is kept in memory to drop repeats of it.""",
     )
 
-    return parser.parse_args()
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=4,
+        metavar="CHUNKS",
+        help="""When streaming, how many chunks reading may get ahead of casting and
+            casting may get ahead of writing. More hides slower reads but holds
+            more chunks in memory. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="""Parse CSVs and build tables in a pool of this many processes. All
+            database writes still happen in this process. With --shard-dir this is
+            how many shards are built at once. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        metavar="DIR",
+        help="""Keep parsed CSVs here so later runs do not have to parse them again.
+            The table catalog, fuzzy column name matches, and dtype plans are kept
+            here too. (default: .ingest_cache next to the database)""",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=2048,
+        metavar="MB",
+        help="""Remove the least recently used parsed CSVs when the cache is bigger
+            than this. (default: %(default)s)""",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="""Always parse the CSVs and do not use the parsed CSV cache. The cache
+            is never used with --chunksize.""",
+    )
+
+    parser.add_argument(
+        "--export",
+        nargs="?",
+        const=True,
+        type=Path,
+        metavar="DIR",
+        help="""After ingesting, write each table this ingest changed, and any not
+            exported yet, to an Arrow IPC (Feather) file in this directory.
+            (default: NAME_arrow next to the database)""",
+    )
+
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        metavar="PATH",
+        help="""Save the time, rows, and bytes of each ingest phase, and how much
+            it raised the peak memory, for every table and CSV, to this JSON
+            file. The peak memory of the whole ingest is saved too.""",
+    )
+
+    parser.add_argument(
+        "--cprofile",
+        type=Path,
+        metavar="PATH",
+        help="""Save cProfile stats for this process to this file.""",
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+"""An inverted index from CSV column aliases to the tables that use them."""
+from collections import defaultdict
+from functools import cache
+
+from . import caches
+from . import headers
+
+
+class AliasIndex:
+    def __init__(self, db_tables, compiled=None):
+        """Index the tables, or use an index already compiled from them.
+
+        The tables are what match returns for each hit, so they can be Table
+        objects or just the table names when using a cached compiled index.
+        """
+        self.tables = db_tables
+        compiled = compiled or compile_index(db_tables)
+
+        # alias -> [(table index, column index, alias rank in column.csv)]
+        self.aliases = compiled["aliases"]
+        self.required = [set(r) for r in compiled["required"]]
+        self.columns = compiled["columns"]  # Column names for each table
+        self.first = compiled["first"]  # Each column's first CSV alias
+        self.resolver = None  # Built when needed, it loads the saved fuzzy matches
+
+    def resolve(self, header, fuzzy=True):
+        """Map a CSV header's aliases to its columns: {alias: CSV column}.
+
+        Columns that are not for any alias are under their normalized name. When
+        several columns are for one alias the first one is used. Columns that
+        name an alias are resolved first, so only the other columns are fuzzy
+        matched and only to the aliases left. Fuzzy matching can be turned off for
+        rows that may not be a header.
+        """
+        path = caches.path(headers.CACHE)
+        if self.resolver is None or self.resolver.path != path:
+            self.resolver = headers.Resolver(self.aliases, path)
+        columns, unmatched = {}, []
+        for column in header:
+            if not column:
+                continue
+            if (name := self.resolver.resolve(column, fuzzy=False)) in self.aliases:
+                columns.setdefault(name, column)
+            else:
+                unmatched.append(column)
+        for column in unmatched:
+            name = self.resolver.resolve(column, fuzzy, taken=columns.keys())
+            columns.setdefault(name, column)
+        self.resolver.save()
+        return columns
+
+    def count(self, csv_columns):
+        """Count how many of the columns are aliases for some database column."""
+        return sum(1 for c in csv_columns if c in self.aliases)
+
+    def match(self, csv_columns):
+        """Find every table a CSV header satisfies in one pass over the header.
+
+        Returns a list of (table, mapping) pairs in table order. The mapping is the
+        same one Table.match would return: database column -> CSV column. Tables
+        that would take no columns from the CSV are left out.
+        """
+        return [(t, m) for t, m, missing in self.coverage(csv_columns) if not missing]
+
+    def coverage(self, csv_columns):
+        """Get (table, mapping, missing) for every table that takes a CSV column.
+
+        Missing is the first CSV alias of each required column the CSV does not
+        have, like Table.missing. The table is only filled when none are missing.
+        """
+        # (table index, column index) -> (alias rank, alias)
+        best = {}
+        for alias in csv_columns:
+            for t, c, rank in self.aliases.get(alias, ()):
+                if (t, c) not in best or rank < best[(t, c)][0]:
+                    best[(t, c)] = (rank, alias)
+
+        hits = defaultdict(dict)
+        for (t, c), (_, alias) in best.items():
+            hits[t][c] = alias
+
+        tables = []
+        for t in sorted(hits):
+            found = hits[t]
+            missing = {self.first[t][c] for c in self.required[t] - found.keys()}
+            mapping = {}
+            for c, name in enumerate(self.columns[t]):
+                if c in found:
+                    mapping.setdefault(name, found[c])
+            tables.append((self.tables[t], mapping, sorted(missing)))
+
+        return tables
+
+
+def compile_index(db_tables):
+    """Build the index data for the tables as plain lists and dicts."""
+    aliases = defaultdict(list)
+    required, columns, first = [], [], []
+    for t, table in enumerate(db_tables):
+        columns.append([col.name for col in table.columns])
+        first.append([col.csv[0] for col in table.columns])
+        required.append([])
+        for c, col in enumerate(table.columns):
+            if None not in col.csv:
+                required[-1].append(c)
+            for rank, alias in enumerate(col.csv):
+                if alias:
+                    aliases[headers.normalize(alias)].append((t, c, rank))
+    return {
+        "aliases": dict(aliases),
+        "required": required,
+        "columns": columns,
+        "first": first,
+    }
+
+
+@cache
+def index():
+    """Get the index of TABLES, it is built the first time it is needed."""
+    from . import tables
+
+    return AliasIndex(tables.TABLES)
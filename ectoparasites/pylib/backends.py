@@ -0,0 +1,60 @@
+"""The databases we can load, and read-only connections to them.
+
+The database drivers are only imported when used, DuckDB and PostgreSQL's are
+optional.
+"""
+from pathlib import Path
+
+BACKENDS = ["sqlite", "duckdb", "postgres"]
+
+
+def connect(backend, db):
+    """Open a database for reading. The db is a file path or a connection string."""
+    match backend:
+        case "duckdb":
+            import duckdb
+
+            return duckdb.connect(db, read_only=True)
+        case "postgres":
+            import psycopg
+
+            return PostgresConnection(psycopg.connect(db, autocommit=True))
+        case _:
+            import sqlite3
+
+            uri = f"{Path(db).resolve().as_uri()}?mode=ro"
+            return sqlite3.connect(uri, uri=True)
+
+
+def table_names(cxn, backend):
+    """Get the tables and views in a database."""
+    if backend == "sqlite":
+        sql = "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"
+    else:
+        sql = (
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_schema = current_schema()"
+        )
+    return {row[0] for row in cxn.execute(sql).fetchall()}
+
+
+class PostgresConnection:
+    """Let the SQL shared with the other databases use ? parameters."""
+
+    def __init__(self, cxn):
+        self.cxn = cxn
+
+    def execute(self, sql, params=None):
+        return self.cxn.execute(sql.replace("?", "%s"), params)
+
+    def executemany(self, sql, rows):
+        with self.cxn.cursor() as cursor:
+            cursor.executemany(sql.replace("?", "%s"), rows)
+
+    def copy(self, sql, rows):
+        with self.cxn.cursor() as cursor, cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+
+    def close(self):
+        self.cxn.close()
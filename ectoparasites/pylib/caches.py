@@ -0,0 +1,34 @@
+"""Where the table catalog, fuzzy column matches, and dtype plans are saved.
+
+They are saved in the cache directory an ingest keeps its parsed CSVs in,
+.ingest_cache next to the database or --cache-dir. Commands without either keep
+them in memory, except for the table catalog which only depends on the code and
+is kept in the user's cache directory.
+"""
+import os
+from pathlib import Path
+
+DIR = None  # Set with use(), None keeps the caches in memory
+
+
+def use(cache_dir):
+    """Save the caches in this directory from now on, or None to not save them."""
+    global DIR
+    DIR = Path(cache_dir) if cache_dir else None
+
+
+def path(name):
+    """Get the path of a cache file, or None if the caches are not saved."""
+    return DIR / name if DIR else None
+
+
+def default_dir(backend, db):
+    """Put the caches next to a database file, a server DB uses the current dir."""
+    db_dir = Path.cwd() if backend == "postgres" else Path(db).parent
+    return db_dir / ".ingest_cache"
+
+
+def user_dir():
+    """Get the per-user cache directory, $XDG_CACHE_HOME or ~/.cache."""
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "ectoparasites"
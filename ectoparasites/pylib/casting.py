@@ -0,0 +1,180 @@
+"""Cast data frames to compact, nullable dtypes one column at a time.
+
+A bad cell becomes a missing value and is returned with the others from its
+column, it does not stop the rest of the column, or the rest of the frame, from
+being cast.
+"""
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from . import manifest
+from . import tables
+
+LOGGER = logging.getLogger(__name__)
+
+INT32 = np.iinfo(np.int32)
+
+EXAMPLES = 3  # How many bad values to show when reporting a column
+
+# What a value has to be to be cast to a dtype
+EXPECTED = {"Int32": "a whole number", "Float32": "a number", "boolean": "y/n"}
+
+# Columns with more distinct values than this fraction of their rows, like IDs,
+# take less space as strings than as categoricals
+MAX_CATEGORIES = 0.5
+SAMPLE = 1000  # Check this many rows before trying to make a categorical
+
+
+@dataclass
+class Coercion:
+    """Cells in a column that could not be cast and were set to missing."""
+
+    column: str
+    dtype: str
+    cells: pd.Series  # The cells that could not be cast, by row
+
+    def reason(self):
+        return f"not {EXPECTED.get(self.dtype, self.dtype)}, {manifest.COERCED}"
+
+
+def dtypes(types):
+    """Convert {column: Column.type} into {column: pandas dtype}."""
+    return {
+        c: tables.SQLITE_TYPE[t] for c, t in types.items() if t in tables.SQLITE_TYPE
+    }
+
+
+def cast(df, types, where=""):
+    """Cast a data frame to the given columns, coercing bad cells to missing values.
+
+    types: {column: Column.type} for the columns to return. Columns that are not
+        in the data frame are added with only missing values.
+    where: Used to say where any bad values came from.
+
+    Returns the cast data frame and a Coercion for each column with bad cells.
+    """
+    pandas_types = dtypes(types)
+    columns, coercions = {}, []
+    for column in types:
+        dtype = pandas_types.get(column, "string")
+        if column not in df.columns:
+            columns[column] = pd.Series(pd.NA, index=df.index, dtype=dtype)
+            continue
+        columns[column], bad = cast_column(df[column], dtype)
+        if bad.any():
+            coercions.append(Coercion(column, dtype, df[column][bad]))
+
+    for coercion in coercions:
+        examples = coercion.cells.drop_duplicates().head(EXAMPLES).tolist()
+        LOGGER.warning(
+            f"{where}: {len(coercion.cells)} values in {coercion.column} are not "
+            f"{coercion.dtype} and were set to missing, e.g. {examples}"
+        )
+
+    return pd.DataFrame(columns, index=df.index), coercions
+
+
+def cast_column(series, dtype):
+    """Cast a series and get a mask of the cells that could not be cast."""
+    if series.dtype == dtype:
+        return series, no_failures(series)
+
+    match dtype:
+        case "Int32":
+            return to_int32(series)
+        case "Float32":
+            return to_float32(series)
+        case "boolean":
+            return to_boolean(series)
+        case "category":
+            return to_category(series), no_failures(series)
+        case _:
+            return series.astype(dtype), no_failures(series)
+
+
+def no_failures(series):
+    return pd.Series(False, index=series.index)
+
+
+def to_number(series):
+    # A straight cast is much faster than to_numeric when all values are good
+    try:
+        return series.astype("Float64"), no_failures(series)
+    except (TypeError, ValueError):
+        numbers = pd.to_numeric(series, errors="coerce")
+        return numbers, numbers.isna() & series.notna()
+
+
+def to_int32(series):
+    numbers, bad = to_number(series)
+    fraction = numbers.notna() & (numbers % 1 != 0)
+    too_big = (numbers < INT32.min) | (numbers > INT32.max)
+    bad |= fraction | too_big
+    return numbers.mask(fraction | too_big).astype("Int32"), bad
+
+
+def to_float32(series):
+    numbers, bad = to_number(series)
+    return numbers.astype("Float32"), bad
+
+
+def to_boolean(series):
+    """Convert y/n style values to booleans without looping over the cells."""
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype("boolean"), no_failures(series)
+
+    values = series.astype("string").str.strip().str.lower()
+    yes, no = values.isin(tables.YES), values.isin(tables.NO)
+
+    values = pd.arrays.BooleanArray(yes.to_numpy(), ~(yes | no).to_numpy())
+    return pd.Series(values, index=series.index), series.notna() & ~yes & ~no
+
+
+def to_category(series):
+    """Use a categorical unless there are too many distinct values."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    sample = series.iloc[:SAMPLE]
+    if sample.nunique() > len(sample) * MAX_CATEGORIES:
+        return series.astype("string")
+    category = series.astype("category")
+    if len(category.cat.categories) > len(series) * MAX_CATEGORIES:
+        return series.astype("string")
+    return category
+
+
+def concat(frames):
+    """Concatenate data frames without losing their categorical columns.
+
+    Pandas turns categoricals with different categories into objects. They are
+    given the union of the categories, or made strings if some frames have
+    strings in that column.
+    """
+    frames = list(frames)
+    categories = {}
+    for column in frames[0].columns:
+        series = [f[column] for f in frames]
+        is_category = [isinstance(s.dtype, pd.CategoricalDtype) for s in series]
+        if not any(is_category):
+            continue
+
+        if all(is_category):
+            # Concatenating the codes skips pandas comparing the categories
+            union = series[0].cat.categories
+            for s in series[1:]:
+                if not s.cat.categories.equals(union):
+                    union = union.union(s.cat.categories)
+            categories[column] = union
+            series = [s.cat.set_categories(union).cat.codes for s in series]
+        else:
+            series = [s.astype("string") for s in series]
+
+        frames = [f.assign(**{column: s}) for f, s in zip(frames, series)]
+
+    df = pd.concat(frames)
+    for column, union in categories.items():
+        df[column] = pd.Categorical.from_codes(df[column], union)
+    return df
@@ -0,0 +1,90 @@
+"""Table metadata compiled from TABLES and cached so commands start quickly.
+
+Building TABLES creates hundreds of objects. Commands that only need the table
+names, column types, keys, and the CSV alias index read them from a JSON file in
+the cache directory, or the user's cache directory without one, instead. The
+file is rebuilt whenever the modules it is compiled with change.
+"""
+import hashlib
+import json
+import os
+from contextlib import suppress
+from pathlib import Path
+
+from . import caches
+from .alias_index import AliasIndex
+from .alias_index import compile_index
+
+# Change this when the format of the cached data changes
+VERSION = 4
+
+# The catalog is compiled from the tables and the normalized aliases
+SOURCES = [
+    Path(__file__).with_name(n) for n in ("tables.py", "alias_index.py", "headers.py")
+]
+CACHE = "tables.catalog.json"  # In the cache directory
+
+
+def load():
+    """Get the compiled metadata, rebuilding it if its sources have changed."""
+    path = caches.path(CACHE) or user_path()
+    stamp = source_stamp()
+    if catalog := read(path, stamp):
+        return catalog
+
+    catalog = build() | {"stamp": stamp}
+    save(catalog, path)
+    return catalog
+
+
+def user_path():
+    """Get the catalog in the user's cache directory, each checkout has its own."""
+    checkout = hashlib.sha256(str(SOURCES[0].parent).encode()).hexdigest()[:16]
+    return caches.user_dir() / f"tables.catalog.{checkout}.json"
+
+
+def read(path, stamp):
+    """Get the saved catalog, or None if there is none for this stamp."""
+    try:
+        catalog = json.loads(path.read_text())
+        if catalog["stamp"] == stamp:
+            return catalog
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def build():
+    from . import tables
+
+    return {
+        "tables": [t.name for t in tables.TABLES],
+        "index": compile_index(tables.TABLES),
+        "schema": tables.schema(),
+        "keys": tables.natural_keys(),
+        "indexes": tables.indexes(),
+        "dimensions": tables.dimensions(),
+    }
+
+
+def save(catalog, path):
+    """Write the cache. A directory we cannot write to just goes without it."""
+    temp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp.write_text(json.dumps(catalog))
+        temp.replace(path)
+    except OSError:
+        with suppress(OSError):  # The directory may not be there
+            temp.unlink()
+
+
+def source_stamp():
+    """Python also uses the size and modification time to check its .pyc files."""
+    stats = [s.stat() for s in SOURCES]
+    return [VERSION, *([s.st_mtime_ns, s.st_size] for s in stats)]
+
+
+def index(catalog):
+    """Get an alias index that gives the table names of its hits."""
+    return AliasIndex(catalog["tables"], catalog["index"])
@@ -0,0 +1,109 @@
+"""Store repeated values once in lookup tables and only their IDs in fact tables.
+
+Each normalized table's data goes into a fact table and a view with the table's
+name puts the values back, so queries written for the flat layout still work.
+"""
+import numpy as np
+import pandas as pd
+
+FACT_SUFFIX = "_data"
+DIM_PREFIX = "dim_"
+ID_SUFFIX = "_dim_id"  # Plain "_id" clashes with existing columns like site_id
+
+
+class Dimensions:
+    """Lookup tables with an in-memory cache of their values and IDs."""
+
+    def __init__(self, cxn):
+        self.cxn = cxn
+        self.cache = {}  # dimension -> {value: id}
+
+    def create(self, dim):
+        self.cxn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {dim_name(dim)} (
+                id INTEGER PRIMARY KEY,
+                value TEXT UNIQUE
+            )"""
+        )
+
+    def drop(self, dim):
+        self.cxn.execute(f"DROP TABLE IF EXISTS {dim_name(dim)}")
+        self.cache.pop(dim, None)
+
+    def lookup(self, dim):
+        if dim not in self.cache:
+            sql = f"SELECT value, id FROM {dim_name(dim)}"  # noqa: S608
+            self.cache[dim] = dict(self.cxn.execute(sql).fetchall())
+        return self.cache[dim]
+
+    def encode(self, df, dims):
+        """Replace values with their IDs, adding new values to the lookup tables.
+
+        dims: {column: dimension} for the columns to replace.
+        """
+        ids = {id_column(c): self.ids(d, df[c]) for c, d in dims.items() if c in df}
+        columns = [id_column(c) if c in dims else c for c in df.columns]
+        return df.assign(**ids)[columns]
+
+    def ids(self, dim, series):
+        """Get the ID of every value, only looking up each distinct value once."""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, values = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, values = pd.factorize(series)
+
+        values = [str(v) for v in values]
+        lookup = self.lookup(dim)
+        if new := [v for v in dict.fromkeys(values) if v not in lookup]:
+            next_id = max(lookup.values(), default=0) + 1
+            added = {v: i for i, v in enumerate(new, next_id)}
+            sql = f"INSERT INTO {dim_name(dim)} (id, value) VALUES (?, ?)"  # noqa: S608
+            self.cxn.execute("BEGIN")
+            self.cxn.executemany(sql, ((i, v) for v, i in added.items()))
+            self.cxn.execute("COMMIT")
+            lookup |= added
+
+        # Missing values have a code of -1 which picks the last entry
+        value_ids = np.array([lookup[v] for v in values] + [0], dtype=np.int64)
+        return pd.Series(
+            pd.arrays.IntegerArray(value_ids[codes], codes == -1), index=series.index
+        )
+
+
+def fact_name(name):
+    return f"{name}{FACT_SUFFIX}"
+
+
+def dim_name(dim):
+    return f"{DIM_PREFIX}{dim}"
+
+
+def id_column(column):
+    return f"{column}{ID_SUFFIX}"
+
+
+def fact_columns(columns, dims):
+    """Get the fact table columns for a table's {column: type} dict."""
+    return {
+        id_column(c) if c in dims else c: "int" if c in dims else t
+        for c, t in columns.items()
+    }
+
+
+def view_sql(name, columns, dims):
+    """Build a view that shows a fact table with its values and not their IDs."""
+    selects, joins = [], []
+    for i, column in enumerate(columns):
+        if dim := dims.get(column):
+            alias = f"d{i}"
+            selects.append(f'{alias}.value AS "{column}"')
+            joins.append(
+                f"LEFT JOIN {dim_name(dim)} AS {alias} "
+                f'ON {alias}.id = f."{id_column(column)}"'
+            )
+        else:
+            selects.append(f'f."{column}"')
+    return (
+        f"CREATE VIEW IF NOT EXISTS {name} AS SELECT {', '.join(selects)} "  # noqa: S608
+        f"FROM {fact_name(name)} AS f {' '.join(joins)}"
+    )
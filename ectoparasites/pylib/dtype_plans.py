@@ -0,0 +1,138 @@
+"""Plan the dtype each CSV column is parsed as from a sample of its rows.
+
+Parsing a column straight into its number dtype converts each value once, but a
+single value that does not fit fails the whole parse and the CSV has to be parsed
+again as strings. So a column is only parsed as a number when the first rows of
+the CSV fit the column's type, otherwise it is parsed as a string and converted
+in the cast step. Plans are saved in the cache directory by the columns parsed
+and their types, so CSVs laid out the same way are only sampled once over all
+runs that use it. When a parse still fails, the columns that did not fit are
+parsed as strings from then on.
+"""
+import hashlib
+import json
+import logging
+import os
+from contextlib import suppress
+from functools import cache
+
+import pandas as pd
+
+from . import caches
+from . import casting
+
+LOGGER = logging.getLogger(__name__)
+
+# Change this when planning changes
+VERSION = 1
+
+SAMPLE_ROWS = 1000  # Rows read from the top of a CSV to plan its dtypes
+
+CACHE = "dtype_plans.json"  # In the cache directory
+
+# Column dtype -> the dtype it is parsed as. Integers are parsed as 64 bits
+# because the parser wraps bigger values around instead of failing, the cast step
+# checks that they fit
+PARSE_TYPE = {"Float32": "Float32", "Int32": "Int64"}
+
+
+def planner():
+    """Get the planner that saves its plans in the cache directory in use."""
+    return saved_planner(caches.path(CACHE))
+
+
+@cache
+def saved_planner(path):
+    return Planner(path)
+
+
+class Planner:
+    """Get the dtypes to parse CSVs with, remembering the plan for each layout."""
+
+    def __init__(self, path=None):
+        self.path = path  # Where plans are saved, None keeps them in memory
+        self.plans = load(path)  # Signature -> {CSV column: parse dtype}
+        self.added = {}  # Plans not saved yet
+
+    def plan(self, path, dtypes):
+        """Get {CSV column: parse dtype} for a CSV, sampling it for a new layout.
+
+        dtypes: {CSV column: dtype} for the columns to parse. Only number columns
+        are sampled, the others are parsed as their given dtype.
+        """
+        key = signature(dtypes)
+        if key not in self.plans:
+            numbers = [c for c, d in dtypes.items() if d in PARSE_TYPE]
+            sample = read_sample(path, numbers) if numbers else pd.DataFrame()
+            misfits = set(misfit_columns(sample, dtypes, numbers))
+            self.add(
+                key,
+                {
+                    c: "string" if c in misfits else PARSE_TYPE.get(d, d)
+                    for c, d in dtypes.items()
+                },
+            )
+        return self.plans[key]
+
+    def demote(self, dtypes, df):
+        """Parse the columns that failed a typed parse as strings from now on.
+
+        df: The CSV parsed as strings. If no column has a bad value then the
+        parser and the cast step disagree, so every number column is demoted.
+        """
+        key = signature(dtypes)
+        plan = self.plans[key]
+        numbers = [c for c, d in plan.items() if d in PARSE_TYPE.values()]
+        misfits = misfit_columns(df, dtypes, numbers) or numbers
+        if misfits:
+            LOGGER.info(f"Parsing {', '.join(misfits)} as strings from now on")
+            self.add(key, plan | dict.fromkeys(misfits, "string"))
+
+    def add(self, key, plan):
+        self.plans[key] = self.added[key] = plan
+        self.save()
+
+    def save(self):
+        """Add new plans to the file, keeping any other processes added."""
+        if not self.added or self.path is None:
+            self.added = {}
+            return
+        saved = load(self.path) | self.added
+        temp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp.write_text(json.dumps({"version": VERSION, "plans": saved}))
+            temp.replace(self.path)
+        except OSError:
+            with suppress(OSError):  # The directory may not be there
+                temp.unlink()
+        self.added = {}
+
+
+def read_sample(path, columns, rows=SAMPLE_ROWS):
+    return pd.read_csv(path, nrows=rows, usecols=columns, dtype="string")
+
+
+def misfit_columns(df, dtypes, columns):
+    """Get the columns with a value that cannot be cast to its column's dtype."""
+    return [
+        c for c in columns if c in df and casting.cast_column(df[c], dtypes[c])[1].any()
+    ]
+
+
+def signature(dtypes):
+    """CSVs parsing the same columns as the same types share a plan."""
+    text = json.dumps([VERSION, SAMPLE_ROWS, sorted(dtypes.items())])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load(path):
+    if path is None:
+        return {}
+    try:
+        saved = json.loads(path.read_text())
+        if saved["version"] == VERSION:
+            return saved["plans"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
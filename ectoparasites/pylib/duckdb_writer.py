@@ -0,0 +1,51 @@
+"""Load data into DuckDB by letting it scan the data frames directly."""
+import duckdb
+
+from .writer import Writer
+
+TYPES = {
+    "categorical": "VARCHAR",
+    "int": "INTEGER",
+    "numeric": "REAL",
+    "numerical": "REAL",
+    "date": "VARCHAR",
+    "text": "VARCHAR",
+    "time": "VARCHAR",
+    "y/n": "BOOLEAN",
+    "": "VARCHAR",
+}
+
+BATCH = "_ingest_batch"
+
+
+class DuckDbWriter(Writer):
+    types = TYPES
+    integrity_errors = duckdb.ConstraintException
+
+    def connect(self):
+        return duckdb.connect(str(self.db_path))
+
+    def insert(self, name, df, conflict):
+        if not conflict:
+            return self.insert_batch(name, df)
+
+        # Rows with a NULL in their key never conflict but DuckDB drops all but
+        # one of them when they are inserted together with ON CONFLICT
+        null_key = df[self.keys[name]].isna().any(axis="columns")
+        return self.insert_batch(name, df[~null_key], conflict) + self.insert_batch(
+            name, df[null_key]
+        )
+
+    def insert_batch(self, name, df, conflict=""):
+        if df.empty:
+            return 0
+        columns = ", ".join(f'"{c}"' for c in df.columns)
+        self.cxn.register(BATCH, df)
+        try:
+            added = self.cxn.execute(
+                f"INSERT INTO {name} ({columns}) SELECT {columns} FROM {BATCH} "  # noqa: S608
+                f"{conflict}"
+            ).fetchone()[0]
+        finally:
+            self.cxn.unregister(BATCH)
+        return added
@@ -0,0 +1,121 @@
+"""Export the tables to Arrow IPC (Feather V2) files for fast downstream loading.
+
+Each table is written to its own uncompressed file so readers can memory map it
+and only read the columns they use. A manifest lists every file with its row
+count and column types, and the database version it was exported from.
+Incremental ingests only export the tables they changed.
+"""
+import json
+import os
+from pathlib import Path
+
+import pyarrow as pa
+
+MANIFEST = "manifest.json"
+
+BATCH_SIZE = 65_536  # Rows fetched from the database at a time
+
+# Column.type -> Arrow type, matching how the databases store them
+TYPES = {
+    "categorical": pa.dictionary(pa.int32(), pa.string()),
+    "int": pa.int64(),
+    "numeric": pa.float64(),
+    "numerical": pa.float64(),
+    "y/n": pa.bool_(),
+}
+
+
+def sync(cxn, schema, out_dir, version, changed=None):
+    """Export the changed tables and any not exported yet, then the manifest.
+
+    schema: {table: {column: type}} for every table to export.
+    version: The database version from the last ingest.
+    changed: Table names to export again. None exports every table unless the
+    manifest is from the current database version.
+    Returns the names of the exported tables.
+    """
+    manifest = load_manifest(out_dir)
+    if changed is None:
+        changed = set(schema) if manifest["version"] != version else set()
+
+    exported = [
+        name
+        for name in schema
+        if name in changed
+        or name not in manifest["tables"]
+        or not (out_dir / manifest["tables"][name]["file"]).exists()
+    ]
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name in exported:
+        manifest["tables"][name] = export_table(cxn, name, schema[name], out_dir)
+
+    manifest["version"] = version
+    manifest["tables"] = {n: manifest["tables"][n] for n in schema}
+    write_atomic(out_dir / MANIFEST, json.dumps(manifest, indent=2).encode())
+    return exported
+
+
+def export_table(cxn, name, columns, out_dir):
+    """Stream a table into an Arrow file a batch at a time and describe it."""
+    types = {c: TYPES.get(t, pa.string()) for c, t in columns.items()}
+    names = ", ".join(f'"{c}"' for c in columns)
+    cursor = cxn.execute(f"SELECT {names} FROM {name}")  # noqa: S608
+
+    path = out_dir / f"{name}.arrow"
+    temp = path.with_suffix(f".{os.getpid()}.tmp")
+    schema = pa.schema(types.items())
+    rows = 0
+    with pa.OSFile(str(temp), "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        while batch := cursor.fetchmany(BATCH_SIZE):
+            arrays = [
+                column_array(name, c, v, t)
+                for (c, t), v in zip(types.items(), zip(*batch), strict=True)
+            ]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            rows += len(batch)
+    temp.replace(path)
+
+    return {
+        "file": path.name,
+        "rows": rows,
+        "columns": {c: str(t) for c, t in types.items()},
+    }
+
+
+def column_array(table, column, values, arrow_type):
+    """Build an Arrow array from the values in a database column."""
+    try:
+        if pa.types.is_string(arrow_type) or pa.types.is_dictionary(arrow_type):
+            # Columns without a type may have numbers in them
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+            return pa.array(values, arrow_type)
+        return pa.array(values).cast(arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as err:
+        raise ValueError(
+            f"Cannot export {table}.{column} as {arrow_type}: {err}"
+        ) from err
+
+
+def default_dir(backend, db):
+    """Put the files next to a database file, a server DB uses the current dir."""
+    if backend == "postgres":
+        return Path.cwd() / "ectoparasites_arrow"
+    db = Path(db)
+    return db.parent / f"{db.stem}_arrow"
+
+
+def load_manifest(out_dir):
+    try:
+        manifest = json.loads((out_dir / MANIFEST).read_text())
+        if isinstance(manifest.get("tables"), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": None, "tables": {}}
+
+
+def write_atomic(path, data):
+    temp = path.with_suffix(f".{os.getpid()}.tmp")
+    temp.write_bytes(data)
+    temp.replace(path)
@@ -0,0 +1,146 @@
+"""Resolve CSV column names to the column aliases in TABLES.
+
+Names are normalized so case, accents, spacing, and separators do not matter.
+A name that is still not an alias is matched to the closest alias by edit
+distance when it is close enough and no other alias is as close. Fuzzy matching
+is slow so its results are kept in the cache directory, and each distinct column
+name is only fuzzy matched once over all runs that use it.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from contextlib import suppress
+
+LOGGER = logging.getLogger(__name__)
+
+# Change this when normalizing or fuzzy matching changes
+VERSION = 1
+
+# The smallest similarity, 1 - edits / length of the longer name, to match
+THRESHOLD = 0.85
+
+CACHE = "headers.json"  # In the cache directory
+
+SEPARATORS = re.compile(r"[\s_\-./]+")
+
+
+def normalize(name):
+    """Fold case and accents and join the words with underscores.
+
+    "Bird Species ", "bird_species", and "bird-species" are all bird_species.
+    """
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return SEPARATORS.sub(" ", name.casefold()).strip().replace(" ", "_")
+
+
+class Resolver:
+    """Find the alias each CSV column name is for, remembering fuzzy matches."""
+
+    def __init__(self, aliases, path=None):
+        self.aliases = set(aliases)  # Normalized
+        self.path = path  # Where fuzzy matches are saved, None keeps them in memory
+        self.stamp = stamp(self.aliases)
+        self.fuzzy = load(path, self.stamp)  # Normalized name -> alias or None
+        self.keys = {}  # Name -> normalized name
+        self.added = {}  # Fuzzy matches not saved yet
+
+    def resolve(self, name, fuzzy=True, taken=()):
+        """Get the alias for a column name, or its normalized name if none match.
+
+        A name is never fuzzy matched to one of the taken aliases.
+        """
+        if name not in self.keys:
+            self.keys[name] = normalize(name)
+        key = self.keys[name]
+        if key in self.aliases or not fuzzy:
+            return key
+
+        if key not in self.fuzzy:
+            alias = closest(key, self.aliases)
+            if alias:
+                LOGGER.info(f"Matching column '{name}' to '{alias}'")
+            self.fuzzy[key] = self.added[key] = alias
+
+        alias = self.fuzzy[key]
+        if alias in taken:
+            # Another column has the closest alias, the match depends on the header
+            alias = closest(key, self.aliases.difference(taken))
+            if alias:
+                LOGGER.info(f"Matching column '{name}' to '{alias}'")
+        return alias or key
+
+    def save(self):
+        """Add new fuzzy matches to the file, keeping any other processes added."""
+        if not self.added or self.path is None:
+            self.added = {}
+            return
+        saved = load(self.path, self.stamp) | self.added
+        temp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp.write_text(json.dumps({"stamp": self.stamp, "names": saved}))
+            temp.replace(self.path)
+        except OSError:
+            with suppress(OSError):  # The directory may not be there
+                temp.unlink()
+        self.added = {}
+
+
+def closest(key, aliases, threshold=THRESHOLD):
+    """Get the only alias within the threshold with the fewest edits, or None."""
+    best, fewest, tied = None, None, False
+    for alias in aliases:
+        limit = int(max(len(key), len(alias)) * (1 - threshold))
+        if fewest is not None:
+            limit = min(limit, fewest)
+        edits = distance(key, alias, limit)
+        if edits > limit:
+            continue
+        if edits == fewest:
+            tied = True
+        else:
+            best, fewest, tied = alias, edits, False
+    return None if tied else best
+
+
+def distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it must be more than limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def stamp(aliases):
+    """Fuzzy matches depend on the aliases and on how they are matched."""
+    text = json.dumps([VERSION, THRESHOLD, sorted(aliases)])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load(path, expected):
+    if path is None:
+        return {}
+    try:
+        saved = json.loads(path.read_text())
+        if saved["stamp"] == expected:
+            return saved["names"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
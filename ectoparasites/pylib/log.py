@@ -4,9 +4,11 @@ import sys
 from os.path import basename
 from os.path import splitext
 
+LOGGER = logging.getLogger(__name__)
+
 
 def setup_logger(level=logging.INFO):
-    """Setup the logger."""
+    """Set up the logger."""
     logging.basicConfig(
         level=level,
         format="%(asctime)s %(levelname)s: %(message)s",
@@ -22,10 +24,10 @@ def module_name() -> str:
 def started() -> None:
     """Log the program start time."""
     setup_logger()
-    logging.info("=" * 80)
-    logging.info("%s started", module_name())
+    LOGGER.info("=" * 80)
+    LOGGER.info("%s started", module_name())
 
 
 def finished() -> None:
     """Log the program end time."""
-    logging.info("%s finished", module_name())
+    LOGGER.info("%s finished", module_name())
@@ -0,0 +1,262 @@
+"""Track which source files have been ingested so unchanged ones can be skipped."""
+import hashlib
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+LOGGER = logging.getLogger(__name__)
+
+FILES = "ingest_files"
+ROWS = "ingest_rows"
+REJECTS = "ingest_rejects"
+KEYS = "ingest_keys"
+
+# Ends the reason of a reject that is a cell set to missing, its row was loaded
+COERCED = "set to missing"
+
+# Tags rows with the file they came from in databases without stable rowids
+FILE_COLUMN = "_file_id"
+
+
+@dataclass
+class Source:
+    path: Path
+    size: int
+    mtime: float
+    sha256: str
+    file_id: int | None = None
+
+
+class Manifest:
+    """Ingested files and the rows they added to each table.
+
+    Rows are tracked as rowid ranges. Each write appends to its table in one
+    transaction so the rows it adds get consecutive rowids above every existing
+    row. In databases without stable rowids the range is NULL and the rows are
+    found by the file ID they are tagged with.
+
+    A row that is in several files is only added by one of them, so the hashes of
+    the keys each file has are kept too. When a file is retracted, the files that
+    shared rows with it are retracted and ingested again.
+    """
+
+    def __init__(self, cxn):
+        self.cxn = cxn
+        self.touched = set()  # Tables this ingest added rows to or removed rows from
+        self.watched = {}  # Table -> the columns to keep the values of in changes
+        self.changed_keys = defaultdict(set)  # Table -> those values for its changes
+        statements = [
+            f"""CREATE TABLE IF NOT EXISTS {FILES} (
+                file_id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE,
+                size BIGINT,
+                mtime DOUBLE PRECISION,  -- REAL is 4 bytes outside SQLite
+                sha256 TEXT  -- Is NULL until the file is fully ingested
+            )""",
+            f"""CREATE TABLE IF NOT EXISTS {ROWS} (
+                file_id INTEGER,
+                table_name TEXT,
+                first_rowid INTEGER,
+                last_rowid INTEGER
+            )""",
+            f"CREATE INDEX IF NOT EXISTS {ROWS}_file_id ON {ROWS} (file_id)",
+            f"""CREATE TABLE IF NOT EXISTS {REJECTS} (
+                file_id INTEGER,
+                table_name TEXT,
+                line INTEGER,
+                column_name TEXT,
+                value TEXT,
+                reason TEXT
+            )""",
+            f"CREATE INDEX IF NOT EXISTS {REJECTS}_file_id ON {REJECTS} (file_id)",
+            f"""CREATE TABLE IF NOT EXISTS {KEYS} (
+                file_id INTEGER,
+                table_name TEXT,
+                key_hash BIGINT
+            )""",
+            f"CREATE INDEX IF NOT EXISTS {KEYS}_file_id ON {KEYS} (file_id)",
+            f"CREATE INDEX IF NOT EXISTS {KEYS}_key ON {KEYS} (table_name, key_hash)",
+        ]
+        for sql in statements:
+            self.cxn.execute(sql)
+
+    def reset(self):
+        for name in (FILES, ROWS, REJECTS, KEYS):
+            self.cxn.execute(f"DELETE FROM {name}")  # noqa: S608
+
+    def changed(self, paths):
+        """Get the sources that need to be ingested.
+
+        Unchanged files are skipped. Rows from files that changed since they were
+        last ingested are removed from the database, and so are the rows of files
+        that shared rows with them. Those files are ingested again too.
+        """
+        sources, shared = [], set()
+        for path in paths:
+            key = str(path.resolve())
+            stat = path.stat()
+            old = self.cxn.execute(
+                f"SELECT file_id, size, mtime, sha256 FROM {FILES} WHERE path = ?",  # noqa: S608
+                (key,),
+            ).fetchone()
+
+            if old and old[3] and (old[1], old[2]) == (stat.st_size, stat.st_mtime):
+                LOGGER.info(f"Skipping unchanged {path.name}")
+                continue
+
+            source = Source(path, stat.st_size, stat.st_mtime, file_hash(path))
+
+            if old and old[3] == source.sha256:
+                LOGGER.info(f"Skipping unchanged {path.name}")
+                source.file_id = old[0]
+                self.done(source)
+                continue
+
+            if old:
+                LOGGER.info(f"Retracting rows from changed {path.name}")
+                shared |= self.retract(old[0])
+                source.file_id = old[0]
+            else:
+                source.file_id = self.cxn.execute(
+                    f"SELECT coalesce(max(file_id), 0) + 1 FROM {FILES}"  # noqa: S608
+                ).fetchone()[0]
+                self.cxn.execute(
+                    f"INSERT INTO {FILES} (file_id, path) VALUES (?, ?)",  # noqa: S608
+                    (source.file_id, key),
+                )
+
+            sources.append(source)
+
+        return self.add_shared(sources, shared)
+
+    def add_shared(self, sources, shared):
+        """Retract the files sharing rows with retracted ones and add them to sources.
+
+        A full ingest credits each shared row to the first file with it, so they
+        are ingested again in path order. A file that is gone stays retracted.
+        """
+        found = {s.file_id for s in sources}
+        queue = sorted(shared - found)
+        while queue:
+            file_id = queue.pop()
+            if file_id in found:
+                continue
+            found.add(file_id)
+            path = Path(self.path(file_id))
+            queue += sorted(self.retract(file_id) - found)
+            if not path.exists():
+                LOGGER.warning(f"Cannot ingest {path} again, its shared rows are gone")
+                continue
+            LOGGER.info(f"Ingesting {path.name} again, it shared rows with a change")
+            stat = path.stat()
+            sources.append(
+                Source(path, stat.st_size, stat.st_mtime, file_hash(path), file_id)
+            )
+        return sorted(sources, key=lambda s: s.path.resolve())
+
+    def path(self, file_id):
+        return self.cxn.execute(
+            f"SELECT path FROM {FILES} WHERE file_id = ?", (file_id,)  # noqa: S608
+        ).fetchone()[0]
+
+    def retract(self, file_id):
+        """Remove every row a file added to the database.
+
+        Returns the IDs of the other files that had any of the same keys.
+        """
+        shared = self.cxn.execute(
+            f"""SELECT DISTINCT other.file_id
+                FROM {KEYS} AS own
+                JOIN {KEYS} AS other
+                  ON other.table_name = own.table_name
+                 AND other.key_hash = own.key_hash
+                WHERE own.file_id = ? AND other.file_id <> ?""",  # noqa: S608
+            (file_id, file_id),
+        ).fetchall()
+        ranges = self.cxn.execute(
+            f"SELECT table_name, first_rowid, last_rowid FROM {ROWS} WHERE file_id = ?",  # noqa: S608
+            (file_id,),
+        ).fetchall()
+        self.cxn.execute("BEGIN")
+        for table, first, last in ranges:
+            self.touched.add(table)
+            if first is None:
+                where, params = f"{FILE_COLUMN} = ?", (file_id,)
+            else:
+                where, params = "rowid BETWEEN ? AND ?", (first, last)
+            if columns := self.watched.get(table):
+                names = ", ".join(f'"{c}"' for c in columns)
+                sql = f"SELECT {names} FROM {table} WHERE {where}"  # noqa: S608
+                self.note(table, self.cxn.execute(sql, params).fetchall())
+            self.cxn.execute(f"DELETE FROM {table} WHERE {where}", params)  # noqa: S608
+        for name in (ROWS, REJECTS, KEYS):
+            sql = f"DELETE FROM {name} WHERE file_id = ?"  # noqa: S608
+            self.cxn.execute(sql, (file_id,))
+        sql = f"UPDATE {FILES} SET sha256 = NULL WHERE file_id = ?"  # noqa: S608
+        self.cxn.execute(sql, (file_id,))
+        self.cxn.execute("COMMIT")
+        return {s[0] for s in shared}
+
+    def watch(self, table, columns):
+        """Keep the values of the columns in the rows of the table that change."""
+        self.watched[table] = columns
+
+    def note(self, table, rows):
+        """Keep the watched column values of rows changed in the table."""
+        if table in self.watched:
+            self.changed_keys[table].update(tuple(r) for r in rows)
+
+    def record(self, file_id, table, first_rowid, last_rowid):
+        """Record rows added by a file, extending its last range if they follow it."""
+        self.touched.add(table)
+        if first_rowid is None:
+            found = self.cxn.execute(
+                f"SELECT 1 FROM {ROWS} WHERE file_id = ? AND table_name = ?",  # noqa: S608
+                (file_id, table),
+            ).fetchone()
+            if not found:
+                self.cxn.execute(
+                    f"INSERT INTO {ROWS} (file_id, table_name) VALUES (?, ?)",  # noqa: S608
+                    (file_id, table),
+                )
+            return
+
+        cursor = self.cxn.execute(
+            f"""UPDATE {ROWS} SET last_rowid = ?
+                WHERE file_id = ? AND table_name = ? AND last_rowid = ?""",  # noqa: S608
+            (last_rowid, file_id, table, first_rowid - 1),
+        )
+        if cursor.rowcount == 0:
+            self.cxn.execute(
+                f"INSERT INTO {ROWS} VALUES (?, ?, ?, ?)",  # noqa: S608
+                (file_id, table, first_rowid, last_rowid),
+            )
+
+    def reject(self, file_id, rejects):
+        """Record the rows from a file that broke validation rules."""
+        if rejects.empty:
+            return
+        rows = rejects[["table_name", "line", "column_name", "value", "reason"]]
+        rows = rows.astype(object).where(rows.notna(), None)
+        self.cxn.execute("BEGIN")
+        self.cxn.executemany(
+            f"INSERT INTO {REJECTS} VALUES (?, ?, ?, ?, ?, ?)",  # noqa: S608
+            [(file_id, *r) for r in rows.itertuples(index=False)],
+        )
+        self.cxn.execute("COMMIT")
+
+    def done(self, source):
+        """Mark a source as fully ingested."""
+        self.cxn.execute(
+            f"UPDATE {FILES} SET size = ?, mtime = ?, sha256 = ? WHERE file_id = ?",  # noqa: S608
+            (source.size, source.mtime, source.sha256, source.file_id),
+        )
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with path.open("rb") as in_file:
+        while block := in_file.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
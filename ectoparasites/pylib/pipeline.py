@@ -0,0 +1,503 @@
+"""Move CSV and workbook data into the database tables it fills.
+
+This is the ingest command. It imports pandas and the rest of the ingest code so
+it is only imported when data is ingested.
+"""
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from . import alias_index
+from . import caches
+from . import casting
+from . import dtype_plans
+from . import export
+from . import pool
+from . import sheets
+from . import stages
+from . import staging
+from . import tables
+from . import timings
+from . import validate
+from . import writer
+
+LOGGER = logging.getLogger(__name__)
+
+# These are read as strings and converted in the cast step. Y/n values are not
+# always spelled the same way and most ID columns are too unique for categoricals
+PARSE_TYPE = {"boolean": "string", "category": "string"}
+
+# Tags each row with the manifest ID of the file it came from
+SOURCE = "_file_id"
+
+
+def run(args):
+    """Ingest the CSVs and workbooks in a directory with the ingest command's args."""
+    cache_dir = args.cache_dir or caches.default_dir(args.backend, args.db)
+    caches.use(cache_dir)
+    with (
+        writer.connect(
+            args.backend,
+            args.db,
+            replace=args.replace,
+            on_conflict=args.on_conflict,
+            normalize=args.normalize,
+        ) as db,
+        pool.executor(args.workers, caches.use, cache_dir) as executor,
+    ):
+        with timings.phase("scan") as measure:
+            sources = db.manifest.changed(sheets.csv_paths(args.csv_dir))
+            measure.bytes_read = sum(s.size for s in sources)
+
+        if args.chunksize:
+            stream_data(db, sources, args.chunksize, executor, args.queue_depth)
+        else:
+            cache = None
+            if not args.no_cache:
+                cache = staging.StagingCache(cache_dir, args.cache_size)
+            table_data, rejects = extract_csv_data(sources, executor, cache)
+            ingest_data(db, table_data, sources, rejects)
+
+        if sources and not args.no_indexes:
+            db.create_indexes()
+
+        db.summarize()
+
+        if args.export:
+            export_dir = args.export
+            if export_dir is True:
+                export_dir = export.default_dir(args.backend, args.db)
+            db.export(export_dir)
+
+
+def ingest_data(db, table_data, sources, rejects=None):
+    """Write each table's data, a data frame and the rows shared with other files."""
+    for name, (df, shared) in table_data.items():
+        LOGGER.info(f"Getting data for: {name}")
+        if df.empty:
+            continue
+        for file_id, file_df in df.groupby(SOURCE, sort=False):
+            db.write(name, file_df.drop(columns=SOURCE), file_id)
+        db.link(name, shared)
+
+    if rejects is not None and not rejects.empty:
+        for file_id, file_rejects in rejects.groupby(SOURCE, sort=False):
+            db.manifest.reject(file_id, file_rejects)
+
+    for source in sources:
+        db.manifest.done(source)
+
+
+def stream_data(db, sources, chunksize, executor=None, depth=stages.DEPTH):
+    """Move CSV data into the database one chunk at a time.
+
+    Only the CSV columns the matched tables need are read. Reading, casting, and
+    writing chunks overlap, and each stage only gets a few chunks ahead of the
+    next, so memory use does not grow with the size of the input. The database
+    cannot deduplicate rows missing part of their natural key or rows of tables
+    without one, so a hash of each of those rows is kept to drop the ones an
+    earlier chunk wrote.
+    """
+    written = defaultdict(dict)  # Table name -> {row hash: file ID}
+    stages.run(
+        read_chunks(sources, chunksize),
+        split_chunk,
+        partial(write_chunk, db, written),
+        executor=executor,
+        depth=depth,
+    )
+
+
+def read_chunks(sources, chunksize):
+    """Get (source, scan, chunk) for each chunk of each CSV and sheet in a source.
+
+    (source, None, None) follows the last chunk of a source.
+    """
+    for source in sources:
+        for scan, sheet in prescan_source(source.path):
+            log_matches(scan.name, scan.columns, scan.hits)
+            if not scan.hits:
+                continue
+            if sheet:
+                chunks = read_sheet_chunks(
+                    sheet, scan.dtypes, chunksize, scan.date_formats
+                )
+            else:
+                chunks = read_csv_chunks(source.path, scan.dtypes, chunksize)
+            for chunk in chunks:
+                yield source, scan, chunk
+        yield source, None, None
+
+
+def split_chunk(item):
+    """Get (source, table data, rejects) for a chunk."""
+    source, scan, chunk = item
+    if scan is None:
+        return item
+    frames, rejects = split_csv_data(chunk, scan.hits, scan.name, dedup=True)
+    return source, frames, rejects
+
+
+def write_chunk(db, written, item):
+    source, frames, rejects = item
+    if frames is None:
+        db.manifest.done(source)
+        return
+    for name, df in frames:
+        key = db.natural_keys.get(name)
+        df, shared = drop_written(df, written[name], source.file_id, key)
+        db.write(name, df, source.file_id)
+        db.link(name, shared)
+    db.manifest.reject(source.file_id, rejects)
+
+
+def drop_written(df, written, file_id, key=None):
+    """Drop the rows the database cannot deduplicate that were already written.
+
+    written: {row hash: file ID} for the rows written so far, new rows are added.
+    Returns the rows to write and the (file ID, key hash) of the files with the
+    dropped rows, like combine_table_data.
+    """
+    checked = null_key(df, key) if key else np.ones(len(df), dtype=bool)
+    hashes = pd.util.hash_pandas_object(df[checked], index=False)
+    hashes = pd.Series(hashes.to_numpy().view("int64"))
+    first = hashes.map(written)
+    dropped = first.notna().to_numpy()
+    written.update(dict.fromkeys(hashes[~dropped].tolist(), file_id))
+
+    keep = np.ones(len(df), dtype=bool)
+    keep[checked] = ~dropped
+
+    # Rows an earlier chunk of the same file wrote need no links
+    first = first[dropped].astype("int64").to_numpy()
+    other = first != file_id
+    links = writer.key_links(file_id, df[~keep][other], key or df.columns)
+    return df[keep], pd.concat([links, links.assign(file_id=first[other])])
+
+
+@dataclass
+class CsvScan:
+    name: str
+    columns: set[str]  # Normalized CSV column names
+    hits: list  # (Table, mapping) pairs from the alias index
+    dtypes: dict[str, str]  # CSV column -> dtype, for only the columns we need
+    date_formats: dict[str, str]  # CSV column -> date format of the column it fills
+
+
+def prescan_source(path):
+    """Get a (scan, sheet) for a CSV or for each sheet in a workbook.
+
+    The sheet is None for a CSV. A workbook's sheets are read in order so each
+    sheet must be used before getting the next one.
+    """
+    if not sheets.is_workbook(path):
+        yield prescan(path), None
+        return
+    for sheet in sheets.read(path, alias_index.index()):
+        yield prescan(path, sheet.header, sheet.name), sheet
+
+
+def prescan(path, header=None, name=None):
+    """Read only the header of a CSV to find which columns to parse and as what."""
+    header = header if header is not None else read_header(path)
+    name = name or path.stem.lower()
+
+    columns = alias_index.index().resolve(header)
+
+    with timings.phase("match", csv=name):
+        hits = alias_index.index().match(columns.keys())
+
+    # A CSV column feeding several tables with different types is left a string
+    dtypes, date_formats = {}, {}
+    for db_table, mapping in hits:
+        types = db_table.sqlite_types(mapping.keys())
+        formats = {c.name: c.date_format for c in db_table.columns if c.date_format}
+        for db_column, alias in mapping.items():
+            dtype = types.get(db_column, "string")
+            dtype = PARSE_TYPE.get(dtype, dtype)
+            column = columns[alias]
+            dtypes[column] = dtype if dtypes.get(column, dtype) == dtype else "string"
+            if db_column in formats:
+                date_formats.setdefault(column, formats[db_column])
+
+    return CsvScan(name, set(columns), hits, dtypes, date_formats)
+
+
+def read_header(path):
+    """Get the column names of a CSV without reading any data."""
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_csv(path, dtypes):
+    """Parse a CSV with its dtype plan, falling back to strings if it fails."""
+    planner = dtype_plans.planner()
+    with timings.phase("plan", csv=path.stem.lower()):
+        plan = planner.plan(path, dtypes)
+
+    with timings.phase("parse", csv=path.stem.lower()) as measure:
+        measure.bytes_read = path.stat().st_size
+        try:
+            df = pd.read_csv(path, **parse_options(plan))
+        except (TypeError, ValueError, OverflowError) as err:
+            LOGGER.warning(f"Parsing {path.name} as strings: {err}")
+            df = pd.read_csv(path, **parse_options(plan, typed=False))
+            planner.demote(dtypes, df)
+        measure.rows_out = len(df)
+    return df
+
+
+def read_csv_chunks(path, dtypes, chunksize):
+    """Read a CSV in normalized chunks, falling back to untyped parsing if needed.
+
+    The index keeps counting across chunks so rows can be traced to their line.
+    """
+    planner = dtype_plans.planner()
+    with timings.phase("plan", csv=path.stem.lower()):
+        plan = planner.plan(path, dtypes)
+
+    done, typed, failed = 0, True, False
+    while True:
+        reader = pd.read_csv(
+            path,
+            chunksize=chunksize,
+            skiprows=range(1, done + 1),
+            **parse_options(plan, typed),
+        )
+        try:
+            while True:
+                with timings.phase("parse", csv=path.stem.lower()) as measure:
+                    chunk = next(reader, None)
+                    measure.rows_out = 0 if chunk is None else len(chunk)
+                if chunk is None:
+                    return
+                if failed:
+                    # This chunk has the value that failed the typed parse
+                    planner.demote(dtypes, chunk)
+                    failed = False
+                chunk.index += done
+                done += len(chunk)
+                yield fix_column_names(chunk)
+        except (TypeError, ValueError, OverflowError) as err:
+            if not typed:
+                raise
+            LOGGER.warning(f"Parsing {path.name} as strings: {err}")
+            typed, failed = False, True
+
+
+def read_sheet(sheet, dtypes, date_formats=None):
+    with timings.phase("parse", csv=sheet.name) as measure:
+        df = sheet_frame(*next(sheets.chunks(sheet, dtypes, None, date_formats)))
+        measure.rows_out = len(df)
+    return df
+
+
+def read_sheet_chunks(sheet, dtypes, chunksize, date_formats=None):
+    """Read a sheet in normalized chunks. Sheet data is cast from strings."""
+    chunks = sheets.chunks(sheet, dtypes, chunksize, date_formats)
+    while True:
+        with timings.phase("parse", csv=sheet.name) as measure:
+            chunk = next(chunks, None)
+            measure.rows_out = 0 if chunk is None else len(chunk[0])
+        if chunk is None:
+            return
+        yield fix_column_names(sheet_frame(*chunk))
+
+
+def sheet_frame(index, data):
+    return pd.DataFrame(
+        {c: pd.array(v, dtype="string") for c, v in data.items()},
+        index=pd.Index(index, dtype="int64"),
+    )
+
+
+def parse_options(dtypes, typed=True):
+    """Get read_csv options. Untyped reads leave the casting to the cast step."""
+    if not typed:
+        dtypes = dict.fromkeys(dtypes, "string")
+    return {"usecols": list(dtypes), "dtype": dtypes}
+
+
+def fix_column_names(df):
+    """Rename the columns to the aliases they were matched to when prescanning."""
+    renames = {c: a for a, c in alias_index.index().resolve(df.columns).items()}
+    df = df.rename(renames, axis="columns")
+    return df
+
+
+def extract_csv_data(sources, executor=None, cache=None):
+    """Scan each CSV once and split its data into every table it can fill.
+
+    Each row is tagged with the file it came from. When a row is in several
+    files it is credited to the first one. Returns the data for each table with
+    the rows it shares between files, and the rows that failed validation.
+    """
+    all_csv_data = defaultdict(list)
+    all_rejects = []
+
+    # Look thru all CSVs and sheets
+    extract = partial(extract_csv, cache=cache)
+    for extracted in pool.imap(extract, sources, pool=executor):
+        for csv_name, csv_column_set, frames, rejects in extracted:
+            hits = alias_index.index().match(csv_column_set)
+            log_matches(csv_name, csv_column_set, hits)
+
+            for name, df in frames:
+                all_csv_data[name].append(df)
+            all_rejects.append(rejects)
+
+    keys = tables.natural_keys()
+    names = list(tables.schema())
+    combined = pool.imap(
+        combine_table_data,
+        names,
+        [all_csv_data[n] for n in names],
+        [keys.get(n) for n in names],
+        pool=executor,
+    )
+    table_data = dict(zip(names, combined, strict=True))
+    return table_data, pd.concat(all_rejects) if all_rejects else None
+
+
+def extract_csv(source, cache=None):
+    """Parse one CSV or workbook and pull out the data for every table it fills.
+
+    Each sheet in a workbook is handled like a separate CSV. Returns the name,
+    columns, table data, and rejects for the CSV or for each sheet.
+    """
+    extracted = []
+    for scan, sheet in prescan_source(source.path):
+        frames, rejects = [], validate.empty()
+        if scan.hits:
+            csv_table = load_csv(source, scan, cache, sheet)
+            frames, rejects = split_csv_data(csv_table, scan.hits, scan.name)
+            frames = [
+                (name, df.assign(**{SOURCE: source.file_id})) for name, df in frames
+            ]
+        rejects = rejects.assign(**{SOURCE: source.file_id})
+        extracted.append((scan.name, scan.columns, frames, rejects))
+    return extracted
+
+
+def load_csv(source, scan, cache=None, sheet=None):
+    """Parse a CSV or sheet or get its already parsed data from the staging cache."""
+    if sheet:
+        parse = partial(read_sheet, sheet, scan.dtypes, scan.date_formats)
+    else:
+        parse = partial(read_csv, source.path, scan.dtypes)
+
+    if cache is None:
+        return fix_column_names(parse())
+
+    # Cached with the CSV's column names so changing the aliases keeps it valid
+    if sheet:
+        key = cache.key(source.sha256, sheet.name, scan.date_formats)
+    else:
+        key = cache.key(source.sha256)
+    with timings.phase("cache", csv=scan.name) as measure:
+        csv_table = cache.get(key, scan.dtypes)
+        measure.rows_out = 0 if csv_table is None else len(csv_table)
+
+    if csv_table is None:
+        csv_table = parse()
+        cache.put(key, csv_table, scan.dtypes)
+
+    return fix_column_names(csv_table)
+
+
+def split_csv_data(csv_table, hits, csv_name="", dedup=False):
+    """Get (table name, data) pairs for every table matched to the CSV data.
+
+    Rows that fail validation are left out and returned as rejects, with the
+    cells that could not be cast and were set to missing.
+    """
+    schema = tables.schema()
+    keys = tables.natural_keys()
+    frames, rejects = [], []
+    for db_table, mapping in hits:
+        with timings.phase("cast", db_table.name, csv_name) as measure:
+            df = select_table_data(csv_table, mapping)
+            df, coercions = casting.cast(
+                df, schema[db_table.name], f"{csv_name} {db_table.name}"
+            )
+            measure.rows_in, measure.rows_out = len(csv_table), len(df)
+        rejects += validate.coerced(coercions, db_table.name)
+        df, bad = validate.check(df, db_table, csv_name)
+        if not bad.empty:
+            rejects.append(bad)
+        if dedup:
+            with timings.phase("dedup", db_table.name, csv_name) as measure:
+                measure.rows_in = len(df)
+                df = drop_duplicates(df, df.columns, keys.get(db_table.name))
+                measure.rows_out = len(df)
+        frames.append((db_table.name, df))
+    return frames, pd.concat(rejects) if rejects else validate.empty()
+
+
+def combine_table_data(name, csv_data, key=None):
+    """Get a table's data and the (file ID, key hash) of rows in several files.
+
+    Only the first copy of a duplicated row is kept, the files with the others
+    are linked to it in the manifest.
+    """
+    if not csv_data:
+        return pd.DataFrame(), pd.DataFrame(columns=["file_id", "key_hash"])
+    table_df = casting.concat(csv_data)
+    with timings.phase("dedup", name) as measure:
+        measure.rows_in = len(table_df)
+        columns = table_df.columns.drop(SOURCE)
+        if key:
+            shared = shared_rows(table_df[null_key(table_df, key)], key)
+        else:
+            shared = shared_rows(table_df, columns)
+        table_df = drop_duplicates(table_df, columns, key)
+        measure.rows_out = len(table_df)
+    return table_df, shared
+
+
+def drop_duplicates(df, columns, key=None):
+    """Drop repeated rows, only checking rows missing a key part if there is a key.
+
+    The database drops the other rows with a key it has, but NULLs never match.
+    """
+    if not key:
+        return df.drop_duplicates(subset=columns)
+    checked = null_key(df, key)
+    keep = np.ones(len(df), dtype=bool)
+    keep[checked] = ~df[checked].duplicated(subset=columns).to_numpy()
+    return df[keep]
+
+
+def null_key(df, key):
+    return df[key].isna().any(axis="columns").to_numpy()
+
+
+def shared_rows(df, columns):
+    """Get the (file ID, key hash) of every file with a row that is in other files."""
+    links = writer.key_links(df[SOURCE].to_numpy(), df, columns)
+    links = links.drop_duplicates()
+    return links[links.duplicated("key_hash", keep=False)]
+
+
+def log_matches(csv_name, csv_column_set, hits):
+    hit_tables = {t for t, _ in hits}
+    for db_table in tables.TABLES:
+        if db_table in hit_tables:
+            LOGGER.info(f"Hit  {db_table.name} & {csv_name}")
+        else:
+            missing = db_table.missing(csv_column_set)
+            LOGGER.info(f"Miss {db_table.name} & {csv_name} Missing = {missing}")
+
+
+def select_table_data(csv_table, mapping):
+    """Copy the CSV columns into their database table columns.
+
+    Missing optional columns are added when the data is cast.
+    """
+    return pd.DataFrame(
+        {name: csv_table[alias] for name, alias in mapping.items()},
+        index=csv_table.index,
+    )
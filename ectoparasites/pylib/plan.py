@@ -0,0 +1,67 @@
+"""Work out which CSVs and sheets would fill which tables without loading them.
+
+Only the CSV headers are parsed. A CSV's row count is estimated from the size of
+its first lines and the size of the file. Workbook sheets have to be read to
+find the next sheet anyway, so their rows are counted.
+"""
+from . import sheets
+
+SAMPLE = 2**16  # Bytes read from the top of a CSV to estimate its row count
+
+
+def plan(csv_dir, index):
+    """Get the sources, every (table, source) pair sharing a column, and totals.
+
+    A pair's missing list has the required CSV columns the source lacks, the
+    table only gets data from the source when it is empty.
+    """
+    sources, pairs = [], []
+    totals = {t: {"sources": 0, "rows": 0} for t in index.tables}
+
+    for path, name, header, rows, estimated in headers(csv_dir, index):
+        sources.append(
+            {"name": name, "path": str(path), "rows": rows, "estimated": estimated}
+        )
+        for table, mapping, missing in index.coverage(index.resolve(header).keys()):
+            pairs.append(
+                {"table": table, "source": name, "columns": mapping, "missing": missing}
+            )
+            if not missing:
+                totals[table]["sources"] += 1
+                totals[table]["rows"] += rows
+
+    return {"sources": sources, "pairs": pairs, "tables": totals}
+
+
+def headers(csv_dir, index):
+    """Get (path, name, header, rows, estimated) for each CSV and sheet."""
+    for path in sheets.csv_paths(csv_dir):
+        if sheets.is_workbook(path):
+            for sheet in sheets.read(path, index):
+                rows = sum(1 for row in sheet.rows if any(row))
+                yield path, sheet.name, sheet.header, rows, False
+        else:
+            rows, estimated = estimate_rows(path)
+            yield path, path.stem.lower(), sheets.csv_header(path), rows, estimated
+
+
+def estimate_rows(path, sample=SAMPLE):
+    """Get a CSV's (data rows, estimated) from the line lengths at its top.
+
+    Small CSVs are read whole so their lines are counted. Quoted fields with
+    line breaks in them are counted as extra rows either way.
+    """
+    size = path.stat().st_size
+    with path.open("rb") as in_file:
+        head = in_file.read(sample)
+
+    lines = head.count(b"\n") + (not head.endswith(b"\n"))
+    if len(head) == size:
+        return max(lines - 1, 0), False
+
+    start = head.find(b"\n") + 1
+    end = head.rfind(b"\n") + 1
+    if start >= end:  # One long line, we cannot tell
+        return 0, True
+
+    return round((size - start) * head.count(b"\n", start) / (end - start)), True
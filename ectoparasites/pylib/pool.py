@@ -0,0 +1,49 @@
+"""Map functions over work items either serially or in a process pool."""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from . import timings
+
+
+@contextmanager
+def executor(workers, initializer=None, *initargs):
+    """Get a process pool, or None when the work should be done serially.
+
+    The initializer is called with the initargs in each worker process.
+    """
+    if not workers or workers < 2:
+        yield None
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as pool:
+        yield pool
+
+
+def imap(func, *iterables, pool=None, ahead=None):
+    """Lazily map a function over items, yielding the results in order.
+
+    In a pool only a bounded number of tasks are in flight at once so large
+    inputs are not all held in memory. The results are the same as a serial run.
+    Phase timings from the workers are added to this process's timings.
+    """
+    if pool is None:
+        yield from map(func, *iterables)
+        return
+
+    ahead = ahead or 2 * (os.cpu_count() or 1)
+    pending = deque()
+    for args in zip(*iterables):
+        pending.append(pool.submit(timings.call, func, *args))
+        if len(pending) >= ahead:
+            yield result(pending.popleft())
+    while pending:
+        yield result(pending.popleft())
+
+
+def result(future):
+    value, stats = future.result()
+    timings.RECORDER.merge(stats)
+    return value
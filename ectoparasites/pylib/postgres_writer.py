@@ -0,0 +1,50 @@
+"""Load data into PostgreSQL with COPY FROM STDIN."""
+import psycopg
+
+from .backends import PostgresConnection
+from .writer import records
+from .writer import Writer
+
+TYPES = {
+    "categorical": "TEXT",
+    "int": "INTEGER",
+    "numeric": "REAL",
+    "numerical": "REAL",
+    "date": "TEXT",
+    "text": "TEXT",
+    "time": "TEXT",
+    "y/n": "BOOLEAN",
+    "": "TEXT",
+}
+
+
+class PostgresWriter(Writer):
+    """The db path is a PostgreSQL connection string."""
+
+    types = TYPES
+    integrity_errors = psycopg.errors.UniqueViolation
+
+    def connect(self):
+        return PostgresConnection(psycopg.connect(self.db_path, autocommit=True))
+
+    def insert(self, name, df, conflict):
+        columns = ", ".join(f'"{c}"' for c in df.columns)
+
+        if not conflict:
+            self.cxn.copy(f"COPY {name} ({columns}) FROM STDIN", records(df))
+            return len(df)
+
+        # COPY cannot skip rows with a key that is already in the table so the
+        # rows are copied into a temporary table and inserted from there
+        staging = f"_copy_{name}"
+        self.cxn.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+            f"(LIKE {name}) ON COMMIT DELETE ROWS"
+        )
+        self.cxn.copy(f"COPY {staging} ({columns}) FROM STDIN", records(df))
+
+        cursor = self.cxn.execute(
+            f"INSERT INTO {name} ({columns}) "  # noqa: S608
+            f"SELECT {columns} FROM {staging} ORDER BY ctid {conflict}"
+        )
+        return cursor.rowcount
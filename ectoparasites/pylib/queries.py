@@ -0,0 +1,276 @@
+"""Named analysis queries, the summary tables they read, and a result cache.
+
+Summary tables hold the joins and counts that analyses share. They are built at
+the end of an ingest. Each one is kept with a rows table that has its counts for
+each key of the tables it summarizes, so a later ingest only recounts the groups
+that the keys it changed were in or are now in. Every ingest that changes data
+also bumps the database version, so query results can be cached until the data
+changes.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
+from . import backends
+from . import catalog
+
+SUMMARY_PREFIX = "summary_"
+ROWS_SUFFIX = "_rows"
+
+# Bumped by every ingest that changes the data
+VERSION = "ingest_version"
+
+CACHE_SIZE = 256  # Query results kept in memory
+
+# Filter values given as text are converted to their column's type, PostgreSQL
+# does not compare numbers to text
+CONVERTERS = {"int": int, "numeric": float, "numerical": float}
+
+# Rebuild a summary instead of updating it when an ingest changed more than
+# this share of its keys
+REBUILD_SHARE = 0.25
+
+
+@dataclass
+class Summary:
+    name: str
+    tables: dict[str, list[str]]  # The tables it summarizes -> their key columns
+    key: dict[str, str]  # Rows table key column -> its expression in the SQL
+    groups: dict[str, str]  # Group column -> the table it comes from
+    totals: list[str]  # Counts added up over a group's rows
+    sql: str  # Counts for each key and group, {where} picks keys
+
+    @property
+    def table(self):
+        return f"{SUMMARY_PREFIX}{self.name}"
+
+    @property
+    def rows_table(self):
+        return f"{self.table}{ROWS_SUFFIX}"
+
+    def totals_sql(self, where=""):
+        groups = ", ".join(self.groups)
+        totals = ", ".join(f"sum({t}) AS {t}" for t in self.totals)
+        return f"""SELECT {groups}, {totals} FROM {self.rows_table}
+            {where} GROUP BY {groups}"""  # noqa: S608
+
+
+@dataclass
+class Query:
+    description: str
+    sql: str  # {where} is replaced with a WHERE clause for the filters used
+    filters: list[str]  # Summary columns the query can be filtered on
+
+
+SUMMARIES = [
+    # Captures checked for ectoparasites and how many had them, with the
+    # species, site, and year each capture's band and ID were recorded with
+    Summary(
+        "prevalence",
+        tables={
+            "ectos": ["id", "band"],
+            "taxonomy": ["capture_id", "band"],
+            "site": ["capture_id", "band"],
+            "date": ["capture_id", "band"],
+        },
+        key={"capture_id": "e.id", "band": "e.band"},
+        groups={"species": "taxonomy", "site": "site", "year": "date"},
+        totals=["captures", "positive"],
+        sql="""SELECT e.id AS capture_id, e.band, t.species, s.site, d.year,
+                count(e.ectos) AS captures,
+                sum(CASE WHEN e.ectos THEN 1 ELSE 0 END) AS positive
+            FROM ectos AS e
+            LEFT JOIN taxonomy AS t ON t.capture_id = e.id AND t.band = e.band
+            LEFT JOIN site AS s ON s.capture_id = e.id AND s.band = e.band
+            LEFT JOIN date AS d ON d.capture_id = e.id AND d.band = e.band
+            {where}
+            GROUP BY e.id, e.band, t.species, s.site, d.year""",
+    ),
+]
+
+PREVALENCE = """SELECT {groups},
+        sum(captures) AS captures,
+        sum(positive) AS positive,
+        1.0 * sum(positive) / NULLIF(sum(captures), 0) AS prevalence
+    FROM summary_prevalence
+    {where}
+    GROUP BY {groups}
+    ORDER BY {groups}"""
+
+QUERIES = {
+    "prevalence": Query(
+        "Share of captures with ectoparasites by species, site, and year",
+        PREVALENCE.replace("{groups}", "species, site, year"),
+        ["species", "site", "year"],
+    ),
+    "prevalence_by_species": Query(
+        "Share of captures with ectoparasites by species",
+        PREVALENCE.replace("{groups}", "species"),
+        ["site", "year"],
+    ),
+    "prevalence_by_site": Query(
+        "Share of captures with ectoparasites by site",
+        PREVALENCE.replace("{groups}", "site"),
+        ["species", "year"],
+    ),
+    "prevalence_by_year": Query(
+        "Share of captures with ectoparasites by year",
+        PREVALENCE.replace("{groups}", "year"),
+        ["species", "site"],
+    ),
+}
+
+
+def refresh(cxn, changed, object_type, keys=None, same="IS NOT DISTINCT FROM"):
+    """Update the summaries of the changed tables and build any that are missing.
+
+    object_type: Gets "table", "view", or None for a name in the database.
+    keys: {table: key values} of the rows the ingest added, changed, or removed
+        for the changed tables. The summaries of a table without them are rebuilt.
+    same: The operator that compares values with NULLs matching NULLs.
+    Returns the names of the refreshed summaries.
+    """
+    cxn.execute(f"CREATE TABLE IF NOT EXISTS {VERSION} (version INTEGER)")
+    keys = keys or {}
+    stale = [
+        s
+        for s in SUMMARIES
+        if changed & s.tables.keys()
+        or not object_type(s.table)
+        or not object_type(s.rows_table)
+    ]
+
+    cxn.execute("BEGIN")
+    try:
+        if not cxn.execute(f"SELECT version FROM {VERSION}").fetchone():  # noqa: S608
+            cxn.execute(f"INSERT INTO {VERSION} VALUES (0)")  # noqa: S608
+        if changed:
+            cxn.execute(f"UPDATE {VERSION} SET version = version + 1")  # noqa: S608
+        for summary in stale:
+            found = changed_keys(cxn, summary, changed, keys, object_type)
+            if found is not None:
+                update(cxn, summary, found, same)
+            else:
+                rebuild(cxn, summary)
+    except Exception:
+        cxn.execute("ROLLBACK")
+        raise
+    cxn.execute("COMMIT")
+
+    return [s.name for s in stale]
+
+
+def changed_keys(cxn, summary, changed, keys, object_type):
+    """Get the keys to update a summary with, or None if it must be rebuilt."""
+    if not (object_type(summary.table) and object_type(summary.rows_table)):
+        return None
+    tables = changed & summary.tables.keys()
+    if any(t not in keys for t in tables):
+        return None
+    found = set().union(*(keys[t] for t in tables))
+    sql = f"SELECT count(*) FROM {summary.rows_table}"  # noqa: S608
+    count = cxn.execute(sql).fetchone()[0]
+    return None if len(found) > count * REBUILD_SHARE else list(found)
+
+
+def rebuild(cxn, summary):
+    for name in (summary.table, summary.rows_table):
+        cxn.execute(f"DROP TABLE IF EXISTS {name}")
+    rows, table = summary.rows_table, summary.table
+    key, groups = ", ".join(summary.key), ", ".join(summary.groups)
+    cxn.execute(f"CREATE TABLE {rows} AS {summary.sql.format(where='')}")
+    cxn.execute(f"CREATE INDEX {rows}_key ON {rows} ({key})")
+    cxn.execute(f"CREATE TABLE {table} AS {summary.totals_sql()}")
+    cxn.execute(f"CREATE INDEX {table}_groups ON {table} ({groups})")
+
+
+def update(cxn, summary, keys, same):
+    """Recount the keys and the groups they were in or are now in."""
+    rows, groups = summary.rows_table, ", ".join(summary.groups)
+    match = " AND ".join(f"{c} {same} ?" for c in summary.key)
+    in_groups = f"SELECT DISTINCT {groups} FROM {rows} WHERE {match}"  # noqa: S608
+
+    found = set()
+    for key in keys:
+        found.update(cxn.execute(in_groups, key).fetchall())
+    cxn.executemany(f"DELETE FROM {rows} WHERE {match}", keys)  # noqa: S608
+    where = " AND ".join(f"{e} {same} ?" for e in summary.key.values())
+    sql = summary.sql.format(where=f"WHERE {where}")
+    cxn.executemany(f"INSERT INTO {rows} {sql}", keys)
+    for key in keys:
+        found.update(cxn.execute(in_groups, key).fetchall())
+
+    found = [tuple(g) for g in found]
+    match = " AND ".join(f"{g} {same} ?" for g in summary.groups)
+    cxn.executemany(f"DELETE FROM {summary.table} WHERE {match}", found)  # noqa: S608
+    sql = summary.totals_sql(f"WHERE {match}")
+    cxn.executemany(f"INSERT INTO {summary.table} {sql}", found)
+
+
+def current_version(cxn):
+    """Get the database version, once an ingest has made the version table."""
+    return cxn.execute(f"SELECT version FROM {VERSION}").fetchone()[0]  # noqa: S608
+
+
+def column_types():
+    """Get the type of each summary group column in the table it comes from."""
+    schema = catalog.load()["schema"]
+    return {c: schema[t][c] for s in SUMMARIES for c, t in s.groups.items()}
+
+
+class Analyses:
+    """Run the named queries on a database, keeping recent results in memory.
+
+    Results are cached by query, filters, and database version so they are
+    reused until an ingest changes the data.
+    """
+
+    def __init__(self, db, backend="sqlite", cache_size=CACHE_SIZE):
+        self.backend = backend
+        self.cxn = backends.connect(backend, db)
+        self.fetch = lru_cache(maxsize=cache_size)(self.fetch_rows)
+        self.types = column_types()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.cxn.close()
+
+    def run(self, name, **filters):
+        """Get a query's rows as dicts. Filters match summary column values."""
+        if name not in QUERIES:
+            raise ValueError(f"Unknown query {name}, use one of: {', '.join(QUERIES)}")
+        if unknown := filters.keys() - set(QUERIES[name].filters):
+            raise ValueError(f"{name} cannot be filtered on: {', '.join(unknown)}")
+
+        filters = tuple(sorted((c, self.convert(c, v)) for c, v in filters.items()))
+        columns, rows = self.fetch(name, filters, self.version())
+        return [dict(zip(columns, row, strict=True)) for row in rows]
+
+    def convert(self, column, value):
+        """Convert a filter value given as text to its column's type."""
+        convert = CONVERTERS.get(self.types.get(column))
+        if not convert or not isinstance(value, str):
+            return value
+        try:
+            return convert(value)
+        except ValueError:
+            kind = self.types[column]
+            raise ValueError(f"{column} is {kind}, it cannot be {value!r}") from None
+
+    def version(self):
+        """Get the database version, None before the first ingest finishes."""
+        if VERSION not in backends.table_names(self.cxn, self.backend):
+            return None
+        return current_version(self.cxn)
+
+    def fetch_rows(self, name, filters, version):
+        """Run a query. The version is only used to key the cache."""
+        where = " AND ".join(f'"{c}" = ?' for c, _ in filters)
+        sql = QUERIES[name].sql.format(where=f"WHERE {where}" if where else "")
+        cursor = self.cxn.execute(sql, [v for _, v in filters])
+        columns = [d[0] for d in cursor.description]
+        return columns, tuple(tuple(r) for r in cursor.fetchall())
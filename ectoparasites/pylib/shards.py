@@ -0,0 +1,286 @@
+"""Ingest each subdirectory into its own SQLite shard and merge shards into one DB.
+
+Shards are built in parallel processes and a shard that fails does not stop the
+others. Merging attaches each shard to the master database and copies every
+file's rows with one INSERT ... SELECT per table. Rows with the natural key of
+a row already in the master are dropped or update it, like an ingest, and rows
+missing part of their key are dropped when the master has a row with the same
+values. Tables without a natural key are only deduplicated within each shard.
+Files are tracked in the master's manifest, so merging a rebuilt shard again
+only copies the files that changed in it and replaces their old rows. Files that
+shared rows with a changed file are copied again too, so each shared row comes
+from the same file it would after a fresh merge.
+"""
+import argparse
+import logging
+import sqlite3
+import zipfile
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from xml.etree.ElementTree import ParseError
+
+from openpyxl.utils.exceptions import InvalidFileException
+
+from . import manifest
+from . import pipeline
+from . import pool
+from . import sheets
+from . import timings
+from . import writer
+from .manifest import Source
+
+LOGGER = logging.getLogger(__name__)
+
+SUFFIX = ".sqlite"
+
+SHARD = "shard"  # What a shard is attached as
+
+# What a shard's ingest fails with when its files or database are bad, the other
+# shards still go on
+FAILURES = (
+    sqlite3.Error,
+    OSError,
+    ValueError,  # Also bad CSVs, pandas parser errors are value errors
+    TypeError,
+    KeyError,  # A workbook part that is missing
+    zipfile.BadZipFile,
+    InvalidFileException,
+    ParseError,
+    BrokenProcessPool,
+)
+
+
+def run(args):
+    """Ingest each directory of CSVs into a shard. Returns the failed shards."""
+    jobs = shard_dirs(args.csv_dir)
+    args.shard_dir.mkdir(parents=True, exist_ok=True)
+    LOGGER.info(f"Ingesting {len(jobs)} shards into {args.shard_dir}")
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(timings.call, pipeline.run, shard_args(args, n, d)): n
+            for n, d in jobs.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                pool.result(future)
+                LOGGER.info(f"Shard {name} done")
+            except FAILURES as err:
+                LOGGER.error(f"Shard {name} failed: {err!r}")
+                failed.append(name)
+    return sorted(failed)
+
+
+def shard_dirs(csv_dir):
+    """Get {shard name: directory} for the directory and each one in it with data.
+
+    CSVs at the top of the directory go into a shard named after the directory,
+    with _top added if a directory in it has the same name.
+    """
+    dirs = {d.name: d for d in sorted(p for p in csv_dir.iterdir() if p.is_dir())}
+    top = csv_dir.name
+    while top in dirs:
+        top += "_top"
+    dirs = {top: csv_dir} | dirs
+    return {n: d for n, d in dirs.items() if sheets.csv_paths(d)}
+
+
+def shard_args(args, name, csv_dir):
+    """Ingest a shard with the same options, serially in its own process."""
+    return argparse.Namespace(
+        **vars(args)
+        | {
+            "db": str(args.shard_dir / f"{name}{SUFFIX}"),
+            "csv_dir": csv_dir,
+            "workers": 1,
+            "command": None,
+        }
+    )
+
+
+def shard_paths(paths):
+    """Get the shard files given as files or as directories of shards."""
+    found = []
+    for path in paths:
+        found += sorted(path.glob(f"*{SUFFIX}")) if path.is_dir() else [path]
+    return found
+
+
+def merge(db, paths, on_conflict="ignore", indexes=True):
+    """Merge the shards into a SQLite database, making it if needed."""
+    with writer.SqliteWriter(db, on_conflict=on_conflict) as master:
+        # A file in several shards is merged from the last one
+        latest = {f[1]: (p, f) for p in paths for f in read_files(master, p)}
+        stale = stale_files(master, latest)
+        for path in paths:
+            files = [f for p, f in latest.values() if p == path and f[1] in stale]
+            with timings.phase("merge", csv=path.stem):
+                merge_shard(master, path, files, stale)
+        if indexes:
+            master.create_indexes()
+        master.summarize()
+
+
+def read_files(master, path):
+    """Get (shard file ID, path, size, mtime, sha256) for the files in a shard."""
+    cxn = master.cxn
+    cxn.execute(f"ATTACH DATABASE ? AS {SHARD}", (str(path),))
+    try:
+        views = cxn.execute(
+            f"SELECT name FROM {SHARD}.sqlite_master WHERE type = 'view'"  # noqa: S608
+        ).fetchall()
+        if views and {v[0] for v in views} & set(master.schema):
+            raise ValueError(f"{path} has normalized tables, only flat shards merge")
+
+        files = cxn.execute(
+            f"""SELECT file_id, path, size, mtime, sha256 FROM {SHARD}.{manifest.FILES}
+                ORDER BY file_id"""  # noqa: S608
+        ).fetchall()
+    finally:
+        cxn.execute(f"DETACH DATABASE {SHARD}")
+
+    for file in files:
+        if file[-1] is None:
+            LOGGER.warning(f"Skipping {file[1]}, it was not fully ingested")
+    return [f for f in files if f[-1] is not None]
+
+
+def stale_files(master, latest):
+    """Get {path: source} for the files to copy into the master.
+
+    latest: {path: (shard, file)} for every file in the shards.
+
+    Rows from older versions of the files are removed from the master, and so
+    are the rows of files that shared rows with them, those files are copied
+    again from their shards.
+    """
+    stale, shared = {}, set()
+    for _, (_, path, *file) in latest.values():
+        if source := master_source(master, path, *file, shared):
+            stale[path] = source
+
+    found = {s.file_id for s in stale.values()}
+    queue = sorted(shared - found)
+    while queue:
+        file_id = queue.pop()
+        if file_id in found:
+            continue
+        found.add(file_id)
+        path = master.manifest.path(file_id)
+        queue += sorted(master.manifest.retract(file_id) - found)
+        if path not in latest:
+            LOGGER.warning(f"Merge the shard with {path}, it shared changed rows")
+            continue
+        _, (_, _, *file) = latest[path]
+        stale[path] = Source(Path(path), *file, file_id=file_id)
+    return stale
+
+
+def merge_shard(master, path, files, stale):
+    """Copy the rows of the given files in a shard."""
+    if not files:
+        return
+    cxn = master.cxn
+    cxn.execute(f"ATTACH DATABASE ? AS {SHARD}", (str(path),))
+    try:
+        for shard_id, file_path, *_ in files:
+            merge_file(master, shard_id, stale[file_path])
+    finally:
+        cxn.execute(f"DETACH DATABASE {SHARD}")
+
+
+def master_source(master, path, size, mtime, sha256, shared):
+    """Get the file in the master, or None if it is already merged.
+
+    Rows an older version of the file added are removed from the master. The
+    IDs of files that shared rows with it are added to shared.
+    """
+    sql = f"SELECT file_id, sha256 FROM {manifest.FILES} WHERE path = ?"  # noqa: S608
+    old = master.cxn.execute(sql, (path,)).fetchone()
+    source = Source(Path(path), size, mtime, sha256)
+
+    if old and old[1] == sha256:
+        return None
+
+    if old:
+        LOGGER.info(f"Retracting rows from changed {source.path.name}")
+        shared |= master.manifest.retract(old[0])
+        source.file_id = old[0]
+    else:
+        source.file_id = master.cxn.execute(
+            f"SELECT coalesce(max(file_id), 0) + 1 FROM {manifest.FILES}"  # noqa: S608
+        ).fetchone()[0]
+        master.cxn.execute(
+            f"INSERT INTO {manifest.FILES} (file_id, path) VALUES (?, ?)",  # noqa: S608
+            (source.file_id, path),
+        )
+    return source
+
+
+def merge_file(master, shard_id, source):
+    """Copy a file's rows and rejects from the shard in one transaction."""
+    cxn = master.cxn
+    ranges = cxn.execute(
+        f"""SELECT table_name, first_rowid, last_rowid FROM {SHARD}.{manifest.ROWS}
+            WHERE file_id = ?""",  # noqa: S608
+        (shard_id,),
+    ).fetchall()
+
+    cxn.execute("BEGIN")
+    try:
+        for name, first, last in ranges:
+            names = ", ".join(f'"{c}"' for c in master.schema[name])
+            conflict = master.conflict_sql(name, master.schema[name])
+            first_rowid = master.max_rowid(name) + 1
+            cxn.execute(
+                f"""INSERT INTO {name} ({names})
+                    SELECT {names} FROM {SHARD}.{name} AS s
+                    WHERE rowid BETWEEN ? AND ? AND {new_sql(master, name)}
+                    ORDER BY rowid {conflict}""",  # noqa: S608
+                (first, last),
+            )
+            if columns := master.manifest.watched.get(name):
+                # Rows the shard has may have updated others in the master
+                names = ", ".join(f'"{c}"' for c in columns)
+                rows = cxn.execute(
+                    f"SELECT {names} FROM {SHARD}.{name} WHERE rowid BETWEEN ? AND ?",  # noqa: S608
+                    (first, last),
+                )
+                master.manifest.note(name, rows.fetchall())
+            # Rows that only updated others were not added to this file's range
+            if (last_rowid := master.max_rowid(name)) >= first_rowid:
+                master.manifest.record(source.file_id, name, first_rowid, last_rowid)
+        cxn.execute(
+            f"""INSERT INTO {manifest.REJECTS}
+                SELECT ?, table_name, line, column_name, value, reason
+                FROM {SHARD}.{manifest.REJECTS} WHERE file_id = ?""",  # noqa: S608
+            (source.file_id, shard_id),
+        )
+        cxn.execute(
+            f"""INSERT INTO {manifest.KEYS}
+                SELECT ?, table_name, key_hash
+                FROM {SHARD}.{manifest.KEYS} WHERE file_id = ?""",  # noqa: S608
+            (source.file_id, shard_id),
+        )
+        master.manifest.done(source)
+    except Exception:
+        cxn.execute("ROLLBACK")
+        raise
+    cxn.execute("COMMIT")
+
+
+def new_sql(master, name):
+    """Build a condition that leaves out rows with a missing key part the master has.
+
+    Their key never conflicts so they are compared on every column, like an ingest
+    drops their repeats.
+    """
+    if not (key := master.keys.get(name)):
+        return "TRUE"
+    missing = " OR ".join(f's."{c}" IS NULL' for c in key)
+    same = " AND ".join(f'm."{c}" IS s."{c}"' for c in master.schema[name])
+    return f"NOT (({missing}) AND EXISTS (SELECT 1 FROM main.{name} AS m WHERE {same}))"  # noqa: S608
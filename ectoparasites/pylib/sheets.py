@@ -0,0 +1,269 @@
+"""Read the sheets in ODS and XLSX workbooks as if each one were a CSV.
+
+XLSX sheets are streamed a row at a time with openpyxl's read-only mode. ODS
+files are loaded with odfpy, which keeps the whole document in memory. Date cells
+are written as ISO dates, or in the date format of the column they fill.
+"""
+import csv
+import datetime
+import logging
+from collections.abc import Iterator
+from dataclasses import dataclass
+from itertools import chain
+from itertools import islice
+
+import openpyxl
+from odf import opendocument
+from odf import teletype
+from odf.namespaces import OFFICENS
+from odf.namespaces import TABLENS
+from odf.namespaces import TEXTNS
+from odf.table import Table
+from odf.table import TableRow
+
+LOGGER = logging.getLogger(__name__)
+
+WORKBOOKS = {".ods", ".xlsx"}
+SUFFIXES = {".csv"} | WORKBOOKS
+
+HEADER_ROWS = 20  # Look for the header in this many rows at the top of a sheet
+
+# ODS cells with these types hold the full value in an attribute, the cell text
+# may be rounded. Date cells use their ISO value, like XLSX dates. Other cells
+# use the text, which is what a CSV export gets.
+ODS_VALUES = {
+    "float": "value",
+    "percentage": "value",
+    "currency": "value",
+    "boolean": "boolean-value",
+}
+
+# Covered cells are hidden by a merged cell
+ODS_CELLS = {(TABLENS, "table-cell"), (TABLENS, "covered-table-cell")}
+ODS_P = (TEXTNS, "p")
+
+
+@dataclass
+class Sheet:
+    name: str  # workbook/sheet
+    header: list[str]
+    line: int  # The header's row number in the sheet
+    rows: Iterator  # Rows after the header, they must be read before the next sheet
+
+
+def csv_paths(csv_dir):
+    """Get the CSVs and workbooks, skipping the lock files spreadsheet apps leave."""
+    return sorted(
+        p
+        for p in csv_dir.iterdir()
+        if p.suffix in SUFFIXES and not p.name.startswith(("~$", ".~lock"))
+    )
+
+
+def csv_header(path):
+    """Get a CSV's column names with the csv module, it is much quicker to load."""
+    with path.open(newline="", encoding="utf-8-sig") as in_file:
+        return next(csv.reader(in_file), [])
+
+
+def is_workbook(path):
+    return path.suffix in WORKBOOKS
+
+
+def read(path, index):
+    """Get every sheet in a workbook that has a header in the alias index."""
+    reader = read_ods if path.suffix == ".ods" else read_xlsx
+    for title, rows in reader(path):
+        name = f"{path.stem}/{title}".lower()
+        if sheet := find_header(name, rows, index):
+            yield sheet
+        else:
+            LOGGER.info(f"Skipping {name}: no header in the first {HEADER_ROWS} rows")
+
+
+def find_header(name, rows, index):
+    """Find the header row with the alias index, there may be notes above it.
+
+    The header is the row that names the most known CSV columns and fills at
+    least one table.
+    """
+    top = list(islice(rows, HEADER_ROWS))
+    best, most = None, 0
+    for i, row in enumerate(top):
+        columns = index.resolve(row, fuzzy=False).keys()
+        known = index.count(columns)
+        if known > most and index.match(columns):
+            best, most = i, known
+
+    if best is None:
+        return None
+
+    header = [c or "" for c in top[best]]
+    return Sheet(name, header, best + 1, chain(top[best + 1 :], rows))
+
+
+def chunks(sheet, columns, chunksize=None, date_formats=None):
+    """Get (index, {column: values}) chunks of a sheet's rows for only the columns.
+
+    The index counts rows like a CSV's data frame index so it gives a row's line
+    in the sheet. Empty rows are skipped. Without a chunksize it is one chunk.
+    Date cells in the columns of date_formats, {column: strftime format}, are
+    written in that format.
+    """
+    date_formats = date_formats or {}
+    positions = {}
+    for i, column in enumerate(sheet.header):
+        if column in columns:
+            positions.setdefault(column, i)
+
+    # Data frame indexes start at 0 on the line after a CSV's header
+    line = sheet.line - 1
+    index, data = [], {c: [] for c in positions}
+    for row in sheet.rows:
+        if any(row):
+            index.append(line)
+            for column, i in positions.items():
+                data[column].append(row[i] if i < len(row) else None)
+        line += 1
+        if chunksize and len(index) >= chunksize:
+            yield index, format_dates(data, date_formats)
+            index, data = [], {c: [] for c in positions}
+
+    if index or not chunksize:
+        yield index, format_dates(data, date_formats)
+
+
+def format_dates(data, date_formats):
+    """Write the date cells of the columns with a date format in that format."""
+    for column, date_format in date_formats.items():
+        if column in data:
+            data[column] = [
+                v.value.strftime(date_format) if isinstance(v, DateText) else v
+                for v in data[column]
+            ]
+    return data
+
+
+def expand(items):
+    """Get the rows from (cells, repeat) items.
+
+    Sheets often end with a huge number of repeated empty rows, these are only
+    expanded when there is data after them.
+    """
+    empty = 0
+    for cells, repeat in items:
+        if not cells:
+            empty += repeat
+            continue
+        for _ in range(empty):
+            yield []
+        empty = 0
+        for _ in range(repeat):
+            yield list(cells)
+
+
+def read_ods(path):
+    """Get (sheet name, rows) for each sheet in an ODS file."""
+    doc = opendocument.load(str(path))
+    if not hasattr(doc, "spreadsheet"):  # Bad XML is read as an empty document
+        raise ValueError(f"{path.name} has no spreadsheet in it")
+    for table in doc.spreadsheet.getElementsByType(Table):
+        rows = table.getElementsByType(TableRow)
+        yield table.getAttribute("name"), expand(ods_row(r) for r in rows)
+
+
+def ods_row(row):
+    """Get (cells, repeat) for an ODS row, trailing empty cells are dropped."""
+    cells, empty = [], 0
+    for cell in row.childNodes:
+        if cell.qname not in ODS_CELLS:
+            continue
+        value = ods_value(cell)
+        repeat = int(cell.attributes.get((TABLENS, "number-columns-repeated"), 1))
+        if value is None:
+            empty += repeat
+            continue
+        cells += [None] * empty + [value] * repeat
+        empty = 0
+    return cells, int(row.attributes.get((TABLENS, "number-rows-repeated"), 1))
+
+
+def ods_value(cell):
+    attrs = cell.attributes
+    kind = attrs.get((OFFICENS, "value-type"))
+    if attr := ODS_VALUES.get(kind):
+        return cell_text(attrs.get((OFFICENS, attr)))
+    if kind == "date" and (date := ods_date(attrs.get((OFFICENS, "date-value")))):
+        return cell_text(date)
+    # Comments on a cell are not in its paragraphs
+    lines = [teletype.extractText(p) for p in cell.childNodes if p.qname == ODS_P]
+    return cell_text("\n".join(lines))
+
+
+def ods_date(value):
+    """Parse an ODS date value, or get None if it is not an ISO date."""
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_xlsx(path):
+    """Get (sheet name, rows) for each worksheet in an XLSX file.
+
+    Formulas have the value they had when the workbook was saved.
+    """
+    book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in book.worksheets:  # Chart sheets have no cells
+            # Some apps save the wrong size, without it rows are not padded to it
+            sheet.reset_dimensions()
+            rows = sheet.iter_rows(values_only=True)
+            yield sheet.title, expand((xlsx_row(r), 1) for r in rows)
+    finally:
+        book.close()
+
+
+def xlsx_row(row):
+    """Get the text of an XLSX row's cells, trailing empty cells are dropped."""
+    cells = [xlsx_value(v) for v in row]
+    while cells and cells[-1] is None:
+        cells.pop()
+    return cells
+
+
+def xlsx_value(value):
+    match value:
+        case bool():
+            return "TRUE" if value else "FALSE"
+        case int() | float() | datetime.timedelta():
+            return str(value)
+        case _:
+            return cell_text(value)
+
+
+class DateText(str):
+    """A date cell's ISO text, keeping the date to write it in other formats."""
+
+    value: datetime.datetime
+
+    def __new__(cls, value):
+        if value.time() == datetime.time():
+            text = super().__new__(cls, value.date().isoformat())
+        else:
+            text = super().__new__(cls, value.isoformat(sep=" "))
+        text.value = value
+        return text
+
+
+def cell_text(value):
+    """Write a cell value the way it would be in a CSV."""
+    match value:
+        case None | "":
+            return None
+        case datetime.datetime():
+            return DateText(value)
+        case datetime.time():
+            return value.isoformat()
+        case _:
+            return value
@@ -0,0 +1,81 @@
+"""Run the read, transform, and write stages of a streaming ingest at once.
+
+Each stage is an asyncio task and the stages are joined by bounded queues. A
+stage waits while the queue after it is full, so only a few chunks are held in
+memory however big the input is. The blocking work runs in threads, or in the
+process pool for transforms, so reading the next chunk overlaps with casting
+and writing the ones before it.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from . import pool
+from . import timings
+
+DEPTH = 4  # Items each stage may get ahead of the next one
+
+DONE = object()  # Put on a queue after the last item
+
+
+def run(items, transform, write, executor=None, depth=DEPTH):
+    """Transform and write the items from a blocking iterator in order.
+
+    The iterator is always read in the same thread and the writes are all done
+    in one other thread, one at a time, so neither needs to be thread safe.
+    Without a process pool the transforms are done in a third thread.
+    """
+    try:
+        asyncio.run(stages(items, transform, write, executor, depth))
+    except ExceptionGroup as group:
+        # Only one stage fails, the others are cancelled
+        raise group.exceptions[0] from None
+
+
+async def stages(items, transform, write, executor, depth):
+    read_queue = asyncio.Queue(depth)
+    write_queue = asyncio.Queue(depth)
+    with (
+        ThreadPoolExecutor(1, thread_name_prefix="read") as reader,
+        ThreadPoolExecutor(1, thread_name_prefix="transform") as transformer,
+        ThreadPoolExecutor(1, thread_name_prefix="write") as writer,
+    ):
+        in_process = executor is not None
+        transformer = executor or transformer
+
+        # A failed stage cancels the others so none are left waiting on a queue
+        async with asyncio.TaskGroup() as group:
+            group.create_task(read_stage(items, read_queue, reader))
+            group.create_task(
+                transform_stage(
+                    transform, read_queue, write_queue, transformer, in_process
+                )
+            )
+            group.create_task(write_stage(write, write_queue, writer, in_process))
+
+
+async def read_stage(items, outbox, reader):
+    loop = asyncio.get_running_loop()
+    items = iter(items)
+    while (item := await loop.run_in_executor(reader, next, items, DONE)) is not DONE:
+        await outbox.put(item)
+    await outbox.put(DONE)
+
+
+async def transform_stage(func, inbox, outbox, executor, in_process):
+    """Start each transform and pass its future on, so a pool runs several."""
+    while (item := await inbox.get()) is not DONE:
+        if in_process:
+            future = executor.submit(timings.call, func, item)
+        else:
+            future = executor.submit(func, item)
+        await outbox.put(future)
+    await outbox.put(DONE)
+
+
+async def write_stage(func, inbox, writer, in_process):
+    """Write the transformed items in the order they were read."""
+    loop = asyncio.get_running_loop()
+    while (future := await inbox.get()) is not DONE:
+        await asyncio.wrap_future(future)
+        item = pool.result(future) if in_process else future.result()
+        await loop.run_in_executor(writer, func, item)
@@ -0,0 +1,105 @@
+"""An on-disk cache of parsed CSVs stored as Arrow IPC files.
+
+Getting a cached CSV skips parsing it. The file is memory mapped and only the
+columns that are needed are converted to pandas. Columns pandas can use as they
+are, like floats with no missing values, stay in the mapped file and the others
+are copied.
+"""
+import hashlib
+import json
+import logging
+import os
+from contextlib import suppress
+
+import pyarrow as pa
+
+LOGGER = logging.getLogger(__name__)
+
+# Change this when the format of the cached data changes
+VERSION = 3
+
+DTYPES = b"ingest_dtypes"  # Schema metadata, the parse dtype of each column
+
+
+class StagingCache:
+    def __init__(self, cache_dir, max_mb=2048):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 2**20
+
+    def key(self, sha256, sheet="", date_formats=None):
+        """Cache keys depend on the file contents.
+
+        Sheets also depend on the date formats their date cells are written in.
+        The columns and how they were parsed are checked when getting the data.
+        """
+        plan = [VERSION, sha256]
+        if sheet:
+            plan += [sheet, sorted((date_formats or {}).items())]
+        return hashlib.sha256(json.dumps(plan).encode()).hexdigest()
+
+    def path(self, key):
+        return self.cache_dir / f"{key}.arrow"
+
+    def get(self, key, dtypes):
+        """Get the columns in {CSV column: parse dtype} from the cache.
+
+        Returns None if the cache does not have all of them parsed as those dtypes.
+        """
+        path = self.path(key)
+        try:
+            with pa.memory_map(str(path)) as source:
+                table = pa.ipc.open_file(source).read_all()
+            os.utime(path)  # Mark as recently used
+        except (OSError, pa.ArrowInvalid):
+            return None
+
+        cached = json.loads(table.schema.metadata.get(DTYPES, b"{}"))
+        if any(cached.get(c) != d for c, d in dtypes.items()):
+            return None
+        index = table.schema.pandas_metadata["index_columns"]
+        columns = [*dtypes, *(c for c in index if isinstance(c, str))]
+        return table.select(columns).to_pandas(split_blocks=True)
+
+    def put(self, key, df, dtypes):
+        """Cache the columns of a data frame, parsed as {CSV column: parse dtype}.
+
+        A cache directory we cannot write to just goes without it.
+        """
+        path = self.path(key)
+        temp = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as err:
+            LOGGER.warning(f"Not caching {key}: {err}")
+            return
+        metadata = table.schema.metadata | {DTYPES: json.dumps(dtypes).encode()}
+        table = table.replace_schema_metadata(metadata)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with pa.OSFile(str(temp), "wb") as sink, pa.ipc.new_file(
+                sink, table.schema
+            ) as writer:
+                writer.write_table(table)
+            temp.replace(path)
+            self.evict()
+        except OSError as err:
+            LOGGER.warning(f"Not caching {key}: {err}")
+            with suppress(OSError):  # The directory may not be there
+                temp.unlink()
+
+    def evict(self):
+        """Remove the least recently used files until the cache fits its size cap."""
+        files = []
+        for path in self.cache_dir.glob("*.arrow"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Another process evicted it
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
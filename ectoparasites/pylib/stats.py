@@ -0,0 +1,39 @@
+"""Count what has been loaded into a database without loading the ingest code."""
+from . import backends
+from .manifest import COERCED
+from .manifest import FILES
+from .manifest import REJECTS
+
+
+def summary(backend, db, names):
+    """Count the rows in each table, the ingested files, rejects, and missing cells.
+
+    names: The tables to count, the ones not in the database are left out.
+    """
+    cxn = backends.connect(backend, db)
+    try:
+        found = backends.table_names(cxn, backend)
+        # The table names are from TABLES and the manifest, so they are safe to
+        # put in the SQL
+        rows = {}
+        for name in names:
+            if name in found:
+                rows[name] = count(cxn, f"SELECT count(*) FROM {name}")  # noqa: S608
+
+        files, rejects, missing = 0, {}, {}
+        if FILES in found:
+            sql = f"SELECT count(*) FROM {FILES} WHERE sha256 IS NOT NULL"  # noqa: S608
+            files = count(cxn, sql)
+        if REJECTS in found:
+            sql = f"""SELECT table_name, reason LIKE '%{COERCED}', count(*)
+                FROM {REJECTS} GROUP BY 1, 2"""  # noqa: S608
+            for name, coerced, total in cxn.execute(sql).fetchall():
+                (missing if coerced else rejects)[name] = total
+    finally:
+        cxn.close()
+
+    return {"tables": rows, "files": files, "rejects": rejects, "missing": missing}
+
+
+def count(cxn, sql):
+    return cxn.execute(sql).fetchone()[0]
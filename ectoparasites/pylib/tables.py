@@ -1,17 +1,27 @@
 from dataclasses import dataclass
-from itertools import product
 
+from .headers import normalize
+
+# Pandas dtypes for each column type. They are all nullable and categoricals
+# keep each distinct value only once
 SQLITE_TYPE = {
-    "categorical": "string",
-    "int": "int32",
-    "numeric": "float32",
-    "numerical": "float32",
+    "categorical": "category",
+    "int": "Int32",
+    "numeric": "Float32",
+    "numerical": "Float32",
     "date": "string",
     "text":  "string",
     "time":  "string",
     "y/n": "boolean",
 }
 
+# How y/n values are spelled, in any case
+YES = ["y", "yes", "t", "true", "1"]
+NO = ["n", "no", "f", "false", "0"]
+
+# Bird banding sex codes: male, female, unknown, and not examined
+SEXES = ["M", "F", "U", "X"]
+
 
 @dataclass
 class Column:
@@ -19,37 +29,63 @@ class Column:
     type: str
     csv: list[str]  # If a column is optional add a None entry in this list
 
+    # Validation rules, rows that break them are rejected
+    low: float | None = None  # Smallest allowed value
+    high: float | None = None  # Largest allowed value
+    allowed: list[str] | None = None  # The only values allowed, in any case
+    date_format: str | None = None  # A strptime format the values must match
+
+    # Values are stored once in this lookup table when normalizing the database
+    dimension: str | None = None
+
 
 class Table:
-    def __init(self, name, columns):
+    def __init__(self, name, columns, key=None, indexes=None):
         self.name: str = name
         self.columns: list[Column] = columns
+        self.key: list[str] = key or []  # Natural key for deduplicating rows
+
+        # Column lists to index after loading. None indexes the join keys
+        self.indexes: list[list[str]] | None = indexes
 
-        self.renames = {}
+        # A column name may be repeated in a table, the first one wins
         self.types = {}
         for col in self.columns:
-            for csv_field in [c for c in col.csv if c]:
-                self.renames[csv_field] = col.name
-                self.types[csv_field] = col.type
+            self.types.setdefault(col.name, col.type)
 
+        self.names = list(self.types.keys())
 
-    def csv_permutations(self):
-        options = [c.csv for c in self.columns]
-        col_sets = [[c for c in p if c] for p in product(*options)]
-        # We want as many columns as possible so try the longer lists first
-        col_sets = sorted(col_sets, key=lambda s: len(s), reverse=True)
-        return col_sets
+    def match(self, csv_columns):
+        """Map database columns to the normalized CSV columns that will fill them.
 
-    def renames(self, csv_fields):
-        return {f: self.rename[f] for f in csv_fields}
+        Each database column is resolved on its own by taking the first of its CSV
+        aliases found in the CSV. This finds the same maximal match as trying every
+        combination of aliases but in time linear in the number of columns.
+        Returns None if a required column is not in the CSV.
+        """
+        mapping = {}
+        for col in self.columns:
+            aliases = (normalize(c) for c in col.csv if c)
+            alias = next((c for c in aliases if c in csv_columns), None)
+            if alias:
+                mapping.setdefault(col.name, alias)
+            elif None not in col.csv:
+                return None
+        return mapping
 
-    def sqlite_types(self, csv_fields):
-        return {f: SQLITE_TYPE[self.types[f]] for f in csv_fields}
+    def missing(self, csv_columns):
+        """Get the required CSV columns that are not in the CSV."""
+        return {
+            col.csv[0]
+            for col in self.columns
+            if None not in col.csv
+            and not any(normalize(c) in csv_columns for c in col.csv)
+        }
 
-    def missing_columns(self, csv_fields):
-        hits = set(self.renames(csv_fields).values())
-        missing = [c.name for c in self.columns if c not in hits]
-        return missing
+    def sqlite_types(self, names):
+        return {
+            n: SQLITE_TYPE[self.types[n]] for n in names if self.types[n] in SQLITE_TYPE
+        }
 
 
 TABLES = [
@@ -60,28 +96,46 @@ TABLES = [
             name="species",
             type="text",
             csv=["species", "bird species", "specie", "bird_specie"],
+            dimension="species",
         ),
+        # Summaries join on the key and read the species, this index covers that
+    ], key=["capture_id", "band"], indexes=[
+        ["capture_id", "band", "species"], ["band"], ["taxon_id"],
     ]),
     Table("gps", [
-        Column(name="site", type="categorical", csv=["site"]),
-        Column(name="location", type="categorical", csv=["location", "localidad"]),
-        Column(name="latitude", type="numeric", csv=["lat"]),
-        Column(name="longitude", type="numeric", csv=["lon"]),
-        Column(name="altitude", type="numeric", csv=["ele"]),
-    ]),
+        Column(name="site", type="categorical", csv=["site"], dimension="site"),
+        Column(
+            name="location",
+            type="categorical",
+            csv=["location", "localidad"],
+            dimension="location",
+        ),
+        Column(name="latitude", type="numeric", csv=["lat"], low=-90, high=90),
+        Column(name="longitude", type="numeric", csv=["lon"], low=-180, high=180),
+        Column(name="altitude", type="numeric", csv=["ele"], low=-500, high=9000),
+    ], key=["site", "location"]),
     Table("site", [
         Column(name="capture_id", type="categorical", csv=["id"]),
         Column(name="band", type="categorical", csv=["band"]),
-        Column(name="site", type="categorical", csv=["site"]),
-        Column(name="location", type="categorical", csv=["location", "localidad"]),
+        Column(name="site", type="categorical", csv=["site"], dimension="site"),
+        Column(
+            name="location",
+            type="categorical",
+            csv=["location", "localidad"],
+            dimension="location",
+        ),
+        # Summaries join on the key and read the site, this index covers that
+    ], key=["capture_id", "band"], indexes=[
+        ["capture_id", "band", "site"], ["band"], ["site"], ["location"], ["site_id"],
     ]),
     Table("date", [
         Column(name="capture_id", type="categorical", csv=["id"]),
         Column(name="band", type="categorical", csv=["band"]),
-        Column(name="day", type="int", csv=["day"]),
+        Column(name="day", type="int", csv=["day"], low=1, high=31),
         Column(name="month", type="text", csv=["month"]),
-        Column(name="year", type="int", csv=["year"]),
-    ]),
+        Column(name="year", type="int", csv=["year"], low=1900, high=2100),
+        # Summaries join on the key and read the year, this index covers that
+    ], key=["capture_id", "band"], indexes=[["capture_id", "band", "year"], ["band"]]),
     Table("bird_quantitative", [
         Column(name="capture_id", type="categorical", csv=["id"]),
         Column(name="band", type="categorical", csv=["band"]),
@@ -99,13 +153,13 @@ TABLES = [
         Column(name="re", type="numerical", csv=["re"]),
         Column(name="wing", type="numerical", csv=["ala"]),
         Column(name="p_s", type="numerical", csv=["p-s"]),
-    ]),
+    ], key=["capture_id", "band"]),
     Table("bird_categorical", [
         Column(name="capture_id", type="categorical", csv=["id"]),
         Column(name="band", type="categorical", csv=["band"]),
         Column(name="age", type="categorical", csv=["age"]),
         Column(name="how_aged", type="categorical", csv=["how aged"]),
-        Column(name="sex", type="categorical", csv=["sex"]),
+        Column(name="sex", type="categorical", csv=["sex"], allowed=SEXES),
         Column(name="how_sexed", type="categorical", csv=["how sexed"]),
         Column(name="reproduction", type="categorical", csv=["rep", "rep."]),
         Column(name="fat", type="categorical", csv=["fat"]),
@@ -120,7 +174,7 @@ TABLES = [
         Column(name="orbital_color", type="categorical", csv=["orbital color"]),
         Column(name="skull", type="categorical", csv=["skull"]),
         Column(name="notes", type="categorical", csv=["notes", "observaciones"]),
-    ]),
+    ], key=["capture_id", "band"]),
     Table("bird_samples", [
         Column(name="capture_id", type="categorical", csv=["id"]),
         Column(name="band", type="categorical", csv=["band"]),
@@ -129,21 +183,26 @@ TABLES = [
         Column(name="feather", type="y/n", csv=["feather"]),
         Column(name="collect_number", type="numerical", csv=["num_colecta"]),
         Column(name="photo", type="y/n", csv=["photo#", "photo"]),
-    ]),
+    ], key=["capture_id", "band"]),
     Table("bird_band", [
         Column(name="capture_id", type="categorical", csv=["id"]),
         Column(name="band", type="categorical", csv=["band"]),
         Column(name="ring_color", type="categorical", csv=["color_anillo"]),
-        Column(name="bander", type="text", csv=["anillador"]),
+        Column(name="bander", type="text", csv=["anillador"], dimension="person"),
         Column(name="banding_day", type="categorical", csv=["banding day"]),
-    ]),
+    ], key=["capture_id", "band"]),
     Table("net_location", [
        Column(name="capture_id", type="categorical", csv=["id"]),
        Column(name="band", type="categorical", csv=["band"]),
-       Column(name="site", type="categorical", csv=["site"]),
-       Column(name="location", type="categorical", csv=["location"]),
+       Column(name="site", type="categorical", csv=["site"], dimension="site"),
+       Column(
+           name="location",
+           type="categorical",
+           csv=["location"],
+           dimension="location",
+       ),
        Column(name="net_number", type="categorical", csv=["net"]),
-    ]),
+    ], key=["capture_id", "band"]),
     Table("positive_ectos", [
        Column(name="capture_id", type="categorical", csv=["id"]),
        Column(name="box", type="", csv=["box"]),
@@ -168,7 +227,7 @@ TABLES = [
        Column(name="ecto_type", type="categorical", csv=["ecto_type"]),
        Column(name="looked_ectos", type="y/n", csv=["looked_ectos"]),
      Column(name="ectos_technique", type="categorical", csv=["ectos_technique"]),
-    ]),
+    ], key=["id", "band"]),
     Table("dataset", [
        Column(name="dataset_id", type="text", csv=[None]),  # Auto generate?
        Column(name="principle_investigator", type="categorical", csv=[None]), # Literal?
@@ -197,20 +256,20 @@ TABLES = [
        Column(name="longitude", type="numeric", csv=["lon"]),
        Column(name="elevation", type="numeric", csv=["ele"]),
        Column(name="elevation_source", type="text", csv=[None]),
-    ]),
+    ], key=["location_id"]),
     Table("point", [
         Column(name="point_id", type="text", csv=["point_id"]),
         Column(name="point_name", type="text", csv=["point", None]),
         Column(name="location_id", type="text", csv=["location_id"]),
         Column(name="site_id", type="text", csv=["site_id", "site"]),
         Column(name="net_number", type="numeric", csv=["net", None]),
-        Column(name="latitude", type="numeric", csv=[
+        Column(name="latitude", type="numeric", low=-90, high=90, csv=[
             "decimallatitude", "point_latitude", "lat"
         ]),
-        Column(name="longitude", type="numeric", csv=[
+        Column(name="longitude", type="numeric", low=-180, high=180, csv=[
             "decimallongitude", "point_longitude", "long"
         ]),
-        Column(name="elevation", type="numeric", csv=[
+        Column(name="elevation", type="numeric", low=-500, high=9000, csv=[
             "elevation_meters", "net_elevation", "elevation"
         ]),
         Column(
@@ -218,7 +277,7 @@ TABLES = [
             type="text",
             csv=["elevation_source", None]
         ),
-    ]),
+    ], key=["point_id"]),
     Table("sample", [
         Column(name="sample_id", type="text", csv=["sample_id"]),
         Column(name="dataset_id", type="text", csv=["dataset_id"]),
@@ -227,15 +286,15 @@ TABLES = [
         Column(name="point_id", type="text", csv=["point_id"]),
         Column(name="data_type", type="text", csv=["data_type"]),
         Column(name="date_", type="text", csv=["day/month/year"]),
-        Column(name="genus_species", type="text", csv=["species"]),
+        Column(name="genus_species", type="text", csv=["species"], dimension="species"),
         Column(name="family", type="text", csv=["family", None]),
         Column(name="taxon_id", type="text", csv=[None]),
-    ]),
+    ], key=["sample_id"]),
     Table("taxonomy", [
         Column(name="taxon_id", type="text", csv=[None]),
-        Column(name="genus_species", type="text", csv=[None]),
+        Column(name="genus_species", type="text", csv=[None], dimension="species"),
         Column(name="genus", type="text", csv=[None]),
-        Column(name="species", type="text", csv=[None]),
+        Column(name="species", type="text", csv=[None], dimension="species"),
         Column(name="species_sacc_2021", type="text", csv=[None]),
         Column(name="species_clements_2022", type="text", csv=[None]),
         Column(name="family", type="text", csv=[None]),
@@ -255,7 +314,7 @@ TABLES = [
         Column(name="fecal", type="y/n", csv=["fecal", None]),
         Column(name="photo", type="y/n", csv=["photo", None]),
         Column(name="recording", type="y/n", csv=["recording", None]),
-    ]),
+    ], key=["sample_id"]),
     Table("raw_data_info", [
         Column(name="sample_id", type="text", csv=["sample_id"]),
         Column(name="dataset_id", type="text", csv=["dataset_id"]),
@@ -296,16 +355,23 @@ TABLES = [
             csv=["nest_searcher_initials", None]
         ),
         Column(name="field_id", type="text", csv=["field_id", None]),
-        Column(name="bander", type="text", csv=["bander", None]),
-        Column(name="observer", type="text", csv=["observer", None]),
+        Column(name="bander", type="text", csv=["bander", None], dimension="person"),
+        Column(
+            name="observer",
+            type="text",
+            csv=["observer", None],
+            dimension="person",
+        ),
         Column(name="capture_time", type="time", csv=["capture_time", None]),
         Column(name="tube_label", type="text", csv=["tube_label", None]),
+        # Joins capture and point_count on their IDs, which have other names there,
+        # so it is not found as a join key and the table lists its indexes
         Column(
             name="spreadsheet_id",
             type="text",
             csv=["id_db_captures", "id_db_pointcounts", None]
         ),
-    ]),
+    ], key=["sample_id"], indexes=[["dataset_id"], ["spreadsheet_id"]]),
     Table("nest", [
         Column(name="nest_id", type="text", csv=["unique_id_nest"]),
         Column(name="taxonomy_id", type="text", csv=["taxonomy_id"]),
@@ -313,8 +379,13 @@ TABLES = [
         Column(name="location_id", type="text", csv=["location_id"]),
         Column(name="dataset_id", type="text", csv=["dataset_id"]),
         Column(name="genus", type="text", csv=["species"]),  # ?!
-        Column(name="species", type="text", csv=["species"]),  # ?!
-        Column(name="genus_species", type="text", csv=["species"]),  # ?!
+        Column(name="species", type="text", csv=["species"], dimension="species"),  # ?!
+        Column(
+            name="genus_species",
+            type="text",
+            csv=["species"],
+            dimension="species",
+        ),  # ?!
         Column(name="corrected_id", type="text", csv=["correct_id_nest"]),
         Column(name="year", type="date", csv=["season_year"]),
         Column(name="date_nest_found", type="date", csv=[None]),
@@ -324,14 +395,14 @@ TABLES = [
         Column(name="date_nestling_found", type="date", csv=[None]),
         Column(name="date_last_active", type="date", csv=[None]),
         Column(name="date_last_checked", type="date", csv=[None]),
-    ]),
+    ], key=["nest_id"]),
     Table("nest_eggs", [
         Column(name="egg_id", type="text", csv=["egg_id"]),
         Column(name="nest_id", type="text", csv=["unique_id_nest"]),
-        Column(name="genus_species", type="text", csv=["species"]),
+        Column(name="genus_species", type="text", csv=["species"], dimension="species"),
         Column(name="taxonomy_id", type="text", csv=["taxonomy_id"]),
         Column(name="genus", type="text", csv=["species"]),  # ?!
-        Column(name="species", type="text", csv=["species"]),  # ?!
+        Column(name="species", type="text", csv=["species"], dimension="species"),  # ?!
         Column(
             name="embryonic_development",
             type="text",
@@ -347,7 +418,7 @@ TABLES = [
         Column(name="weight", type="numeric", csv=["egg_weight_gr"]),
         Column(name="clutch_size", type="numeric", csv=["clutch_size"]),
         Column(name="weight_measurement_order", type="text", csv=["measure_weight"]),
-    ]),
+    ], key=["egg_id"]),
     Table("nest_morphology", [
         Column(name="nest_id", type="text", csv=["unique_id_nest"]),
         Column(name="internal_length", type="numeric", csv=["nest_internal_length_mm"]),
@@ -378,7 +449,7 @@ TABLES = [
             name="extra_material_notes", type="text", csv=["nest_extra_material_notes"]
         ),
         Column(name="to_check_shape", type="categorical", csv=["to_check_shape"]),
-    ]),
+    ], key=["nest_id"]),
     Table("capture", [
         Column(name="capture_id", type="text", csv=["id_db_captures"]),
         Column(name="sample_id", type="text", csv=["sample_id"]),
@@ -391,18 +462,18 @@ TABLES = [
         Column(name="band", type="categorical", csv=["band"]),
         Column(name="date_", type="categorical", csv=["day/month/year"]),
         Column(name="age", type="text", csv=["age"]),
-        Column(name="sex", type="text", csv=["sex"]),
+        Column(name="sex", type="text", csv=["sex"], allowed=SEXES),
         Column(name="capture_time", type="time", csv=["cap_time"]),
         Column(name="taxonomy_id", type="text", csv=["taxonomy_id"]),
-        Column(name="genus_species", type="text", csv=["species"]),
-        Column(name="dead", type="text", csv=["dead"]),
-    ]),
+        Column(name="genus_species", type="text", csv=["species"], dimension="species"),
+        Column(name="dead", type="text", csv=["dead"], allowed=YES + NO),
+    ], key=["capture_id"]),
     Table("bird_morphology", [
         Column(name="capture_id", type="text", csv=["id_db_captures"]),
         Column(name="age", type="text", csv=["age"]),
         Column(name="age_method_1", type="text", csv=["how_aged_1"]),
         Column(name="age_method_2", type="text", csv=["how_aged_2"]),
-        Column(name="sex", type="text", csv=["sex"]),
+        Column(name="sex", type="text", csv=["sex"], allowed=SEXES),
         Column(name="sex_method_1", type="text", csv=["how_sexed_1"]),
         Column(name="sex_method_2", type="text", csv=["how_sexed_2"]),
         Column(name="skull", type="text", csv=["skull"]),
@@ -425,7 +496,7 @@ TABLES = [
         Column(name="notes", type="text", csv=["notes"]),
         Column(name="action_taxonomy", type="text", csv=["action_taxonomy"]),
         Column(name="notes_taxonomy", type="text", csv=["notes_taxonomy"]),
-    ]),
+    ], key=["capture_id"]),
     Table("point_count", [
         Column(name="point_count_id", type="text", csv=["id_db_pointcounts"]),
         Column(name="sample_id", type="text", csv=["sample_id"]),
@@ -434,13 +505,21 @@ TABLES = [
         Column(name="point_id", type="text", csv=["point_id"]),
         Column(name="dataset_id", type="text", csv=["dataset_id"]),
         Column(name="taxonomy_id", type="text", csv=["taxonomy_id"]),
-        Column(name="observer", type="text", csv=["observer"]),
-        Column(name="date_", type="date", csv=["day/month/year"]),
-        Column(name="point_lat", type="numeric", csv=["lat"]),
-        Column(name="point_lon", type="numeric", csv=["long"]),
-        Column(name="point_elevation", type="numeric", csv=["elevation"]),
+        Column(name="observer", type="text", csv=["observer"], dimension="person"),
+        Column(
+            name="date_", type="date", csv=["day/month/year"], date_format="%d/%m/%Y"
+        ),
+        Column(name="point_lat", type="numeric", csv=["lat"], low=-90, high=90),
+        Column(name="point_lon", type="numeric", csv=["long"], low=-180, high=180),
+        Column(
+            name="point_elevation",
+            type="numeric",
+            csv=["elevation"],
+            low=-500,
+            high=9000,
+        ),
         Column(name="point_time", type="time", csv=["time"]),
-        Column(name="species", type="text", csv=["species"]),
+        Column(name="species", type="text", csv=["species"], dimension="species"),
         Column(name="method", type="text", csv=["method"]),
         Column(name="tfd", type="text", csv=["tfd"]),
         Column(name="min_0_3", type="text", csv=["min_0_3"]),
@@ -461,6 +540,83 @@ TABLES = [
         Column(name="from_rec", type="text", csv=[None]),
         Column(name="f_t", type="text", csv=["f/t"]),
         Column(name="review", type="text", csv=["review"]),
-    ]),
+    ], key=["point_count_id"]),
 ]
 
+
+
+def schema(db_tables=None):
+    """Get the columns for each database table.
+
+    Several Table objects may fill the same database table so their columns are
+    merged in the order they are first seen.
+    """
+    db_tables = db_tables if db_tables is not None else TABLES
+    tables = {}
+    for table in db_tables:
+        columns = tables.setdefault(table.name, {})
+        for name, type_ in table.types.items():
+            columns.setdefault(name, type_)
+    return tables
+
+
+def dimensions(db_tables=None):
+    """Get the lookup table for each column that has one, by database table."""
+    db_tables = db_tables if db_tables is not None else TABLES
+    dims = {}
+    for table in db_tables:
+        for col in table.columns:
+            if col.dimension:
+                dims.setdefault(table.name, {}).setdefault(col.name, col.dimension)
+    return dims
+
+
+def join_keys(db_tables=None):
+    """Get the columns that link tables together.
+
+    They are in more than one table and are either in a natural key or are IDs.
+    """
+    db_tables = db_tables if db_tables is not None else TABLES
+    key_columns = {c for key in natural_keys(db_tables).values() for c in key}
+    found = {}
+    for name, columns in schema(db_tables).items():
+        for column in columns:
+            found.setdefault(column, set()).add(name)
+    return {
+        c
+        for c, names in found.items()
+        if len(names) > 1 and (c in key_columns or c.endswith("_id"))
+    }
+
+
+def indexes(db_tables=None):
+    """Get the column lists to index for each database table.
+
+    Tables that do not declare their indexes get one for each join key, unless
+    the key already leads their natural key's index.
+    """
+    db_tables = db_tables if db_tables is not None else TABLES
+    keys = natural_keys(db_tables)
+    joins = join_keys(db_tables)
+
+    plans = {}
+    for table in db_tables:
+        if table.indexes is not None:
+            plans.setdefault(table.name, table.indexes)
+
+    for name, columns in schema(db_tables).items():
+        if name not in plans:
+            lead = keys.get(name, [None])[0]
+            plans[name] = [[c] for c in columns if c in joins and c != lead]
+
+    return {n: p for n, p in plans.items() if p}
+
+
+def natural_keys(db_tables=None):
+    """Get the natural key for each database table that has one."""
+    db_tables = db_tables if db_tables is not None else TABLES
+    keys = {}
+    for table in db_tables:
+        if table.key:
+            keys.setdefault(table.name, table.key)
+    return keys
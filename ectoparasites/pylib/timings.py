@@ -0,0 +1,122 @@
+"""Time each phase of an ingest and count what went thru it."""
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+
+
+@dataclass
+class Measure:
+    """What a phase filled in about the work it did."""
+
+    rows_in: int = 0
+    rows_out: int = 0
+    bytes_read: int = 0
+
+
+@dataclass
+class Stats:
+    calls: int = 0
+    seconds: float = 0.0
+    rows_in: int = 0
+    rows_out: int = 0
+    bytes_read: int = 0
+    # The most one call raised the process's peak RSS. The peak is only kept
+    # for the whole process, so this is what the phase added to it, not the
+    # memory it used. Phases running at the same time share the growth.
+    peak_rss_growth_mb: float = 0.0
+
+    def add(self, other):
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.rows_in += other.rows_in
+        self.rows_out += other.rows_out
+        self.bytes_read += other.bytes_read
+        self.peak_rss_growth_mb = max(self.peak_rss_growth_mb, other.peak_rss_growth_mb)
+
+    def as_dict(self):
+        stats = asdict(self)
+        stats["seconds"] = round(self.seconds, 4)
+        stats["rows_per_sec"] = (
+            round(self.rows_out / self.seconds) if self.seconds else 0
+        )
+        return stats
+
+
+class Recorder:
+    def __init__(self):
+        # Stats are added up as we go so memory does not grow with the number
+        # of chunks: (phase, table, csv) -> Stats
+        self.stats = defaultdict(Stats)
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()  # Streaming stages record from threads
+
+    @contextmanager
+    def phase(self, name, table="", csv=""):
+        """Time a phase of the ingest for a table and/or a CSV."""
+        measure = Measure()
+        start = time.perf_counter()
+        start_rss = peak_rss_mb()
+        try:
+            yield measure
+        finally:
+            done = Stats(
+                calls=1,
+                seconds=time.perf_counter() - start,
+                rows_in=measure.rows_in,
+                rows_out=measure.rows_out,
+                bytes_read=measure.bytes_read,
+                peak_rss_growth_mb=round(peak_rss_mb() - start_rss, 1),
+            )
+            with self.lock:
+                self.stats[(name, table, csv)].add(done)
+
+    def merge(self, stats):
+        with self.lock:
+            for key, other in stats.items():
+                self.stats[key].add(other)
+
+    def summary(self):
+        phases = defaultdict(Stats)
+        by_table = defaultdict(lambda: defaultdict(Stats))
+        by_csv = defaultdict(lambda: defaultdict(Stats))
+        for (name, table, csv), stats in self.stats.items():
+            phases[name].add(stats)
+            if table:
+                by_table[table][name].add(stats)
+            if csv:
+                by_csv[csv][name].add(stats)
+
+        return {
+            "wall_seconds": round(time.perf_counter() - self.start, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "workers_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "phases": {p: s.as_dict() for p, s in phases.items()},
+            "tables": {
+                t: {p: s.as_dict() for p, s in v.items()} for t, v in by_table.items()
+            },
+            "csvs": {
+                c: {p: s.as_dict() for p, s in v.items()} for c, v in by_csv.items()
+            },
+        }
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # Linux reports this in KiB and macOS in bytes
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss * scale / 2**20, 1)
+
+
+def call(func, *args):
+    """Run a function in a worker process and return its result with its stats."""
+    RECORDER.stats.clear()
+    result = func(*args)
+    return result, dict(RECORDER.stats)
+
+
+RECORDER = Recorder()
+phase = RECORDER.phase
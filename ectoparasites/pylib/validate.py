@@ -0,0 +1,91 @@
+"""Check table data against the rules on its columns and pull out the bad rows.
+
+Each rule is checked with one vectorized mask over the whole data frame.
+"""
+import logging
+
+import pandas as pd
+
+from . import manifest
+from . import timings
+
+LOGGER = logging.getLogger(__name__)
+
+# The CSV header is line 1 and data frame indexes count data rows from 0
+FIRST_LINE = 2
+
+REJECT_COLUMNS = ["table_name", "line", "column_name", "value", "reason"]
+
+
+def check(df, db_table, csv_name=""):
+    """Split a table's data into the good rows and the rejects.
+
+    Returns the good rows and a data frame with a row for every broken rule.
+    """
+    with timings.phase("validate", db_table.name, csv_name) as measure:
+        measure.rows_in = len(df)
+        failures = []
+        seen = set()
+        for col in db_table.columns:
+            if col.name in seen or col.name not in df.columns:
+                continue
+            seen.add(col.name)
+            for reason, bad in broken_rules(df[col.name], col):
+                if bad.any():
+                    failures.append(rejects(df[col.name][bad], db_table.name, reason))
+
+        if not failures:
+            measure.rows_out = len(df)
+            return df, empty()
+
+        found = pd.concat(failures)
+        LOGGER.warning(
+            f"{csv_name} {db_table.name}: {found['line'].nunique()} rows were "
+            f"rejected, see {manifest.REJECTS}"
+        )
+        df = df.loc[~df.index.isin(found["line"] - FIRST_LINE)]
+        measure.rows_out = len(df)
+        return df, found.reset_index(drop=True)
+
+
+def broken_rules(series, col):
+    """Get (reason, mask) pairs for each rule a column has."""
+    if col.low is not None:
+        yield f"less than {col.low}", (series < col.low).fillna(False)
+
+    if col.high is not None:
+        yield f"greater than {col.high}", (series > col.high).fillna(False)
+
+    if col.allowed is not None:
+        allowed = [a.casefold() for a in col.allowed]
+        values = series.astype("string").str.strip().str.casefold()
+        bad = series.notna() & ~values.isin(allowed)
+        yield f"not one of {', '.join(col.allowed)}", bad
+
+    if col.date_format is not None:
+        dates = pd.to_datetime(series, format=col.date_format, errors="coerce")
+        yield f"not a {col.date_format} date", series.notna() & dates.isna()
+
+
+def coerced(coercions, table_name):
+    """Get a reject for every cell that could not be cast and was set to missing.
+
+    The rows are kept, only the cells are missing.
+    """
+    return [rejects(c.cells, table_name, c.reason()) for c in coercions]
+
+
+def rejects(values, table_name, reason):
+    return pd.DataFrame(
+        {
+            "table_name": table_name,
+            "line": values.index + FIRST_LINE,
+            "column_name": values.name,
+            "value": values.astype("string"),
+            "reason": reason,
+        }
+    )
+
+
+def empty():
+    return pd.DataFrame(columns=REJECT_COLUMNS)
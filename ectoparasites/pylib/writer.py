@@ -0,0 +1,414 @@
+"""Bulk load data frames into database tables built from the TABLES schema.
+
+SQLite is built in. DuckDB and PostgreSQL are optional and only imported when
+they are used.
+"""
+import logging
+import sqlite3
+from abc import ABC
+from abc import abstractmethod
+
+import pandas as pd
+
+from . import dimensions
+from . import export
+from . import manifest
+from . import queries
+from . import tables
+from . import timings
+from .dimensions import Dimensions
+from .manifest import FILE_COLUMN
+from .manifest import Manifest
+
+LOGGER = logging.getLogger(__name__)
+
+AFFINITY = {
+    "categorical": "TEXT",
+    "int": "INTEGER",
+    "numeric": "REAL",
+    "numerical": "REAL",
+    "date": "TEXT",
+    "text": "TEXT",
+    "time": "TEXT",
+    "y/n": "INTEGER",
+}
+
+# Settings for loading data, the previous values are restored afterwards
+INGEST_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "OFF",
+    "cache_size": -256 * 1024,  # In KiB
+}
+
+BATCH_SIZE = 50_000
+
+# Rows ANALYZE samples from each index, it keeps ANALYZE fast on big tables
+ANALYSIS_LIMIT = 1000
+
+
+def connect(backend, db, **kwargs):
+    """Get the writer for a backend. The db is a file path or a connection string."""
+    match backend:
+        case "duckdb":
+            from .duckdb_writer import DuckDbWriter
+
+            return DuckDbWriter(db, **kwargs)
+        case "postgres":
+            from .postgres_writer import PostgresWriter
+
+            return PostgresWriter(db, **kwargs)
+        case _:
+            return SqliteWriter(db, **kwargs)
+
+
+class Writer(ABC):
+    """Create the tables and load data frames into them.
+
+    Backends say how to connect, how to bulk insert, and which SQL types to use.
+    """
+
+    types = AFFINITY  # Column.type -> SQL type
+    integrity_errors = ()  # Raised when a unique index finds duplicates
+
+    # Either rows added by a file are tracked as a rowid range, or each row is
+    # tagged with the ID of the file it came from
+    tags_rows = True
+
+    same = "IS NOT DISTINCT FROM"  # Compares values with NULLs matching NULLs
+
+    def __init__(
+        self,
+        db_path,
+        replace=False,
+        on_conflict="ignore",
+        batch_size=BATCH_SIZE,
+        normalize=False,
+    ):
+        self.db_path = db_path
+        self.replace = replace
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.schema = tables.schema()
+        self.dims = tables.dimensions() if normalize else {}
+        self.keys = {}  # Natural keys that have a unique index
+        self.natural_keys = tables.natural_keys()
+        self.cxn = None
+        self.manifest = None
+        self.dimensions = None
+
+    def __enter__(self):
+        # Transactions are handled explicitly
+        self.cxn = self.connect()
+        try:
+            self.dimensions = Dimensions(self.cxn)
+            self.create_tables()
+
+            self.manifest = Manifest(self.cxn)
+            if self.replace:
+                self.manifest.reset()
+            else:
+                self.watch_summaries()
+        except BaseException as err:
+            # Close the connection and restore its settings like a failed load
+            self.__exit__(type(err), err, err.__traceback__)
+            raise
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cxn.close()
+
+    @abstractmethod
+    def connect(self):
+        """Get a connection in autocommit mode."""
+
+    @abstractmethod
+    def insert(self, name, df, conflict):
+        """Bulk insert a data frame and return the number of rows added."""
+
+    def analyze(self):
+        self.cxn.execute("ANALYZE")
+
+    def create_tables(self):
+        if self.replace:
+            for name in self.schema:
+                self.drop(name)
+            for dim in all_dimensions(tables.dimensions()):
+                self.dimensions.drop(dim)
+
+        for dim in all_dimensions(self.dims):
+            self.dimensions.create(dim)
+
+        for name, columns in self.schema.items():
+            dims = self.dims.get(name)
+            layout = "view" if dims else "table"
+            if (kind := self.object_type(name)) and kind != layout:
+                raise ValueError(
+                    f"{name} is a {kind} but the ingest needs a {layout}. "
+                    "Use --replace to switch between flat and normalized tables."
+                )
+            if dims:
+                columns = dimensions.fact_columns(columns, dims)
+            if self.tags_rows:
+                columns = columns | {FILE_COLUMN: "int"}
+            self.cxn.execute(create_table_sql(self.table(name), columns, self.types))
+            if dims:
+                self.cxn.execute(dimensions.view_sql(name, self.schema[name], dims))
+
+        for name, key in tables.natural_keys().items():
+            key = self.columns(name, key)
+            try:
+                self.cxn.execute(create_key_sql(self.table(name), key))
+                self.keys[self.table(name)] = key
+            except self.integrity_errors:
+                LOGGER.warning(f"Not deduplicating {name}, it already has duplicates")
+
+    def create_indexes(self):
+        """Index the join keys and update the query planner's statistics.
+
+        This is done after loading because inserts are faster without indexes.
+        """
+        with timings.phase("index"):
+            plans = tables.indexes()
+            if self.tags_rows:
+                for name in self.schema:
+                    plans[name] = [*plans.get(name, []), [FILE_COLUMN]]
+            for name, plan in plans.items():
+                for columns in plan:
+                    sql = create_index_sql(
+                        self.table(name), self.columns(name, columns)
+                    )
+                    self.cxn.execute(sql)
+            self.analyze()
+
+    def changed_tables(self):
+        """Get the tables this ingest added rows to or removed rows from."""
+        if self.replace:
+            return set(self.schema)
+        return {n for n in self.schema if self.table(n) in self.manifest.touched}
+
+    def watch_summaries(self):
+        """Keep the keys of the rows that change in summarized tables."""
+        for summary in queries.SUMMARIES:
+            for name, key in summary.tables.items():
+                # Lookup table IDs are not the values, those summaries are rebuilt
+                if self.columns(name, key) == key:
+                    self.manifest.watch(self.table(name), key)
+
+    def summarize(self):
+        """Update the summary tables that summarize tables this ingest changed."""
+        with timings.phase("summary"):
+            changed = self.changed_tables()
+            keys = None
+            if not self.replace:
+                watched = self.manifest.watched
+                keys = {
+                    n: self.manifest.changed_keys[self.table(n)]
+                    for n in changed
+                    if self.table(n) in watched
+                }
+            if refreshed := queries.refresh(
+                self.cxn, changed, self.object_type, keys, self.same
+            ):
+                LOGGER.info(f"Refreshed summaries: {', '.join(refreshed)}")
+
+    def export(self, out_dir):
+        """Export the tables this ingest changed to Arrow files."""
+        with timings.phase("export"):
+            version = queries.current_version(self.cxn)
+            changed = self.changed_tables()
+            if exported := export.sync(
+                self.cxn, self.schema, out_dir, version, changed
+            ):
+                LOGGER.info(f"Exported to {out_dir}: {', '.join(exported)}")
+
+    def drop(self, name):
+        """Drop a table in either layout."""
+        if self.object_type(name) == "view":
+            self.cxn.execute(f"DROP VIEW {name}")
+        self.cxn.execute(f"DROP TABLE IF EXISTS {name}")
+        self.cxn.execute(f"DROP TABLE IF EXISTS {dimensions.fact_name(name)}")
+
+    def object_type(self, name):
+        """Is the name a "table", a "view", or None if it is not there."""
+        row = self.cxn.execute(
+            """SELECT table_type FROM information_schema.tables
+                WHERE table_name = ? AND table_schema = current_schema()""",
+            (name,),
+        ).fetchone()
+        return {"BASE TABLE": "table", "VIEW": "view"}.get(row[0]) if row else None
+
+    def columns(self, name, columns):
+        """Get the names of a database table's columns in the table holding its data."""
+        dims = self.dims.get(name, {})
+        return [dimensions.id_column(c) if c in dims else c for c in columns]
+
+    def table(self, name):
+        """Get the table that holds a database table's data."""
+        return dimensions.fact_name(name) if name in self.dims else name
+
+    def write(self, name, df, file_id=None):
+        """Insert the data frame into the table within a single transaction.
+
+        If a file ID is given the new rows and the keys of all rows are recorded in
+        the manifest.
+        """
+        if df.empty:
+            return
+
+        with timings.phase("write", table=name) as measure:
+            if columns := self.manifest.watched.get(self.table(name)):
+                self.manifest.note(self.table(name), records(df[columns]))
+            links = None
+            if file_id is not None and self.table(name) in self.keys:
+                links = key_links(file_id, df, self.natural_keys[name])
+            if dims := self.dims.get(name):
+                df = self.dimensions.encode(df, dims)
+            name = self.table(name)
+            if self.tags_rows:
+                df = df.assign(**{FILE_COLUMN: file_id})
+            if self.on_conflict == "update" and (key := self.keys.get(name)):
+                # Updating a row with each of its duplicates leaves the last one
+                df = last_per_key(df, key)
+
+            self.cxn.execute("BEGIN")
+            try:
+                first_rowid = None if self.tags_rows else self.max_rowid(name) + 1
+                measure.rows_in = len(df)
+                measure.rows_out = self.insert(
+                    name, df, self.conflict_sql(name, df.columns)
+                )
+                if file_id is not None:
+                    last_rowid = None if self.tags_rows else self.max_rowid(name)
+                    self.manifest.record(file_id, name, first_rowid, last_rowid)
+                if links is not None:
+                    self.insert_links(name, links)
+            except Exception:
+                self.cxn.execute("ROLLBACK")
+                raise
+            self.cxn.execute("COMMIT")
+
+    def link(self, name, links):
+        """Record keys of rows files have that were credited to other files."""
+        if links.empty:
+            return
+        with timings.phase("write", table=name):
+            self.cxn.execute("BEGIN")
+            try:
+                self.insert_links(self.table(name), links)
+            except Exception:
+                self.cxn.execute("ROLLBACK")
+                raise
+            self.cxn.execute("COMMIT")
+
+    def insert_links(self, name, links):
+        links = links.drop_duplicates().assign(table_name=name)
+        self.insert(manifest.KEYS, links[["file_id", "table_name", "key_hash"]], "")
+
+    def conflict_sql(self, name, columns):
+        """Build the clause that lets the database drop or merge rows with a key."""
+        if not (key := self.keys.get(name)):
+            return ""
+
+        target = ", ".join(f'"{c}"' for c in key)
+        skip = [*key, FILE_COLUMN]
+        updates = [f'"{c}" = excluded."{c}"' for c in columns if c not in skip]
+        if self.on_conflict == "update" and updates:
+            return f"ON CONFLICT ({target}) DO UPDATE SET {', '.join(updates)}"
+        return f"ON CONFLICT ({target}) DO NOTHING"
+
+
+class SqliteWriter(Writer):
+    integrity_errors = sqlite3.IntegrityError
+    tags_rows = False
+    same = "IS"
+
+    def __init__(self, db_path, **kwargs):
+        super().__init__(db_path, **kwargs)
+        self.saved_pragmas = {}
+
+    def connect(self):
+        # Streamed chunks are written from a thread, one at a time
+        cxn = sqlite3.connect(
+            self.db_path, isolation_level=None, check_same_thread=False
+        )
+        for pragma, value in INGEST_PRAGMAS.items():
+            self.saved_pragmas[pragma] = pragma_value(cxn, pragma)
+            cxn.execute(f"PRAGMA {pragma} = {value}")
+        return cxn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for pragma, value in self.saved_pragmas.items():
+            self.cxn.execute(f"PRAGMA {pragma} = {value}")
+        super().__exit__(exc_type, exc_value, traceback)
+
+    def object_type(self, name):
+        row = self.cxn.execute(
+            "SELECT type FROM sqlite_master WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def insert(self, name, df, conflict):
+        names = ", ".join(f'"{c}"' for c in df.columns)
+        params = ", ".join("?" for _ in df.columns)
+        sql = f"INSERT INTO {name} ({names}) VALUES ({params}) {conflict}"  # noqa: S608
+
+        changes = self.cxn.total_changes
+        for start in range(0, len(df), self.batch_size):
+            batch = df.iloc[start : start + self.batch_size]
+            self.cxn.executemany(sql, records(batch))
+        return self.cxn.total_changes - changes
+
+    def analyze(self):
+        self.cxn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        self.cxn.execute("ANALYZE")
+        self.cxn.execute("PRAGMA optimize")
+
+    def max_rowid(self, name):
+        sql = f"SELECT max(rowid) FROM {name}"  # noqa: S608
+        return self.cxn.execute(sql).fetchone()[0] or 0
+
+
+def last_per_key(df, key):
+    """Drop all but the last row with each key. Rows missing a key part stay."""
+    null_key = df[key].isna().any(axis="columns")
+    return df[null_key | ~df.duplicated(subset=key, keep="last")]
+
+
+def key_links(file_id, df, columns):
+    """Get (file ID, key hash) rows for the keys in the columns of a data frame."""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False)
+    return pd.DataFrame(
+        {"file_id": file_id, "key_hash": hashes.to_numpy().view("int64")}
+    )
+
+
+def pragma_value(cxn, pragma):
+    return cxn.execute(f"PRAGMA {pragma}").fetchone()[0]
+
+
+def all_dimensions(dims):
+    return sorted({d for columns in dims.values() for d in columns.values()})
+
+
+def create_table_sql(name, columns, types=None):
+    types = types if types is not None else AFFINITY
+    defs = [f'"{c}" {types.get(t, "")}'.rstrip() for c, t in columns.items()]
+    return f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(defs)})"
+
+
+def create_key_sql(name, key):
+    columns = ", ".join(f'"{c}"' for c in key)
+    return f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({columns})"
+
+
+def create_index_sql(name, columns):
+    index = f"{name}_{'_'.join(columns)}"
+    columns = ", ".join(f'"{c}"' for c in columns)
+    return f"CREATE INDEX IF NOT EXISTS {index} ON {name} ({columns})"
+
+
+def records(df):
+    """Convert data frame rows into tuples of plain Python values."""
+    df = df.astype(object).where(df.notna(), None)
+    return map(tuple, df.to_numpy().tolist())
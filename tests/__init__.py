@@ -0,0 +1,5 @@
+"""Tests run from the repository root import pylib the way the scripts do."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "ectoparasites"))
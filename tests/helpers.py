@@ -0,0 +1,68 @@
+"""Make small CSV directories and ingest them the way the ingest command does."""
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from pathlib import Path
+from unittest import mock
+
+import ingest
+from benchmarks import synthetic
+from pylib import caches
+from pylib import pipeline
+
+
+class IngestTestCase(unittest.TestCase):
+    """Each test gets its own directory, removed when it finishes."""
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.dir = Path(temp.name)
+
+        # Ingests log a lot, the tests check what was loaded instead
+        logging.disable(logging.ERROR)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+        # Ingests save caches next to the database, which is removed
+        self.addCleanup(caches.use, None)
+        user_cache = mock.patch.dict(os.environ, XDG_CACHE_HOME=str(self.dir))
+        user_cache.start()
+        self.addCleanup(user_cache.stop)
+
+    def synthetic(self, name="csv", **kwargs):
+        """Write fake field data CSVs into a directory."""
+        csv_dir = self.dir / name
+        synthetic.generate(csv_dir, **kwargs)
+        return csv_dir
+
+    def write_csv(self, path, header, rows):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lines = [",".join(header)] + [",".join(map(str, r)) for r in rows]
+        path.write_text("\n".join(lines) + "\n")
+        return path
+
+
+def ingest_dir(db, csv_dir, *options):
+    """Ingest a directory with the ingest command's options."""
+    argv = ["ingest", "--db", str(db), "--csv-dir", str(csv_dir), *options]
+    pipeline.run(ingest.parse_args(argv))
+
+
+def dump(db, names=None):
+    """Get the sorted rows of every table, or of the given tables, in a SQLite DB."""
+    with closing(sqlite3.connect(db)) as cxn:
+        if names is None:
+            names = [
+                row[0]
+                for row in cxn.execute(
+                    """SELECT name FROM sqlite_master
+                        WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"""
+                )
+            ]
+        return {
+            n: sorted(map(repr, cxn.execute(f"SELECT * FROM {n}")))  # noqa: S608
+            for n in names
+        }
@@ -0,0 +1,90 @@
+import os
+import unittest
+from unittest import mock
+
+from pylib import manifest
+from pylib import writer
+
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+# A connection string for a PostgreSQL database the tests can replace tables in
+POSTGRES = os.environ.get("ECTOPARASITES_TEST_POSTGRES")
+
+
+def postgres_error():
+    """Get why the PostgreSQL tests cannot run, or None if they can."""
+    if psycopg is None:
+        return "psycopg is not installed"
+    if not POSTGRES:
+        return "ECTOPARASITES_TEST_POSTGRES is not set"
+    try:
+        psycopg.connect(POSTGRES, connect_timeout=5).close()
+    except psycopg.Error as err:
+        return f"cannot connect to PostgreSQL: {err}"
+    return None
+
+
+POSTGRES_ERROR = postgres_error()
+
+
+class ManifestTests:
+    """Tests every backend runs. Subclasses set backend and db."""
+
+    backend = ""
+
+    def db(self):
+        raise NotImplementedError
+
+    def ingest(self, *options):
+        ingest_dir(self.db(), self.csv_dir, "--backend", self.backend, *options)
+
+    def setUp(self):
+        super().setUp()
+        self.csv_dir = self.synthetic(files=2, rows=20, seed=3)
+
+    def test_unchanged_files_are_skipped_without_hashing(self):
+        self.ingest("--replace")
+        with mock.patch.object(
+            manifest, "file_hash", wraps=manifest.file_hash
+        ) as hashes:
+            self.ingest()
+        hashes.assert_not_called()
+
+    def test_mtime_keeps_its_precision(self):
+        self.ingest("--replace")
+        with writer.connect(self.backend, self.db()) as db:
+            sql = f"SELECT path, mtime FROM {manifest.FILES}"  # noqa: S608
+            saved = dict(db.cxn.execute(sql).fetchall())
+        for path in self.csv_dir.iterdir():
+            self.assertEqual(saved[str(path.resolve())], path.stat().st_mtime)
+
+
+@unittest.skipIf(duckdb is None, "duckdb is not installed")
+class TestDuckDb(ManifestTests, IngestTestCase):
+    backend = "duckdb"
+
+    def db(self):
+        return str(self.dir / "db.duckdb")
+
+
+@unittest.skipIf(POSTGRES_ERROR, POSTGRES_ERROR)
+class TestPostgres(ManifestTests, IngestTestCase):
+    backend = "postgres"
+
+    def db(self):
+        return POSTGRES
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import ingest
+from pylib import caches
+from pylib import catalog
+
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+PYCACHE = Path(ingest.__file__).parent / "pylib" / "__pycache__"
+
+
+class TestCacheDir(IngestTestCase):
+    def test_caches_are_kept_next_to_the_database(self):
+        csv_dir = self.synthetic(files=2, rows=20, seed=3)
+        ingest_dir(self.dir / "db.sqlite", csv_dir)
+        ingest.use_caches(
+            ingest.parse_args(["stats", "--db", str(self.dir / "db.sqlite")])
+        )
+        catalog.load()
+
+        saved = {p.name for p in (self.dir / ".ingest_cache").glob("*.json")}
+        self.assertLessEqual({"dtype_plans.json", "tables.catalog.json"}, saved)
+        self.assertEqual(list(PYCACHE.glob("*.json")), [])
+
+    def test_catalog_is_kept_in_the_user_cache_without_a_cache_dir(self):
+        caches.use(None)
+        self.assertIn("tables", catalog.load())
+        saved = list((self.dir / "ectoparasites").glob("tables.catalog.*.json"))
+        self.assertEqual(len(saved), 1)
+        self.assertEqual(list(PYCACHE.glob("*.json")), [])
+
+        with mock.patch.object(catalog, "build") as build:
+            self.assertIn("tables", catalog.load())
+        build.assert_not_called()
+
+    def test_a_cache_dir_that_is_a_file_is_not_used(self):
+        csv_dir = self.synthetic(files=2, rows=20, seed=3)
+        cache_dir = self.dir / "cache"
+        cache_dir.write_text("Not a directory")
+        options = ["--cache-dir", str(cache_dir), "--no-cache"]
+        ingest_dir(self.dir / "db.sqlite", csv_dir, *options)
+        self.assertIn("tables", catalog.load())
+        self.assertTrue(cache_dir.is_file())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import shutil
+import unittest
+
+from pylib import tables
+
+from tests.helpers import dump
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+HEADER = ["id", "band", "day", "month", "year"]
+
+
+class TestDedup(IngestTestCase):
+    def test_drops_repeated_rows_missing_a_key_part(self):
+        rows = [("A", "", 1, "jan", 2020), ("A", "", 1, "jan", 2020)]
+        self.write_csv(self.dir / "csv" / "a.csv", HEADER, rows)
+        for options in [(), ("--chunksize", "10")]:
+            with self.subTest(options=options):
+                db = self.dir / f"db{len(options)}.sqlite"
+                ingest_dir(db, self.dir / "csv", *options)
+                self.assertEqual(len(dump(db, ["date"])["date"]), 1)
+
+    def test_keeps_rows_missing_a_key_part_shared_by_a_changed_file(self):
+        row = ("A", "", 1, "jan", 2020)
+        self.write_csv(self.dir / "csv" / "a.csv", HEADER, [row])
+        self.write_csv(self.dir / "csv" / "b.csv", HEADER, [row])
+        ingest_dir(self.dir / "db.sqlite", self.dir / "csv")
+        self.assertEqual(len(dump(self.dir / "db.sqlite", ["date"])["date"]), 1)
+
+        self.write_csv(self.dir / "csv" / "a.csv", HEADER, [("B", 2, 1, "jan", 2020)])
+        ingest_dir(self.dir / "db.sqlite", self.dir / "csv")
+        self.assertEqual(len(dump(self.dir / "db.sqlite", ["date"])["date"]), 2)
+
+    def test_chunks_load_the_rows_a_whole_file_ingest_loads(self):
+        csv_dir = self.synthetic(files=6, rows=100, seed=1)
+        changed = self.synthetic("changed", files=1, rows=100, seed=2)
+        names = list(tables.schema())
+        chunked = ("--chunksize", "20", "--workers", "2")
+        for step in ("first", "changed"):
+            if step == "changed":
+                csv = min(csv_dir.iterdir())
+                shutil.copy(next(changed.iterdir()), csv)
+            with self.subTest(step=step):
+                ingest_dir(self.dir / "whole.sqlite", csv_dir)
+                ingest_dir(self.dir / "chunks.sqlite", csv_dir, *chunked)
+                self.assertEqual(
+                    dump(self.dir / "chunks.sqlite", names),
+                    dump(self.dir / "whole.sqlite", names),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import shutil
+import sqlite3
+import unittest
+from contextlib import closing
+
+from pylib import dimensions
+from pylib import tables
+
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+
+def rows(db, schema):
+    """Get the sorted rows of each table or view, with the columns in schema order."""
+    found = {}
+    with closing(sqlite3.connect(db)) as cxn:
+        for name, columns in schema.items():
+            names = ", ".join(f'"{c}"' for c in columns)
+            sql = f"SELECT {names} FROM {name}"  # noqa: S608
+            found[name] = sorted(map(repr, cxn.execute(sql)))
+    return found
+
+
+def object_types(db):
+    with closing(sqlite3.connect(db)) as cxn:
+        return dict(cxn.execute("SELECT name, type FROM sqlite_master"))
+
+
+class TestNormalize(IngestTestCase):
+    def test_views_have_the_rows_of_the_flat_tables(self):
+        csv_dir = self.synthetic(files=6, rows=100, seed=3)
+        changed = self.synthetic("changed", files=1, rows=100, seed=4)
+        schema = tables.schema()
+        for step in ("first", "changed"):
+            if step == "changed":
+                shutil.copy(next(changed.iterdir()), min(csv_dir.iterdir()))
+            with self.subTest(step=step):
+                ingest_dir(self.dir / "flat.sqlite", csv_dir)
+                ingest_dir(self.dir / "normal.sqlite", csv_dir, "--normalize")
+                flat = rows(self.dir / "flat.sqlite", schema)
+                self.assertEqual(rows(self.dir / "normal.sqlite", schema), flat)
+                self.assertTrue(any(flat.values()))
+
+        types = object_types(self.dir / "normal.sqlite")
+        for name in tables.dimensions():
+            self.assertEqual(types[name], "view")
+            self.assertEqual(types[dimensions.fact_name(name)], "table")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import io
+import sqlite3
+import unittest
+from contextlib import closing
+from contextlib import redirect_stdout
+
+import ingest
+import pyarrow as pa
+from pylib import export
+from pylib import tables
+
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+COLUMNS = {
+    "flag": "y/n",
+    "weight": "numeric",
+    "count": "int",
+    "kind": "categorical",
+    "note": "text",
+    "day": "date",
+}
+
+
+def read_arrow(path):
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def database_rows(cxn, name, columns):
+    names = ", ".join(f'"{c}"' for c in columns)
+    return sorted(cxn.execute(f"SELECT {names} FROM {name}"), key=repr)  # noqa: S608
+
+
+def arrow_rows(table):
+    """Get an exported table's rows with y/n as 0 or 1, like the database has them."""
+    rows = (
+        tuple(int(v) if isinstance(v, bool) else v for v in row.values())
+        for row in table.to_pylist()
+    )
+    return sorted(rows, key=repr)
+
+
+class TestExport(IngestTestCase):
+    def export(self, db, *options):
+        argv = ["export", "--db", str(db), "--dir", str(self.dir / "arrow")]
+        args = ingest.parse_args([*argv, *options])
+        out = io.StringIO()
+        with redirect_stdout(out):
+            args.command(args)
+        return out.getvalue()
+
+    def test_column_types(self):
+        with closing(sqlite3.connect(":memory:")) as cxn:
+            cxn.execute(f"CREATE TABLE t ({', '.join(COLUMNS)})")
+            cxn.execute(
+                "INSERT INTO t VALUES (?, ?, ?, ?, ?, ?)",
+                (1, 2.5, 3, "mite", "seen", 20200304),
+            )
+            cxn.execute("INSERT INTO t VALUES (0, NULL, NULL, NULL, NULL, NULL)")
+            info = export.export_table(cxn, "t", COLUMNS, self.dir)
+
+        table = read_arrow(self.dir / info["file"])
+        self.assertEqual(info["rows"], 2)
+        self.assertEqual(
+            dict(zip(table.schema.names, table.schema.types, strict=True)),
+            {
+                "flag": pa.bool_(),
+                "weight": pa.float64(),
+                "count": pa.int64(),
+                "kind": pa.dictionary(pa.int32(), pa.string()),
+                "note": pa.string(),
+                "day": pa.string(),
+            },
+        )
+        self.assertEqual(
+            table.to_pylist(),
+            [
+                {
+                    "flag": True,
+                    "weight": 2.5,
+                    "count": 3,
+                    "kind": "mite",
+                    "note": "seen",
+                    "day": "20200304",  # Numbers in untyped columns become text
+                },
+                {c: False if c == "flag" else None for c in COLUMNS},
+            ],
+        )
+
+    def test_reads_back_what_was_ingested(self):
+        db = self.dir / "db.sqlite"
+        ingest_dir(db, self.synthetic(files=4, rows=50, seed=2))
+        self.export(db)
+
+        schema = tables.schema()
+        with closing(sqlite3.connect(db)) as cxn:
+            for name, columns in schema.items():
+                with self.subTest(table=name):
+                    table = read_arrow(self.dir / "arrow" / f"{name}.arrow")
+                    self.assertEqual(table.schema.names, list(columns))
+                    self.assertEqual(
+                        arrow_rows(table), database_rows(cxn, name, columns)
+                    )
+
+        manifest = export.load_manifest(self.dir / "arrow")
+        self.assertEqual(list(manifest["tables"]), list(schema))
+        self.assertTrue(any(t["rows"] for t in manifest["tables"].values()))
+
+    def test_skips_an_up_to_date_export(self):
+        csv_dir = self.synthetic(files=2, rows=20, seed=2)
+        db = self.dir / "db.sqlite"
+        ingest_dir(db, csv_dir)
+
+        self.assertIn("Exported", self.export(db))
+        path = self.dir / "arrow" / "ectos.arrow"
+        written = path.stat().st_mtime_ns
+        self.assertIn("is up to date", self.export(db))
+        self.assertEqual(path.stat().st_mtime_ns, written)
+
+        self.assertIn("Exported", self.export(db, "--force"))
+        self.assertIn("is up to date", self.export(db))
+
+        self.synthetic(files=3, rows=20, seed=3)
+        ingest_dir(db, csv_dir)
+        self.assertIn("Exported", self.export(db))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from tests.helpers import dump
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+HEADER = ["sample_id", "dataset_id", "data_type"]
+
+
+class TestRetract(IngestTestCase):
+    def samples(self, name, numbers, dataset="d1"):
+        rows = [(f"s{i}", dataset, "capture") for i in numbers]
+        return self.write_csv(self.dir / "csv" / name, HEADER, rows)
+
+    def assert_like_full_ingest(self, *options):
+        """Check the incremental DB has the rows a fresh ingest of its files has."""
+        ingest_dir(self.dir / "fresh.sqlite", self.dir / "csv", *options)
+        self.assertEqual(
+            dump(self.dir / "db.sqlite", ["collections"]),
+            dump(self.dir / "fresh.sqlite", ["collections"]),
+        )
+
+    def test_keeps_rows_other_files_have(self):
+        for options in [(), ("--chunksize", "3")]:
+            with self.subTest(options=options):
+                self.samples("a.csv", range(1, 11))
+                self.samples("b.csv", range(5, 16))
+                ingest_dir(self.dir / "db.sqlite", self.dir / "csv", *options)
+
+                self.samples("a.csv", range(1, 5))
+                ingest_dir(self.dir / "db.sqlite", self.dir / "csv", *options)
+
+                rows = dump(self.dir / "db.sqlite", ["collections"])["collections"]
+                self.assertEqual(len(rows), 15)
+                self.assert_like_full_ingest(*options)
+                for path in self.dir.glob("*.sqlite*"):
+                    path.unlink()
+
+    def test_shared_rows_come_from_the_first_file(self):
+        self.samples("a.csv", range(1, 6))
+        self.samples("b.csv", range(3, 9), dataset="d2")
+        ingest_dir(self.dir / "db.sqlite", self.dir / "csv")
+
+        self.samples("a.csv", range(1, 3))
+        ingest_dir(self.dir / "db.sqlite", self.dir / "csv")
+        self.assert_like_full_ingest()
+
+        self.samples("a.csv", range(1, 6))
+        ingest_dir(self.dir / "db.sqlite", self.dir / "csv")
+        self.assert_like_full_ingest()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import io
+import json
+import sqlite3
+import unittest
+from contextlib import closing
+from contextlib import redirect_stdout
+
+import ingest
+import openpyxl
+from pylib import catalog
+from pylib import plan
+
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+DATES = ["id", "band", "day", "month", "year"]
+
+
+def index():
+    """Get the alias index the plan command uses."""
+    return catalog.index(catalog.load())
+
+
+class TestEstimateRows(IngestTestCase):
+    def test_counts_small_csvs(self):
+        path = self.write_csv(self.dir / "a.csv", DATES, [("A", 1, 1, "jan", 2020)] * 7)
+        self.assertEqual(plan.estimate_rows(path), (7, False))
+
+    def test_counts_a_last_line_without_a_line_break(self):
+        path = self.dir / "a.csv"
+        path.write_text("id,band\nA,1\nB,2")
+        self.assertEqual(plan.estimate_rows(path), (2, False))
+
+    def test_estimates_large_csvs_from_their_top(self):
+        rows = [(f"A{i:04}", i % 10, 1, "jan", 2020) for i in range(1000)]
+        path = self.write_csv(self.dir / "a.csv", DATES, rows)
+        self.assertEqual(plan.estimate_rows(path, sample=500), (1000, True))
+
+    def test_one_long_line_is_not_estimated(self):
+        path = self.dir / "a.csv"
+        path.write_text("x" * 1000)
+        self.assertEqual(plan.estimate_rows(path, sample=100), (0, True))
+
+
+class TestPlan(IngestTestCase):
+    def setUp(self):
+        super().setUp()
+        self.csv_dir = self.dir / "csv"
+        rows = [
+            ("A", 1, 1, "jan", 2020),
+            ("B", 2, 2, "feb", 2020),
+            ("C", 3, 3, "mar", 2021),
+        ]
+        self.write_csv(self.csv_dir / "a.csv", DATES, rows)
+        self.write_csv(self.csv_dir / "b.csv", ["id", "band", "year"], [("A", 1, 2020)])
+        self.write_csv(self.csv_dir / "junk.csv", ["foo", "bar"], [(1, 2)])
+
+    def run_plan(self, *options):
+        args = ingest.parse_args(["plan", "--csv-dir", str(self.csv_dir), *options])
+        out = io.StringIO()
+        with redirect_stdout(out):
+            args.command(args)
+        return out.getvalue()
+
+    def test_totals_and_missing_columns(self):
+        found = plan.plan(self.csv_dir, index())
+
+        self.assertEqual(
+            [(s["name"], s["rows"], s["estimated"]) for s in found["sources"]],
+            [("a", 3, False), ("b", 1, False), ("junk", 1, False)],
+        )
+        self.assertEqual(found["tables"]["date"], {"sources": 1, "rows": 3})
+        self.assertEqual(found["tables"]["ectos"], {"sources": 0, "rows": 0})
+
+        pairs = {(p["table"], p["source"]): p for p in found["pairs"]}
+        self.assertEqual(pairs["date", "a"]["missing"], [])
+        self.assertEqual(pairs["date", "a"]["columns"]["capture_id"], "id")
+        self.assertEqual(pairs["date", "b"]["missing"], ["day", "month"])
+        self.assertNotIn("junk", {p["source"] for p in found["pairs"]})
+
+    def test_counts_the_rows_under_a_sheet_header(self):
+        book = openpyxl.Workbook()
+        book.active.append(["Notes about the sheet"])
+        book.active.append(DATES)
+        book.active.append(["D", 4, 4, "apr", 2022])
+        book.active.append([])
+        book.active.append(["E", 5, 5, "may", 2022])
+        book.save(self.csv_dir / "book.xlsx")
+
+        found = plan.plan(self.csv_dir, index())
+        sheet = next(s for s in found["sources"] if s["name"] == "book/sheet")
+        self.assertEqual((sheet["rows"], sheet["estimated"]), (2, False))
+        self.assertEqual(found["tables"]["date"], {"sources": 2, "rows": 5})
+
+    def test_command_output(self):
+        lines = self.run_plan().splitlines()
+        self.assertEqual(lines[0].split(), ["table", "sources", "rows"])
+        self.assertIn(["date", "1", "3"], [line.split() for line in lines])
+        self.assertIn("    date & b: missing day, month", lines)
+        self.assertEqual(lines[-1], "Sources that fill no tables: b, junk")
+        self.assertNotIn("CSV row counts are estimated from their sizes", lines)
+
+        lines = self.run_plan("--near", "0").splitlines()
+        self.assertFalse([line for line in lines if "missing" in line])
+
+    def test_json_output_is_the_plan(self):
+        found = json.loads(self.run_plan("--json"))
+        self.assertEqual(found, plan.plan(self.csv_dir, index()))
+
+    def test_planned_tables_are_the_ones_an_ingest_fills(self):
+        csv_dir = self.synthetic("synthetic", files=4, rows=30, seed=5)
+        found = plan.plan(csv_dir, index())
+        ingest_dir(self.dir / "db.sqlite", csv_dir)
+
+        with closing(sqlite3.connect(self.dir / "db.sqlite")) as cxn:
+            for name, total in found["tables"].items():
+                with self.subTest(table=name):
+                    sql = f"SELECT count(*) FROM {name}"  # noqa: S608
+                    loaded = cxn.execute(sql).fetchone()[0]
+                    self.assertEqual(bool(loaded), bool(total["sources"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+
+from tests.helpers import dump
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+
+class TestWorkers(IngestTestCase):
+    def test_parallel_ingest_matches_serial(self):
+        csv_dir = self.synthetic(files=8, rows=200, seed=5)
+        for options in ([], ["--chunksize", "70"]):
+            with self.subTest(options=options):
+                serial = self.dir / f"serial_{len(options)}.sqlite"
+                parallel = self.dir / f"parallel_{len(options)}.sqlite"
+                ingest_dir(serial, csv_dir, "--no-cache", *options)
+                ingest_dir(parallel, csv_dir, "--no-cache", "--workers", "2", *options)
+                self.assertEqual(dump(serial), dump(parallel))
+
+
+if __name__ == "__main__":
+    unittest.main()
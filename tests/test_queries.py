@@ -0,0 +1,139 @@
+import sqlite3
+import unittest
+from contextlib import closing
+from unittest import mock
+
+import ingest
+from pylib import queries
+from pylib import shards
+
+from tests.helpers import dump
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+HEADER = [
+    *("id", "band", "ectos", "ecto_type", "looked_ectos", "ectos_technique"),
+    *("species", "site", "location", "day", "month", "year"),
+]
+
+PREVALENCE = queries.SUMMARIES[0]
+SUMMARY_TABLES = [PREVALENCE.table, PREVALENCE.rows_table]
+
+
+def capture(id_, band, ectos, species, site, year):
+    return (id_, band, ectos, "mite", "y", "dust", species, site, "rio", 1, "jan", year)
+
+
+def captures(start, count, species="wren", site="Chingaza", year=2020):
+    return [
+        capture(f"c{i}", i, "y" if i % 3 else "n", species, site, year)
+        for i in range(start, start + count)
+    ]
+
+
+class TestSummaries(IngestTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db = self.dir / "db.sqlite"
+        self.csv_dir = self.dir / "csv"
+        rows = [*captures(0, 3), capture("solo", 40, "y", "wren", "Paramo", 2019)]
+        self.write_csv(self.csv_dir / "a.csv", HEADER, rows)
+        rows = captures(3, 10, "tanager") + captures(13, 10, site="Iguaque", year=2021)
+        # Missing a key part
+        rows.append(capture("", 99, "y", "wren", "Chingaza", 2020))
+        self.write_csv(self.csv_dir / "b.csv", HEADER, rows)
+        ingest_dir(self.db, self.csv_dir)
+
+    def change(self):
+        """Move captures to other groups, leaving one empty, drop one, and add one."""
+        rows = [capture("c0", 0, "y", "tanager", "Chingaza", 2020), *captures(2, 1)]
+        rows.append(capture("solo", 40, "y", "tanager", "Chingaza", 2020))
+        rows.append(capture("new", 50, "y", "wren", "Iguaque", 2022))
+        self.write_csv(self.csv_dir / "a.csv", HEADER, rows)
+
+    def version(self):
+        with closing(sqlite3.connect(self.db)) as cxn:
+            return queries.current_version(cxn)
+
+    def test_updates_only_the_changed_groups_like_a_rebuild(self):
+        self.change()
+        with mock.patch.object(queries, "rebuild", wraps=queries.rebuild) as rebuild:
+            ingest_dir(self.db, self.csv_dir)
+        rebuild.assert_not_called()
+
+        ingest_dir(self.dir / "fresh.sqlite", self.csv_dir, "--replace")
+        self.assertEqual(
+            dump(self.db, SUMMARY_TABLES),
+            dump(self.dir / "fresh.sqlite", SUMMARY_TABLES),
+        )
+
+    def test_merges_update_the_summaries_like_a_rebuild(self):
+        argv = ["ingest", "--shard-dir", str(self.dir / "shards")]
+        args = ingest.parse_args([*argv, "--csv-dir", str(self.csv_dir)])
+        shards.run(args)
+        shards.merge(self.dir / "merged.sqlite", shards.shard_paths([args.shard_dir]))
+
+        self.change()
+        shards.run(args)
+        with mock.patch.object(queries, "rebuild", wraps=queries.rebuild) as rebuild:
+            shards.merge(
+                self.dir / "merged.sqlite", shards.shard_paths([args.shard_dir])
+            )
+        rebuild.assert_not_called()
+
+        ingest_dir(self.db, self.csv_dir)
+        self.assertEqual(
+            dump(self.dir / "merged.sqlite", SUMMARY_TABLES),
+            dump(self.db, SUMMARY_TABLES),
+        )
+
+    def test_rebuilds_when_most_keys_change(self):
+        self.write_csv(self.csv_dir / "b.csv", HEADER, captures(3, 5, "tanager"))
+        with mock.patch.object(queries, "rebuild", wraps=queries.rebuild) as rebuild:
+            ingest_dir(self.db, self.csv_dir)
+        rebuild.assert_called_once()
+
+        ingest_dir(self.dir / "fresh.sqlite", self.csv_dir, "--replace")
+        self.assertEqual(
+            dump(self.db, SUMMARY_TABLES),
+            dump(self.dir / "fresh.sqlite", SUMMARY_TABLES),
+        )
+
+    def test_version_only_changes_with_the_data(self):
+        version = self.version()
+        ingest_dir(self.db, self.csv_dir)
+        self.assertEqual(self.version(), version)
+
+        self.change()
+        ingest_dir(self.db, self.csv_dir)
+        self.assertEqual(self.version(), version + 1)
+
+    def test_cached_results_are_used_until_the_data_changes(self):
+        with queries.Analyses(self.db) as analyses:
+            before = analyses.run("prevalence_by_species")
+            self.assertEqual(analyses.run("prevalence_by_species"), before)
+            self.assertEqual(analyses.fetch.cache_info().hits, 1)
+
+            self.change()
+            ingest_dir(self.db, self.csv_dir)
+            after = analyses.run("prevalence_by_species")
+            self.assertEqual(analyses.fetch.cache_info().misses, 2)
+
+        captured = {r["species"]: r["captures"] for r in before}
+        self.assertEqual(captured, {None: 1, "tanager": 10, "wren": 14})
+        captured = {r["species"]: r["captures"] for r in after}
+        self.assertEqual(captured, {None: 1, "tanager": 12, "wren": 12})
+
+    def test_filter_text_is_converted_to_the_column_type(self):
+        with queries.Analyses(self.db) as analyses:
+            rows = analyses.run("prevalence_by_species", year="2021")
+            self.assertEqual(analyses.run("prevalence_by_species", year=2021), rows)
+            self.assertEqual(analyses.fetch.cache_info().hits, 1)
+            self.assertEqual([r["captures"] for r in rows], [10])
+
+            with self.assertRaises(ValueError):
+                analyses.run("prevalence_by_species", year="last")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+import ingest
+from pylib import shards
+from pylib import tables
+
+from tests.helpers import dump
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+HEADER = ["sample_id", "dataset_id", "data_type"]
+
+
+class TestMerge(IngestTestCase):
+    def samples(self, path, numbers):
+        rows = [(f"s{i}", "d1", "capture") for i in numbers]
+        return self.write_csv(self.dir / "csv" / path, HEADER, rows)
+
+    def build_shards(self):
+        argv = ["ingest", "--shard-dir", str(self.dir / "shards")]
+        args = ingest.parse_args([*argv, "--csv-dir", str(self.dir / "csv")])
+        self.assertEqual(shards.run(args), [])
+        return shards.shard_paths([self.dir / "shards"])
+
+    def test_keeps_rows_other_shards_have(self):
+        self.samples("x/a.csv", range(1, 11))
+        self.samples("y/b.csv", range(5, 16))
+        shards.merge(self.dir / "db.sqlite", self.build_shards())
+
+        self.samples("x/a.csv", range(1, 5))
+        paths = self.build_shards()
+        shards.merge(self.dir / "db.sqlite", paths)
+        shards.merge(self.dir / "fresh.sqlite", paths)
+
+        merged = dump(self.dir / "db.sqlite", ["collections"])
+        self.assertEqual(len(merged["collections"]), 15)
+        self.assertEqual(merged, dump(self.dir / "fresh.sqlite", ["collections"]))
+
+    def test_drops_rows_missing_a_key_part_other_shards_have(self):
+        header = ["id", "band", "site", "location"]
+        names = list(tables.schema())
+        for step, last in [("first", "alto"), ("changed", "bajo")]:
+            rows = [("", "", "Chingaza", "rio"), ("A", "", "Iguaque", last)]
+            self.write_csv(self.dir / "csv" / "x" / "a.csv", header, rows)
+            self.write_csv(self.dir / "flat" / "a.csv", header, rows)
+            if step == "first":
+                rows = rows[:1]
+                self.write_csv(self.dir / "csv" / "y" / "b.csv", header, rows)
+                self.write_csv(self.dir / "flat" / "b.csv", header, rows)
+            with self.subTest(step=step):
+                shards.merge(self.dir / "db.sqlite", self.build_shards())
+                ingest_dir(self.dir / "fresh.sqlite", self.dir / "flat", "--replace")
+                merged = dump(self.dir / "db.sqlite", names)
+                self.assertEqual(len(merged["site"]), 2)
+                self.assertEqual(merged, dump(self.dir / "fresh.sqlite", names))
+
+    def test_top_shard_is_not_replaced_by_a_directory_with_its_name(self):
+        self.samples("a.csv", range(1, 4))
+        self.samples("csv/b.csv", range(4, 6))
+        paths = self.build_shards()
+        self.assertEqual([p.stem for p in paths], ["csv", "csv_top"])
+
+        shards.merge(self.dir / "db.sqlite", paths)
+        merged = dump(self.dir / "db.sqlite", ["collections"])
+        self.assertEqual(len(merged["collections"]), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
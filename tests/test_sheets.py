@@ -0,0 +1,208 @@
+import datetime
+import sqlite3
+import unittest
+from contextlib import closing
+
+import openpyxl
+from odf import teletype
+from odf.namespaces import OFFICENS
+from odf.namespaces import TABLENS
+from odf.opendocument import load
+from odf.opendocument import OpenDocumentSpreadsheet
+from odf.table import CoveredTableCell
+from odf.table import Table
+from odf.table import TableCell
+from odf.table import TableRow
+from odf.text import P
+from pylib import manifest
+from pylib import sheets
+from pylib import tables
+
+from tests.helpers import dump
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+DATE = datetime.datetime(2020, 3, 4)
+
+# One row of each kind of cell, with empty cells, a merged cell, and empty rows
+ROWS = [
+    ["text", "numbers", 7, 2.5, 0.1 + 0.2],
+    ["dates", DATE, datetime.datetime(2020, 3, 4, 10, 30)],
+    ["yes/no", True, False],
+    [],
+    ["gaps", None, "after a gap", None, None],
+    ["merged", "two wide", None, "after"],
+    [],
+    [],
+    ["last"],
+]
+
+
+def trim(rows):
+    """Drop empty cells and rows from the ends, the sheet readers leave them out."""
+    rows = [list(r) for r in rows]
+    for row in rows:
+        while row and row[-1] is None:
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+def read(reader, path):
+    """Get (sheet name, rows) for each sheet, reading each before the next."""
+    return [(title, list(rows)) for title, rows in reader(path)]
+
+
+def expected_text(value):
+    """Write a library's cell value the way the sheet readers do."""
+    match value:
+        case bool():
+            return "TRUE" if value else "FALSE"
+        case int() | float():
+            return repr(value)
+        case _:
+            return sheets.cell_text(value)
+
+
+class TestXlsx(IngestTestCase):
+    def write(self):
+        path = self.dir / "book.xlsx"
+        book = openpyxl.Workbook()
+        sheet = book.active
+        sheet.title = "Data"
+        for i, row in enumerate(ROWS, 1):
+            for j, value in enumerate(row, 1):
+                if value is not None:
+                    sheet.cell(i, j, value)
+        sheet.merge_cells("B6:C6")
+        book.create_sheet("Empty")
+        book.save(path)
+        return path
+
+    def test_reads_what_openpyxl_reads(self):
+        path = self.write()
+        book = openpyxl.load_workbook(path)
+        expect = [
+            (s.title, trim([[expected_text(v) for v in r] for r in s.values]))
+            for s in book.worksheets
+        ]
+        got = read(sheets.read_xlsx, path)
+        self.assertEqual(got, expect)
+
+    def test_dates_are_iso(self):
+        path = self.write()
+        rows = read(sheets.read_xlsx, path)[0][1]
+        self.assertEqual(rows[1][1:], ["2020-03-04", "2020-03-04 10:30:00"])
+
+
+class TestOds(IngestTestCase):
+    def write(self):
+        """Write an ODS with repeated cells and rows like spreadsheet apps save."""
+        doc = OpenDocumentSpreadsheet()
+        table = Table(name="Data")
+        for row in ROWS:
+            repeat = 2 if row == [] else 1
+            table_row = (
+                TableRow(numberrowsrepeated=repeat) if repeat > 1 else TableRow()
+            )
+            cells = [ods_cell(v) for v in row]
+            if row and row[0] == "merged":
+                cells[1].setAttribute("numbercolumnsspanned", 2)
+                cells[2] = CoveredTableCell()
+            for cell in cells:
+                table_row.addElement(cell)
+            table.addElement(table_row)
+        table.addElement(TableRow(numberrowsrepeated=1000))
+        doc.spreadsheet.addElement(table)
+
+        path = self.dir / "book.ods"
+        doc.save(str(path))
+        return path
+
+    def test_reads_what_odfpy_reads(self):
+        path = self.write()
+        got = read(sheets.read_ods, path)
+        self.assertEqual(got, odfpy_rows(path))
+
+    def test_dates_are_iso(self):
+        path = self.write()
+        rows = read(sheets.read_ods, path)[0][1]
+        self.assertEqual(rows[1][1:], ["2020-03-04", "2020-03-04 10:30:00"])
+
+
+def ods_cell(value):
+    match value:
+        case None:
+            return TableCell()
+        case bool():
+            cell = TableCell(valuetype="boolean", booleanvalue=str(value).lower())
+            cell.addElement(P(text="TRUE" if value else "FALSE"))
+        case int() | float():
+            cell = TableCell(valuetype="float", value=value)
+            cell.addElement(P(text=f"{value:.2f}"))
+        case datetime.datetime():
+            cell = TableCell(valuetype="date", datevalue=value.isoformat())
+            cell.addElement(P(text=value.strftime("%d/%m/%y")))
+        case _:
+            cell = TableCell(valuetype="string")
+            cell.addElement(P(text=value))
+    return cell
+
+
+def odfpy_rows(path):
+    """Get (sheet name, rows) the way the sheet readers should, using odfpy."""
+    found = []
+    for table in load(str(path)).spreadsheet.getElementsByType(Table):
+        rows = []
+        for row in table.getElementsByType(TableRow):
+            cells = []
+            for cell in row.childNodes:
+                repeat = int(
+                    cell.attributes.get((TABLENS, "number-columns-repeated"), 1)
+                )
+                cells += [odfpy_value(cell)] * repeat
+            repeat = int(row.attributes.get((TABLENS, "number-rows-repeated"), 1))
+            rows += [cells] * repeat
+        found.append((table.getAttribute("name"), trim(rows)))
+    return found
+
+
+def odfpy_value(cell):
+    attrs = cell.attributes
+    match attrs.get((OFFICENS, "value-type")):
+        case "float":
+            return sheets.cell_text(attrs[(OFFICENS, "value")])
+        case "boolean":
+            return attrs[(OFFICENS, "boolean-value")]
+        case "date":
+            date = datetime.datetime.fromisoformat(attrs[(OFFICENS, "date-value")])
+            return sheets.cell_text(date)
+        case _:
+            text = "\n".join(teletype.extractText(p) for p in cell.getElementsByType(P))
+            return sheets.cell_text(text)
+
+
+class TestDateFormats(IngestTestCase):
+    def test_sheet_dates_are_in_the_column_format(self):
+        point_count = next(t for t in tables.TABLES if t.name == "point_count")
+        header = [c.csv[0] for c in point_count.columns]
+        row = [DATE if c.date_format else "1" for c in point_count.columns]
+
+        book = openpyxl.Workbook()
+        book.active.append(header)
+        book.active.append(row)
+        (self.dir / "csv").mkdir()
+        book.save(self.dir / "csv" / "counts.xlsx")
+        ingest_dir(self.dir / "db.sqlite", self.dir / "csv")
+
+        with closing(sqlite3.connect(self.dir / "db.sqlite")) as cxn:
+            dates = cxn.execute("SELECT date_ FROM point_count").fetchall()
+        self.assertEqual(dates, [("04/03/2020",)])
+        self.assertEqual(
+            dump(self.dir / "db.sqlite", [manifest.REJECTS]), {manifest.REJECTS: []}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import pandas as pd
+from pylib import staging
+
+from tests.helpers import dump
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+
+class TestStagingCache(IngestTestCase):
+    def test_cached_ingest_matches_parsed(self):
+        csv_dir = self.synthetic(files=3, rows=100, seed=7)
+        cache = str(self.dir / "cache")
+        parsed, cached = self.dir / "parsed.sqlite", self.dir / "cached.sqlite"
+
+        ingest_dir(parsed, csv_dir, "--no-cache")
+        ingest_dir(cached, csv_dir, "--cache-dir", cache)
+        self.assertTrue(list((self.dir / "cache").glob("*.arrow")))
+        ingest_dir(cached, csv_dir, "--cache-dir", cache, "--replace")
+
+        # The cached DB was ingested twice, so it is a version ahead
+        parsed, cached = dump(parsed), dump(cached)
+        del parsed["ingest_version"], cached["ingest_version"]
+        self.assertEqual(parsed, cached)
+
+    def test_unwritable_cache_dir_is_skipped(self):
+        csv_dir = self.synthetic(files=2, rows=20, seed=7)
+        (self.dir / "cache").write_text("Not a directory")
+        parsed, cached = self.dir / "parsed.sqlite", self.dir / "cached.sqlite"
+
+        ingest_dir(parsed, csv_dir, "--no-cache")
+        ingest_dir(cached, csv_dir, "--cache-dir", str(self.dir / "cache"))
+        self.assertEqual(dump(parsed), dump(cached))
+
+    def test_gets_only_the_columns_parsed_as_asked(self):
+        cache = staging.StagingCache(self.dir / "cache")
+        df = pd.DataFrame({"a": [1.5, 2.5], "b": ["x", "y"]}, index=[3, 4])
+        key = cache.key("sha256")
+        cache.put(key, df, {"a": "float64", "b": "string"})
+
+        got = cache.get(key, {"b": "string"})
+        pd.testing.assert_frame_equal(got, df[["b"]])
+        self.assertIsNone(cache.get(key, {"a": "string"}))
+        self.assertIsNone(cache.get(key, {"a": "float64", "c": "string"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
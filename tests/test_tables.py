@@ -0,0 +1,164 @@
+import sqlite3
+import unittest
+from contextlib import closing
+from itertools import product
+
+from pylib import alias_index
+from pylib import queries
+from pylib import tables
+from pylib.headers import normalize
+
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+
+def permutation_match(table, csv_columns):
+    """Match like the search Table.match replaced, trying every alias combination.
+
+    The combinations with the most columns are tried first, in product order, and
+    the first one the CSV has all the columns of wins.
+    """
+    columns = table.columns
+    options = [[normalize(a) if a else None for a in c.csv] for c in columns]
+    combos = sorted(
+        product(*options), key=lambda p: len([a for a in p if a]), reverse=True
+    )
+    for combo in combos:
+        if {a for a in combo if a} <= csv_columns:
+            mapping = {}
+            for column, alias in zip(columns, combo, strict=True):
+                if alias:
+                    mapping.setdefault(column.name, alias)
+            return mapping
+    return None
+
+
+def aliases(table):
+    """Get each column's normalized aliases, leaving out the optional marker."""
+    return [[normalize(a) for a in c.csv if a] for c in table.columns]
+
+
+def headers(table):
+    """Get full, partial, and ambiguous headers for a table."""
+    per_column = aliases(table)
+    every = [a for column in per_column for a in column]
+    yield "every alias", set(every)
+    yield "every alias and junk", {*every, "junk", "notes_2"}
+    yield "last aliases", {column[-1] for column in per_column if column}
+    yield "first aliases", {column[0] for column in per_column if column}
+    for step in (2, 3):
+        for skip in range(step):
+            yield f"every {step}th alias from {skip} left out", {
+                a for i, a in enumerate(every) if i % step != skip
+            }
+    for i, column in enumerate(per_column):
+        if column:
+            yield f"column {i} left out", set(every) - set(column)
+    yield "no aliases", set()
+
+
+class TestTableMatch(unittest.TestCase):
+    def test_match_agrees_with_permutation_search(self):
+        for table in tables.TABLES:
+            for name, csv_columns in headers(table):
+                with self.subTest(table=table.name, header=name):
+                    self.assertEqual(
+                        table.match(csv_columns), permutation_match(table, csv_columns)
+                    )
+
+    def test_alias_index_agrees_with_permutation_search(self):
+        index = alias_index.AliasIndex(tables.TABLES)
+        for table in tables.TABLES:
+            for name, csv_columns in headers(table):
+                with self.subTest(table=table.name, header=name):
+                    expect = permutation_match(table, csv_columns)
+                    hits = [m for t, m in index.match(csv_columns) if t is table]
+                    # The index leaves out tables that would take no columns
+                    self.assertEqual(hits[0] if hits else None, expect or None)
+
+    def test_shared_alias_fills_every_column(self):
+        nest = next(t for t in tables.TABLES if t.name == "nest")
+        csv_columns = {a for column in aliases(nest) for a in column}
+        mapping = nest.match(csv_columns)
+        self.assertEqual(mapping, permutation_match(nest, csv_columns))
+        for name in ("genus", "species", "genus_species"):
+            self.assertEqual(mapping[name], "species")
+
+
+class TestResolve(unittest.TestCase):
+    def test_fuzzy_match_does_not_take_a_named_alias(self):
+        index = alias_index.AliasIndex(tables.TABLES)
+        for header in (["taxonmy_id", "taxonomy_id"], ["taxonomy_id", "taxonmy_id"]):
+            with self.subTest(header=header):
+                columns = index.resolve(header)
+                self.assertEqual(columns["taxonomy_id"], "taxonomy_id")
+                self.assertEqual(columns["taxonmy_id"], "taxonmy_id")
+
+    def test_fuzzy_match_without_the_alias(self):
+        index = alias_index.AliasIndex(tables.TABLES)
+        self.assertEqual(index.resolve(["taxonmy_id"]), {"taxonomy_id": "taxonmy_id"})
+
+    def test_earlier_headers_do_not_change_the_match(self):
+        index = alias_index.AliasIndex(tables.TABLES)
+        headers = [
+            ["taxonmy_id"],
+            ["taxonmy_id", "taxonomy_id"],
+            ["taxonomy_id"],
+            ["taxonomy_id", "taxonmy_id"],
+        ]
+        for header in headers + headers[::-1]:
+            with self.subTest(header=header):
+                fresh = alias_index.AliasIndex(tables.TABLES)
+                self.assertEqual(index.resolve(header), fresh.resolve(header))
+
+
+class TestIndexes(unittest.TestCase):
+    def test_declared_indexes_replace_the_plan(self):
+        plans = tables.indexes()
+        self.assertEqual(plans["raw_data_info"], [["dataset_id"], ["spreadsheet_id"]])
+        self.assertEqual(plans["ectos"], [["band"]])
+        self.assertEqual(plans["date"][0], ["capture_id", "band", "year"])
+
+
+class TestQueryPlans(IngestTestCase):
+    def test_summaries_search_the_joined_tables_by_key(self):
+        header = [
+            *("id", "band", "ectos", "ecto_type", "looked_ectos", "ectos_technique"),
+            *("species", "site", "location", "day", "month", "year"),
+        ]
+        rows = [
+            (
+                f"c{i}",
+                i,
+                "y",
+                "mite",
+                "y",
+                "dust",
+                "wren",
+                f"s{i % 7}",
+                "rio",
+                1,
+                "jan",
+                2020,
+            )
+            for i in range(500)
+        ]
+        self.write_csv(self.dir / "csv" / "a.csv", header, rows)
+        ingest_dir(self.dir / "db.sqlite", self.dir / "csv")
+
+        sql = queries.SUMMARIES[0].sql.format(where="")
+        with closing(sqlite3.connect(self.dir / "db.sqlite")) as cxn:
+            plan = [r[3] for r in cxn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        for alias in ("t", "s", "d"):
+            with self.subTest(table=alias):
+                search = f"SEARCH {alias} USING "
+                steps = [p for p in plan if p.startswith(search)]
+                self.assertEqual(len(steps), 1, plan)
+                self.assertIn("(capture_id=? AND band=?)", steps[0])
+        self.assertFalse(
+            [p for p in plan if p.startswith(("SCAN t", "SCAN s", "SCAN d"))]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import pandas as pd
+from pylib import stats
+from pylib import tables
+from pylib import validate
+
+from tests.helpers import ingest_dir
+from tests.helpers import IngestTestCase
+
+
+class TestAllowed(unittest.TestCase):
+    def test_allowed_values_ignore_case_and_spaces(self):
+        table = tables.Table(
+            "t", [tables.Column(name="sex", type="text", csv=["sex"], allowed=["M"])]
+        )
+        df = pd.DataFrame({"sex": pd.array(["M", " m", "male", None], dtype="string")})
+        with self.assertLogs(level="WARNING"):
+            good, bad = validate.check(df, table)
+        self.assertEqual(good["sex"].tolist(), ["M", " m", pd.NA])
+        self.assertEqual(bad["value"].tolist(), ["male"])
+        self.assertEqual(bad["line"].tolist(), [2 + validate.FIRST_LINE])
+
+
+class TestCoerced(IngestTestCase):
+    def test_cells_set_to_missing_are_rejects(self):
+        header = ["id", "band", "day", "month", "year"]
+        rows = [("A", 1, "x", "jan", 2020), ("B", 2, 3, "jan", 2020)]
+        self.write_csv(self.dir / "csv" / "a.csv", header, rows)
+        db = self.dir / "db.sqlite"
+        ingest_dir(db, self.dir / "csv")
+
+        summary = stats.summary("sqlite", db, ["date"])
+        self.assertEqual(summary["tables"], {"date": 2})
+        self.assertEqual(summary["rejects"], {})
+        self.assertEqual(summary["missing"], {"date": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
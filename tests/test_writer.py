@@ -0,0 +1,66 @@
+import sqlite3
+import unittest
+from contextlib import closing
+from unittest import mock
+
+from pylib import writer
+
+from tests.helpers import IngestTestCase
+
+
+class Connection(sqlite3.Connection):
+    """Remember the PRAGMA values the connection had when it was closed."""
+
+    def close(self):
+        self.closed_with = pragmas(self)
+        super().close()
+
+
+def pragmas(cxn):
+    return {p: writer.pragma_value(cxn, p) for p in writer.INGEST_PRAGMAS}
+
+
+class TestSqlitePragmas(IngestTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db = self.dir / "db.sqlite"
+        with closing(sqlite3.connect(self.db)) as cxn:
+            self.defaults = pragmas(cxn)
+        self.cxns = []
+        connect = sqlite3.connect
+
+        def recording_connect(*args, **kwargs):
+            self.cxns.append(connect(*args, factory=Connection, **kwargs))
+            return self.cxns[-1]
+
+        patch = mock.patch.object(writer.sqlite3, "connect", recording_connect)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_pragmas_are_set_for_the_load_and_restored(self):
+        with writer.connect("sqlite", self.db) as db:
+            self.assertEqual(
+                pragmas(db.cxn),
+                {"journal_mode": "wal", "synchronous": 0, "cache_size": -262144},
+            )
+        self.assertEqual(self.cxns[0].closed_with, self.defaults)
+
+    def test_pragmas_are_restored_when_the_load_fails(self):
+        with (
+            self.assertRaises(sqlite3.OperationalError),
+            writer.connect("sqlite", self.db) as db,
+        ):
+            db.cxn.execute("SELECT * FROM no_such_table")
+        self.assertEqual(self.cxns[0].closed_with, self.defaults)
+
+    def test_pragmas_are_restored_when_opening_fails(self):
+        fail = mock.patch.object(
+            writer.Writer, "create_tables", side_effect=sqlite3.DatabaseError
+        )
+        with fail, self.assertRaises(sqlite3.DatabaseError):
+            writer.connect("sqlite", self.db).__enter__()
+        self.assertEqual(self.cxns[0].closed_with, self.defaults)
+
+
+if __name__ == "__main__":
+    unittest.main()